@@ -0,0 +1,446 @@
+"""
+Benchmark suite for the planning pipeline.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks                       # run and compare against benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --output results.json # also write the results
+    python -m benchmarks.run_benchmarks --update-baseline     # store these results as the new baseline
+
+Exits with status 1 when any benchmark is slower than its baseline by more than --threshold.
+"""
+import argparse
+import gc
+import json
+import os
+import pickle
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.workloads import WorkloadGenerator
+from src.factories import ExperimentFactory, InventoryFactory, LabPacketFactory
+from src.factories.autoprotocol_factory import AutoprotocolFactory
+from autoprotocol.protocol import Protocol
+from src.models import Experiment
+from src.utils import Parser, Saver, ConstructionFileParser
+from src.utils.Serializer import Serializer
+from src.utils.serialization import serialize, serialize_reflective, deserialize, deserialize_reflective
+from src.utils.dirty_tracking import mark_dirty
+from src.utils.archive import ExperimentArchive
+from src.utils.lab_sheets import render_lab_sheet, read_lab_packet
+from src.utils.lazy import LazyExperiment
+from src.utils.metadata import read_metadata
+from src.utils.protocol_optimizer import optimize_instructions
+from src.utils.simulator import score_protocol
+from src.utils.protocol_export import export_protocol
+from src.utils.reagent_ledger import ReagentLedger
+from src.utils.plate_layout import layout_packet
+from src.utils.picklist import export_picklists
+from src.utils.container_refs import ContainerRefManager
+from src.utils.locations import inventory_to_dict, inventory_from_dict
+from src.utils.binary_format import encode_binary, decode_binary
+from src.utils.write_out import write_inventory_to_json, write_experiment_to_json, write_metadata
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# name -> function(workload) returning the zero-argument callable to time
+BENCHMARKS = {}
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated function receives the Workload and returns the callable to time.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class Workload:
+    """
+    The shared inputs for one benchmark run: construction files, an old inventory, and the planned
+    experiment, plus a scratch directory for anything written to disk.
+    """
+
+    def __init__(self, numCfs, oldCfs, seed):
+        generator = WorkloadGenerator(seed)
+        self.factory = ExperimentFactory()
+        self.oldInventory = generator.inventory(oldCfs)
+        self.cfs = generator.construction_files(numCfs)
+        self.experiment = self.factory.run("bench", "B", self.cfs, self.factory.copyInventory(self.oldInventory))
+        self.tmpdir = tempfile.mkdtemp(prefix="labplanner-bench-")
+
+    def path(self, *parts):
+        path = os.path.join(self.tmpdir, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def close(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+@benchmark("inventory_factory.run")
+def bench_inventory_factory(workload):
+    factory = InventoryFactory()
+    return lambda: factory.run("bench", "B", workload.cfs, workload.factory.copyInventory(workload.oldInventory))
+
+@benchmark("lab_packet_factory.run")
+def bench_lab_packet_factory(workload):
+    factory = LabPacketFactory()
+    return lambda: factory.run("bench", workload.cfs, workload.experiment.inventory)
+
+@benchmark("serialization.serialize_inventory")
+def bench_serialize_inventory(workload):
+    return lambda: serialize(workload.experiment.inventory)
+
+@benchmark("serialization.serialize_experiment")
+def bench_serialize_experiment(workload):
+    return lambda: serialize(workload.experiment)
+
+@benchmark("serialization.serialize_experiment_reflective")
+def bench_serialize_experiment_reflective(workload):
+    return lambda: serialize_reflective(workload.experiment)
+
+@benchmark("serialization.deserialize_experiment")
+def bench_deserialize_experiment(workload):
+    data = json.loads(json.dumps(serialize(workload.experiment)))
+    return lambda: deserialize(data, Experiment)
+
+@benchmark("serialization.deserialize_experiment_reflective")
+def bench_deserialize_experiment_reflective(workload):
+    data = json.loads(json.dumps(serialize(workload.experiment)))
+    return lambda: deserialize_reflective(data, Experiment)
+
+@benchmark("locations.inventory_to_dict")
+def bench_inventory_to_dict(workload):
+    return lambda: inventory_to_dict(workload.experiment.inventory)
+
+@benchmark("locations.inventory_from_dict")
+def bench_inventory_from_dict(workload):
+    data = json.loads(json.dumps(inventory_to_dict(workload.experiment.inventory)))
+    return lambda: inventory_from_dict(data)
+
+@benchmark("binary.encode_experiment")
+def bench_encode_binary(workload):
+    return lambda: encode_binary(workload.experiment)
+
+@benchmark("binary.decode_experiment")
+def bench_decode_binary(workload):
+    data = encode_binary(workload.experiment)
+    return lambda: decode_binary(data, Experiment)
+
+@benchmark("pickle.dumps_experiment")
+def bench_pickle_dumps(workload):
+    return lambda: pickle.dumps(workload.experiment)
+
+@benchmark("pickle.loads_experiment")
+def bench_pickle_loads(workload):
+    data = pickle.dumps(workload.experiment)
+    return lambda: pickle.loads(data)
+
+@benchmark("json.dumps_experiment")
+def bench_json_dumps(workload):
+    return lambda: json.dumps(serialize(workload.experiment))
+
+@benchmark("json.loads_experiment")
+def bench_json_loads(workload):
+    text = json.dumps(serialize(workload.experiment))
+    return lambda: deserialize(json.loads(text), Experiment)
+
+@benchmark("write_out.write_inventory_to_json")
+def bench_write_inventory_json(workload):
+    outdir = workload.path("write_out", "Inventory", "x")
+    return lambda: write_inventory_to_json(workload.experiment.inventory, os.path.dirname(outdir))
+
+@benchmark("write_out.write_experiment_to_json")
+def bench_write_experiment_json(workload):
+    path = workload.path("write_out", "Experiment.json")
+    return lambda: write_experiment_to_json(workload.experiment, path)
+
+@benchmark("write_out.write_experiment_to_json_compact")
+def bench_write_experiment_json_compact(workload):
+    path = workload.path("write_out", "Experiment-compact.json")
+    return lambda: write_experiment_to_json(workload.experiment, path, compact=True)
+
+@benchmark("saver.save_experiment")
+def bench_save_experiment(workload):
+    outdir = os.path.dirname(workload.path("saver", "x"))
+    saver = Saver()
+    return lambda: saver.save_experiment(workload.experiment, outdir)
+
+@benchmark("saver.save_experiment_archive")
+def bench_save_experiment_archive(workload):
+    path = workload.path("archive", "Experiment.zip")
+    saver = Saver()
+    return lambda: saver.save_experiment_archive(workload.experiment, path)
+
+@benchmark("archive.read_one_box")
+def bench_archive_read_box(workload):
+    path = workload.path("archive-read", "Experiment.zip")
+    Saver().save_experiment_archive(workload.experiment, path)
+    last = len(workload.experiment.inventory.boxes) - 1
+
+    def read_one_box():
+        with ExperimentArchive(path) as archive:
+            return archive.box(last)
+    return read_one_box
+
+@benchmark("lazy.one_sheet_and_box")
+def bench_lazy_lookup(workload):
+    outdir = os.path.dirname(workload.path("lazy", "x"))
+    Saver().save_experiment(workload.experiment, outdir)
+    indir = os.path.join(outdir, workload.experiment.name)
+    last = len(workload.experiment.inventory.boxes) - 1
+
+    def one_sheet_and_box():
+        experiment = LazyExperiment(indir)
+        return experiment.labPacket.labsheets[0], experiment.inventory.boxes[last]
+    return one_sheet_and_box
+
+@benchmark("saver.save_inventory_incremental")
+def bench_save_inventory_incremental(workload):
+    outdir = os.path.dirname(workload.path("saver-incremental", "x"))
+    inventory = workload.factory.copyInventory(workload.experiment.inventory)
+    saver = Saver()
+    saver.save_inventory(inventory, outdir)
+
+    def save_one_changed_box():
+        mark_dirty(inventory, [len(inventory.boxes) - 1])
+        saver.save_inventory(inventory, outdir)
+    return save_one_changed_box
+
+@benchmark("Serializer.serializeLabPacket")
+def bench_serialize_lab_packet(workload):
+    outdir = os.path.dirname(workload.path("labpacket", "x"))
+    serializer = Serializer()
+    return lambda: serializer.serializeLabPacket(workload.experiment.labPacket, outdir)
+
+@benchmark("Parser.parse_box_row_form")
+def bench_parse_boxes(workload):
+    serializer = Serializer()
+    paths = []
+    for i, box in enumerate(workload.experiment.inventory.boxes):
+        path = workload.path("boxes", f"{i}-Box.txt")
+        serializer.serializeBoxRowForm(box, path)
+        paths.append(path)
+    parser = Parser()
+    return lambda: [parser.parse_box_row_form(path) for path in paths]
+
+def lab_sheet_directory(workload, name, count):
+    """
+    Writes `count` labsheet files, cycling through the workload's lab packet.
+    """
+    sheets = workload.experiment.labPacket.labsheets
+    outdir = os.path.dirname(workload.path(name, "x"))
+    for i in range(count):
+        with open(os.path.join(outdir, f"{i}_sheet.txt"), "w") as f:
+            f.write(render_lab_sheet(sheets[i % len(sheets)]))
+    return outdir
+
+@benchmark("metadata.read_metadata_20k")
+def bench_read_metadata(workload):
+    experiment = workload.experiment
+    polys = list(experiment.nameToPoly.values())
+    nameToPoly = {f"seq{i}": polys[i % len(polys)] for i in range(20000)}
+    large = Experiment(experiment.name, [], None, nameToPoly, experiment.labPacket, experiment.inventory)
+    path = workload.path("metadata", "metadata.txt")
+    write_metadata(large, path)
+    return lambda: read_metadata(path)
+
+@benchmark("lab_sheets.read_lab_packet")
+def bench_read_lab_packet(workload):
+    outdir = lab_sheet_directory(workload, "labsheets", 300)
+    return lambda: read_lab_packet(outdir)
+
+@benchmark("ConstructionFileParser.parse_file")
+def bench_parse_construction_files(workload):
+    parser = ConstructionFileParser()
+    path = workload.path("cfs", "workload.txt")
+    with open(path, "w") as f:
+        for cf in workload.cfs:
+            f.write(parser.format_construction_file(cf))
+            f.write("\n")
+    return lambda: parser.parse_file(path)
+
+@benchmark("autoprotocol_factory.run")
+def bench_autoprotocol_factory(workload):
+    experiment = workload.experiment
+    return lambda: AutoprotocolFactory().run(experiment.labPacket, experiment.inventory)
+
+@benchmark("container_refs.resolve")
+def bench_resolve_refs(workload):
+    refs = ContainerRefManager(inventory=workload.experiment.inventory)
+    return lambda: refs.bind(Protocol()).resolve(workload.experiment.labPacket)
+
+@benchmark("protocol_optimizer.optimize_instructions")
+def bench_optimize_protocol(workload):
+    experiment = workload.experiment
+    instructions = AutoprotocolFactory().run(experiment.labPacket, experiment.inventory).instructions
+    return lambda: optimize_instructions(instructions)
+
+
+@benchmark("simulator.score_protocol")
+def bench_score_protocol(workload):
+    experiment = workload.experiment
+    instructions = AutoprotocolFactory().run(experiment.labPacket, experiment.inventory).instructions
+    return lambda: score_protocol(instructions)
+
+
+@benchmark("protocol_export.export_protocol")
+def bench_export_protocol(workload):
+    experiment = workload.experiment
+    protocol = AutoprotocolFactory().run(experiment.labPacket, experiment.inventory)
+    path = workload.path("protocol_export", "protocol.json")
+    return lambda: export_protocol(protocol, path)
+
+
+@benchmark("reagent_ledger.add_and_total")
+def bench_reagent_ledger(workload):
+    experiment = workload.experiment
+
+    def run():
+        ledger = ReagentLedger()
+        ledger.add_experiment(experiment)
+        return ledger.totals()
+    return run
+
+
+@benchmark("plate_layout.layout_packet")
+def bench_layout_packet(workload):
+    return lambda: layout_packet(workload.experiment.labPacket)
+
+
+@benchmark("picklist.export_picklists")
+def bench_export_picklists(workload):
+    experiment = workload.experiment
+    layout = layout_packet(experiment.labPacket)
+    path = workload.path("picklists")
+    return lambda: export_picklists(experiment.labPacket, path, experiment.inventory, layout)
+
+
+def time_callable(func, repeats):
+    """
+    Runs func once to warm up, then `repeats` times with the garbage collector paused (as timeit does),
+    and returns the best and mean wall time in seconds.
+    """
+    func()
+    times = []
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    finally:
+        if gcEnabled:
+            gc.enable()
+    return {"best_s": min(times), "mean_s": sum(times) / len(times), "repeats": repeats}
+
+def run_benchmarks(numCfs=200, oldCfs=100, seed=0, repeats=5, names=None):
+    """
+    Runs the registered benchmarks on a freshly generated workload.
+
+    Parameters:
+        numCfs: the number of construction files to plan
+        oldCfs: the number of construction files used to fill the old inventory
+        seed: the workload generator seed
+        repeats: how many times each benchmark is run; the best time is compared against the baseline
+        names: the benchmarks to run, or None for all of them
+
+    Returns:
+        A JSON-compatible dict with the workload parameters and a result per benchmark.
+    """
+    workload = Workload(numCfs, oldCfs, seed)
+    try:
+        results = {}
+        for name, setup in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            results[name] = time_callable(setup(workload), repeats)
+    finally:
+        workload.close()
+    return {
+        "meta": {
+            "num_cfs": numCfs,
+            "old_cfs": oldCfs,
+            "seed": seed,
+            "repeats": repeats,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "benchmarks": results,
+    }
+
+def compare(results, baseline, threshold):
+    """
+    Compares results against a baseline.
+
+    Parameters:
+        results: the output of run_benchmarks
+        baseline: a previous output of run_benchmarks
+        threshold: the largest allowed ratio of current to baseline best time
+
+    Returns:
+        A list of (name, baseline_s, current_s, ratio, regressed) tuples for benchmarks in both.
+    """
+    rows = []
+    for name, current in results["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if not base:
+            continue
+        ratio = current["best_s"] / base["best_s"] if base["best_s"] else float("inf")
+        rows.append((name, base["best_s"], current["best_s"], ratio, ratio > threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cfs", type=int, default=200, help="construction files to plan")
+    parser.add_argument("--old-cfs", type=int, default=100, help="construction files in the old inventory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", action="append", help="run only this benchmark (repeatable)")
+    parser.add_argument("--output", help="write results JSON to this path")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="fail when best time exceeds baseline by this factor")
+    parser.add_argument("--update-baseline", action="store_true", help="write results to the baseline path")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.cfs, args.old_cfs, args.seed, args.repeats, args.only)
+
+    for name, result in results["benchmarks"].items():
+        print(f"{name:45s} best {result['best_s'] * 1000:10.2f} ms   mean {result['mean_s'] * 1000:10.2f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("meta", {}).get("num_cfs") != args.cfs or baseline.get("meta", {}).get("old_cfs") != args.old_cfs:
+        print("Warning: baseline was recorded with a different workload size.")
+
+    regressed = False
+    print()
+    for name, base, current, ratio, bad in compare(results, baseline, args.threshold):
+        flag = "REGRESSION" if bad else "ok"
+        print(f"{name:45s} {base * 1000:10.2f} -> {current * 1000:10.2f} ms  x{ratio:5.2f}  {flag}")
+        regressed = regressed or bad
+    return 1 if regressed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
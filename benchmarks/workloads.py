@@ -0,0 +1,127 @@
+import random
+from src.models import *
+from src.factories.inventory_factory import InventoryFactory
+
+# Enzyme pairs used for digest/ligate cloning and the Type IIS enzymes for Golden Gate
+DIGEST_ENZYMES = [
+    [Reagent.EcoRI, Reagent.SpeI],
+    [Reagent.EcoRI, Reagent.BamHI],
+    [Reagent.XbaI, Reagent.PstI],
+    [Reagent.BglII, Reagent.XhoI],
+]
+GG_ENZYMES = [Reagent.BsaI, Reagent.BsmBI]
+ANTIBIOTICS = ['Amp', 'Kan', 'Spec', 'Cm']
+STRAINS = ['Mach1', 'DH10B', 'JM109']
+
+# The kinds of construction files the generator builds, with their relative weights
+CF_KINDS = {
+    'pcr': 1,
+    'restriction': 3,   # PCR -> Digest x2 -> Ligate -> Transform
+    'golden_gate': 2,
+    'gibson': 2,
+}
+
+
+def random_sequence(rng, length):
+    """
+    Returns a random lowercase DNA sequence of the given length.
+    """
+    return ''.join(rng.choices('acgt', k=length))
+
+
+class WorkloadGenerator:
+    """
+    Builds seeded synthetic ConstructionFiles and inventories for benchmarking.
+
+    Oligos and templates are drawn from shared pools, so larger workloads reuse samples the way
+    a real lab does, and every construct name is unique so the factories never collide.
+    """
+
+    def __init__(self, seed: int = 0, oligoPool: int = 200, plasmidPool: int = 40,
+                 oligoLength=(20, 60), plasmidLength=(2000, 8000)):
+        self.rng = random.Random(seed)
+        self.oligoLength = oligoLength
+        self.plasmidLength = plasmidLength
+        self.oligos = [f'oligo{i:04d}' for i in range(oligoPool)]
+        self.plasmids = [f'pSB{i:03d}' for i in range(plasmidPool)]
+        self.sequenceCache = {}
+
+    def sequence(self, name, isPlasmid):
+        """
+        Returns the Polynucleotide for a pool member, generating it the first time it is needed.
+        """
+        if name not in self.sequenceCache:
+            low, high = self.plasmidLength if isPlasmid else self.oligoLength
+            self.sequenceCache[name] = Polynucleotide(
+                random_sequence(self.rng, self.rng.randint(low, high)),
+                is_double_stranded=isPlasmid, is_circular=isPlasmid)
+        return self.sequenceCache[name]
+
+    def pcr(self, prefix, output):
+        fwd, rev = self.rng.sample(self.oligos, 2)
+        template = self.rng.choice(self.plasmids)
+        step = PCR('PCR', output, fwd, rev, template, self.rng.randint(300, 3000))
+        return step, [fwd, rev], [template]
+
+    def construction_file(self, index):
+        """
+        Returns one ConstructionFile of a randomly chosen kind.
+        """
+        kind = self.rng.choices(list(CF_KINDS), weights=list(CF_KINDS.values()))[0]
+        prefix = f'cf{index}'
+        steps = []
+        oligos = []
+        plasmids = []
+
+        if kind == 'pcr':
+            step, o, p = self.pcr(prefix, prefix + '-pcr')
+            steps.append(step)
+            oligos += o
+            plasmids += p
+
+        elif kind == 'restriction':
+            step, o, p = self.pcr(prefix, prefix + '-pcr')
+            steps.append(step)
+            oligos += o
+            plasmids += p
+            enzymes = self.rng.choice(DIGEST_ENZYMES)
+            vector = self.rng.choice(self.plasmids)
+            plasmids.append(vector)
+            steps.append(Digest('Digest', prefix + '-pcrdig', step.output, enzymes, 'A', step.product_size))
+            steps.append(Digest('Digest', prefix + '-vectdig', vector, enzymes, 'A', 3000))
+            steps.append(Ligate('Ligate', prefix + '-lig', [prefix + '-pcrdig', prefix + '-vectdig']))
+            steps.append(Transform('Transform', prefix + '-product', prefix + '-lig',
+                                   self.rng.choice(STRAINS), [self.rng.choice(ANTIBIOTICS)], 37))
+
+        else:
+            fragments = []
+            for j in range(self.rng.randint(2, 4)):
+                step, o, p = self.pcr(prefix, f'{prefix}-frag{j}')
+                steps.append(step)
+                oligos += o
+                plasmids += p
+                fragments.append(step.output)
+            if kind == 'golden_gate':
+                steps.append(GoldenGate('Golden Gate', prefix + '-gg', fragments, self.rng.choice(GG_ENZYMES)))
+            else:
+                steps.append(Gibson('Gibson', prefix + '-gib', fragments))
+
+        sequences = {name: self.sequence(name, False) for name in oligos}
+        sequences.update({name: self.sequence(name, True) for name in plasmids})
+        return ConstructionFile(steps, sequences)
+
+    def construction_files(self, count, start=0):
+        """
+        Returns `count` ConstructionFiles, numbered from `start`.
+        """
+        return [self.construction_file(i) for i in range(start, start + count)]
+
+    def inventory(self, numCfs):
+        """
+        Returns an Inventory holding every sample needed for `numCfs` earlier construction files,
+        to stand in for an existing freezer.
+        """
+        if numCfs == 0:
+            return None
+        cfs = self.construction_files(numCfs, start=1_000_000)
+        return InventoryFactory().run('old', 'O', cfs, None)
@@ -1,9 +1,10 @@
-from .experiment_factory import ExperimentFactory
+from .experiment_factory import ExperimentFactory, BatchResult
 from .inventory_factory import InventoryFactory
 from .lab_packet_factory import LabPacketFactory
 
 __all__ = [
     "ExperimentFactory",
+    "BatchResult",
     "InventoryFactory",
     "LabPacketFactory",
 ]
@@ -1,30 +1,142 @@
 import os
 import json
+from collections import defaultdict
 from src.models import *
 from src.utils.serialization import *
 from autoprotocol.protocol import Protocol
+from autoprotocol.liquid_handle import Transfer
+from src.utils.protocol_optimizer import optimize_protocol
+from src.utils.container_refs import ContainerRefManager
+from src.utils.protocol_export import export_protocol, export_protocols
+from src.utils.mastermix import expand_recipe
+from src.utils.plate_layout import DEFAULT_PLATE_TYPES, lab_sheet_reactions, layout_packet, reaction_volumes
+
+# Recipe reagents that stand for a reaction's own samples; every other reagent is a shared stock
+SAMPLE_REAGENTS = ABSTRACT_REAGENTS
+
+def _step(temperature, duration):
+    return {"temperature": f"{temperature}:celsius", "duration": duration}
+
+# The thermocycler programs named on LabSheets, as Autoprotocol thermocycle groups
+PROGRAMS = {
+    'PG3K55': [
+        {"cycles": 1, "steps": [_step(98, "2:minute")]},
+        {"cycles": 30, "steps": [_step(98, "10:second"), _step(55, "15:second"), _step(68, "1:minute")]},
+        {"cycles": 1, "steps": [_step(68, "5:minute")]},
+    ],
+    'main/dig': [
+        {"cycles": 1, "steps": [_step(37, "1:hour"), _step(80, "20:minute")]},
+    ],
+    'main/LIGATE': [
+        {"cycles": 1, "steps": [_step(16, "1:hour"), _step(65, "10:minute")]},
+    ],
+    'main/GG1': [
+        {"cycles": 30, "steps": [_step(37, "2:minute"), _step(16, "5:minute")]},
+        {"cycles": 1, "steps": [_step(60, "5:minute")]},
+    ],
+}
+
+# Samples are added without pipette mixing, so transfers from one source can share a tip (see
+# optimize()); each reaction plate is sealed and shaken once instead
+SAMPLE_TRANSFER = Transfer(mix_after=False)
+
+# Moving a whole reaction leaves nothing to prime the tip with
+PRODUCT_TRANSFER = Transfer(prime=False)
+
+REACTION_PLATE = "96-pcr"
+
+# Incubators for the recovery temperatures on Transform steps
+INCUBATORS = {30: "warm_30", 35: "warm_35", 37: "warm_37"}
+
+# Volumes in microliters
+CELLS_VOLUME = 50
+TRANSFORM_DNA_VOLUME = 2
+RECOVERY_VOLUME = 100
+MINIPREP_ELUTION_VOLUME = 50
+
+def _ul(volume):
+    return f"{volume}:microliter"
 
 class AutoprotocolFactory:
     """
     A factory to generate Autoprotocol instructions from a deserialized LabPacket.
+
+    Reactions go where a PlateLayout puts them (see utils/plate_layout.py): consecutive sheets with
+    the same thermocycler program share plates, each thermocycled once, and each sheet fills whole
+    plate columns. Every shared stock in a sheet's recipe is provisioned into all of the sheet's
+    wells with a single instruction, so only the transfers of each reaction's own samples (primers,
+    templates, fragments) grow with the number of reactions. Samples are drawn from, and products
+    stored in, the tube refs of a ContainerRefManager, one per inventory Location. A recipe's
+    mastermix is dispensed as the stocks it is made of, since each is already a single instruction
+    for the whole plate.
     """
 
-    def __init__(self):
+    def __init__(self, resourceIds: dict = None, refs: ContainerRefManager = None, plateTypes=DEFAULT_PLATE_TYPES):
+        '''
+        Parameters:
+            resourceIds: the site's resource ids for stocks, keyed by Reagent or strain name; stocks
+                not listed are provisioned under their Reagent name (or the strain name)
+            refs: the ContainerRefManager to take refs from, e.g. one shared by every protocol of a
+                batch; a new one by default
+            plateTypes: the reaction plate types the layout may choose from, e.g. ("384-pcr", "96-pcr")
+        '''
         self.protocol = Protocol()
+        self.resourceIds = dict(resourceIds or {})
+        self.refs = (refs or ContainerRefManager()).bind(self.protocol)
+        self.plateTypes = plateTypes
+        self.products = {}      # construct -> (Well, volume) for everything made in this protocol
+        self.layout = None      # the PlateLayout of the packet being run
+        self.layoutPlates = {}  # layout plate index -> Container
+        self.sheetIndex = None  # index in the packet of the sheet being processed
+        self.pending = []       # (Reaction, Well, volume) set up but not yet thermocycled
 
-    def run(self, lab_packet, inventory):
+    def run(self, lab_packet, inventory, layout=None):
         """
         Generate Autoprotocol instructions from a deserialized LabPacket and Inventory.
 
         Parameters:
             lab_packet: A deserialized LabPacket object containing LabSheets.
-            inventory: A deserialized Inventory object.
+            inventory: A deserialized Inventory object, whose samples label the tube wells.
+            layout: the PlateLayout to set reactions up on; layout_packet(lab_packet, plateTypes)
+                by default
+
+        Returns:
+            Protocol: the generated protocol.
+        """
+        for _ in self._process_sheets(lab_packet, inventory, layout):
+            pass
+        return self.protocol
+
+    def stream_instructions(self, lab_packet, inventory):
+        """
+        Generates the protocol sheet by sheet like run, yielding each sheet's instructions and then
+        removing them from self.protocol, so a large protocol is never held whole. The refs stay in
+        self.protocol for writing after the last instruction (see utils/protocol_export.py).
+
+        Parameters:
+            lab_packet: A deserialized LabPacket object containing LabSheets.
+            inventory: A deserialized Inventory object, whose samples label the tube wells.
         """
+        for _ in self._process_sheets(lab_packet, inventory):
+            instructions = self.protocol.instructions[:]
+            del self.protocol.instructions[:]
+            yield from instructions
+
+    def _process_sheets(self, lab_packet, inventory, layout=None):
         if not lab_packet or not lab_packet.labsheets:
             raise ValueError("LabPacket is missing or contains no LabSheets.")
 
-        for sheet in lab_packet.labsheets:
+        self.refs.bind(self.protocol)
+        if inventory is not None:
+            self.refs.add_inventory(inventory)
+        self.refs.resolve(lab_packet)
+        self.layout = layout or layout_packet(lab_packet, self.plateTypes)
+        self.layoutPlates = {}
+        for index, sheet in enumerate(lab_packet.labsheets):
+            self.sheetIndex = index
             self._process_lab_sheet(sheet, inventory)
+            yield sheet
+        self.sheetIndex = None
 
     def _process_lab_sheet(self, lab_sheet, inventory):
         """
@@ -34,50 +146,256 @@ class AutoprotocolFactory:
             lab_sheet: A deserialized LabSheet object.
             inventory: A deserialized Inventory object.
         """
-        if lab_sheet.sheetType == PCR:
-            self._process_pcr(lab_sheet, inventory)
-        elif lab_sheet.sheetType == Digest:
-            self._process_digest(lab_sheet, inventory)
-        # Add more types as needed
-        else:
-            print(f"Warning: Unsupported LabSheet type: {lab_sheet.sheetType}")
+        process = SHEET_PROCESSORS.get(lab_sheet.sheetType)
+        if process is None:
+            print(f"Warning: Unsupported LabSheet type: {lab_sheet.sheetType.__name__}")
+            return
+        getattr(self, process)(lab_sheet, inventory)
+
+    def resource_id(self, stock):
+        """
+        Returns the resource id to provision a stock (a Reagent, or a strain name for competent cells).
+        """
+        if stock in self.resourceIds:
+            return self.resourceIds[stock]
+        return stock.name if isinstance(stock, Reagent) else stock
+
+    def tube(self, location):
+        """
+        Returns the Well of the tube at an inventory Location.
+        """
+        return self.refs.tube(location)
+
+    def reaction_wells(self, name, count):
+        """
+        Returns count wells on new reaction plates, filling each plate before starting the next.
+        """
+        wells = []
+        while len(wells) < count:
+            plate = self.refs.plate(name, REACTION_PLATE)
+            take = min(plate.container_type.well_count, count - len(wells))
+            wells.extend(plate.wells_from(0, take).wells)
+        return wells
+
+    def _process_reactions(self, lab_sheet, inventory):
+        """
+        Generate Autoprotocol instructions for a reaction LabSheet (PCR, Digest, Ligate, Golden Gate or
+        Gibson), skipping products already made.
+        """
+        reactions = [reaction for reaction in lab_sheet_reactions(lab_sheet) if reaction.product not in self.products]
+        self._run_reactions(lab_sheet, reactions)
 
-    def _process_pcr(self, lab_sheet, inventory):
+    def _process_zymo(self, lab_sheet, inventory):
         """
-        Generate Autoprotocol instructions for a PCR LabSheet.
+        Generate Autoprotocol instructions for a Zymo cleanup LabSheet: each product made in this
+        protocol moves from its reaction well to its cleanup tube, and the elution water is then
+        provisioned once per distinct elution volume.
         """
-        for reagent in lab_sheet.reaction.reaction:
-            self.protocol.transfer(
-                source=reagent[0].value,  # Adjust to match LabSheet structure
-                dest="destination_well",  # Replace with dynamic destination logic
-                volume=f"{reagent[1]}:microliter"
-            )
-        self.protocol.thermocycle(
-            groups=[
-                {"cycles": 30, "steps": [
-                    {"temperature": "95:celsius", "duration": "30:second"},
-                    {"temperature": "55:celsius", "duration": "30:second"},
-                    {"temperature": "72:celsius", "duration": "1:minute"}
-                ]}
-            ],
-            volume="50:microliter"
-        )
+        elution = {step.output: step.volume for step in lab_sheet.steps}
+        tubesByVolume = defaultdict(list)
+        for location, product in lab_sheet.destinations:
+            tube = self.tube(location)
+            made = self.products.get(product)
+            if made is not None and made[0] is not tube:
+                self.protocol.transfer(made[0], tube, _ul(made[1]), method=PRODUCT_TRANSFER)
+            tubesByVolume[elution[product]].append(tube)
+            self.products[product] = (tube, elution[product])
+        for volume, tubes in tubesByVolume.items():
+            self.protocol.provision(self.resource_id(Reagent.ddH2O), tubes, _ul(volume))
 
-    def _process_digest(self, lab_sheet, inventory):
+    def _process_transform(self, lab_sheet, inventory):
         """
-        Generate Autoprotocol instructions for a Digest LabSheet.
+        Generate Autoprotocol instructions for a Transform LabSheet: one plate per recovery
+        temperature, competent cells and recovery broth provisioned once per strain and plate set.
         """
-        # Example: Add Digest-specific instructions
-        pass
+        byTemperature = defaultdict(list)
+        for step, (source, dna) in zip(lab_sheet.steps, lab_sheet.sources):
+            byTemperature[step.temperature or 37].append((step, source))
 
-    def export_protocol(self, output_path):
+        wellsByStrain = defaultdict(list)
+        batches = []
+        for temperature, entries in byTemperature.items():
+            wells = self.reaction_wells("transform", len(entries))
+            for (step, source), well in zip(entries, wells):
+                wellsByStrain[step.strain].append(well)
+            batches.append((temperature, entries, wells))
+
+        for strain, wells in wellsByStrain.items():
+            self.protocol.provision(self.resource_id(strain), wells, _ul(CELLS_VOLUME))
+        volume = CELLS_VOLUME + TRANSFORM_DNA_VOLUME + RECOVERY_VOLUME
+        for temperature, entries, wells in batches:
+            for (step, source), well in zip(entries, wells):
+                self.protocol.transfer(self.tube(source), well, _ul(TRANSFORM_DNA_VOLUME), method=SAMPLE_TRANSFER)
+                self.products[step.output] = (well, volume)
+        allWells = [well for temperature, entries, wells in batches for well in wells]
+        plates = _containers(allWells)
+        for plate in plates:
+            self.protocol.incubate(plate, "cold_4", "30:minute")
+        self.protocol.provision(self.resource_id(Reagent.lb), allWells, _ul(RECOVERY_VOLUME))
+        for temperature, entries, wells in batches:
+            for plate in _containers(wells):
+                self.protocol.incubate(plate, INCUBATORS.get(temperature, "warm_37"), "1:hour", shaking=True)
+
+    def _process_miniprep(self, lab_sheet, inventory):
+        """
+        Generate Autoprotocol instructions for a Miniprep LabSheet. Culturing and lysis happen off the
+        deck, so this provisions the elution water into every miniprep tube at once.
+        """
+        tubes = [self.tube(location) for location, product, clone in lab_sheet.destinations]
+        if tubes:
+            self.protocol.provision(self.resource_id(Reagent.ddH2O), tubes, _ul(MINIPREP_ELUTION_VOLUME))
+
+    def _run_reactions(self, lab_sheet, reactions):
+        """
+        Sets up the reactions of a sheet in their layout wells. Once the last sheet of a layout run is
+        set up, the run's plates are thermocycled and products that have a destination tube are
+        moved into it. A sheet the layout does not cover gets reaction plates of its own and is
+        thermocycled at once.
+        """
+        run = None
+        if reactions:
+            placed = self._layout_wells(lab_sheet, reactions)
+            if placed is None:
+                wells = self.reaction_wells(lab_sheet.sheetType.__name__.lower(), len(reactions))
+            else:
+                reactions, wells = placed
+                run = self.layout.run_of(self.sheetIndex)
+            recipe = expand_recipe(lab_sheet.reaction)
+            sampleVolume = {reagent: volume for reagent, volume in recipe if reagent in SAMPLE_REAGENTS}
+            for reagent, volume in recipe:
+                if reagent not in SAMPLE_REAGENTS:
+                    self.protocol.provision(self.resource_id(reagent), wells, _ul(volume))
+            for reaction, well in zip(reactions, wells):
+                for reagent, location in reaction.samples:
+                    self.protocol.transfer(self.tube(location), well, _ul(sampleVolume[reagent]), method=SAMPLE_TRANSFER)
+            self.pending.extend(zip(reactions, wells, reaction_volumes(lab_sheet.reaction, reactions)))
+        elif self.layout is not None:
+            run = self.layout.run_of(self.sheetIndex)
+        if run is None or run[-1] == self.sheetIndex:
+            self._finish_run(lab_sheet)
+
+    def _layout_wells(self, lab_sheet, reactions):
+        """
+        Returns a sheet's reactions and their layout wells, in plate and well order so each plate's
+        wells share one provision per stock, creating the plates as needed; or None if the layout
+        does not place them.
+        """
+        if self.layout is None or self.sheetIndex is None:
+            return None
+        places = [self.layout.well_of(self.sheetIndex, reaction.product) for reaction in reactions]
+        if any(place is None for place in places):
+            return None
+        order = sorted(range(len(reactions)), key=places.__getitem__)
+        reactions = [reactions[i] for i in order]
+        wells = []
+        for plateIndex, wellIndex in (places[i] for i in order):
+            plate = self.layoutPlates.get(plateIndex)
+            if plate is None:
+                layoutPlate = self.layout.plates[plateIndex]
+                plate = self.layoutPlates[plateIndex] = self.refs.plate(lab_sheet.sheetType.__name__.lower(),
+                                                                        layoutPlate.plateType, name=layoutPlate.name or None)
+            wells.append(plate.well(wellIndex))
+        return reactions, wells
+
+    def _finish_run(self, lab_sheet):
+        """
+        Runs the thermocycler program of lab_sheet on the plates of the pending reactions, then stores
+        their products.
+        """
+        if not self.pending:
+            return
+        groups = PROGRAMS.get(lab_sheet.program)
+        if groups is None:
+            raise ValueError(f"No thermocycler program {lab_sheet.program!r} for LabSheet {lab_sheet.title!r}")
+        wells = [well for reaction, well, volume in self.pending]
+        for plate in _containers(wells):
+            plateVolume = max(volume for reaction, well, volume in self.pending if well.container is plate)
+            self.protocol.seal(plate)
+            self.protocol.agitate(plate, "vortex", "1000:rpm", "30:second")
+            self.protocol.thermocycle(plate, groups, volume=_ul(plateVolume))
+
+        for reaction, well, volume in self.pending:
+            self.products[reaction.product] = (well, volume)
+            if reaction.destination is not None:
+                tube = self.tube(reaction.destination)
+                self.protocol.transfer(well, tube, _ul(volume), method=PRODUCT_TRANSFER)
+                self.products[reaction.product] = (tube, volume)
+        self.pending = []
+
+    def optimize(self, verify=True):
+        """
+        Runs the instruction optimizer (see utils/protocol_optimizer.py) over the protocol built so far.
+
+        Parameters:
+            verify: check in the simulator that the optimized protocol has the same end state
+
+        Returns:
+            OptimizationReport: instruction, tip and deck load counts before and after.
+        """
+        return optimize_protocol(self.protocol, verify)
+
+    def export_protocol(self, output_path, lab_packet=None, inventory=None, ndjson=False, compact=True):
         """
-        Export the generated protocol to a JSON file.
+        Export the protocol to a JSON file, streaming it instruction by instruction.
 
         Parameters:
             output_path: Path to save the Autoprotocol JSON.
+            lab_packet: if given, the protocol is generated from this LabPacket while it is written
+                (see stream_instructions) rather than taken from what has been built so far
+            inventory: the Inventory for lab_packet
+            ndjson: write newline-delimited chunks of instructions (see utils/protocol_export.py)
+            compact: write without spaces between tokens
+
+        Returns:
+            The number of bytes written.
         """
-        with open(output_path, "w") as f:
-            f.write(self.protocol.as_dict())
+        instructions = self.stream_instructions(lab_packet, inventory) if lab_packet is not None else None
+        written = export_protocol(self.protocol, output_path, instructions, ndjson, compact)
         print(f"Protocol exported to {output_path}")
+        return written
+
+    @classmethod
+    def export_batch(cls, experiments, output_path, resourceIds=None, refs=None, ndjson=False, compact=True):
+        """
+        Generates a protocol for each Experiment and writes them all to one file with an index,
+        holding no more than one sheet's instructions at a time.
 
+        Parameters:
+            experiments: Experiments (each with a labPacket and inventory), e.g. BatchResult.experiments
+            output_path: Path to save the batch.
+            resourceIds: the site's resource ids for stocks (see __init__)
+            refs: the ContainerRefManager every protocol takes its refs from; one is shared by default,
+                so a tube has the same name in every protocol of the batch
+            ndjson: write each protocol as newline-delimited chunks rather than one line
+            compact: write without spaces between tokens
+
+        Returns:
+            The index: {experiment name: {"offset", "length", "instructions", "refs"}}.
+        """
+        refs = refs or ContainerRefManager()
+
+        def protocols():
+            for experiment in experiments:
+                factory = cls(resourceIds, refs)
+                yield experiment.name, factory.protocol, factory.stream_instructions(experiment.labPacket,
+                                                                                     experiment.inventory)
+        return export_protocols(protocols(), output_path, ndjson, compact)
+
+# sheetType -> the AutoprotocolFactory method generating its instructions; Gibson sheets are
+# written with the GoldenGate sheetType
+SHEET_PROCESSORS = {
+    PCR: "_process_reactions",
+    Digest: "_process_reactions",
+    Ligate: "_process_reactions",
+    GoldenGate: "_process_reactions",
+    Gibson: "_process_reactions",
+    Zymo: "_process_zymo",
+    Transform: "_process_transform",
+    Miniprep: "_process_miniprep",
+}
+
+def _containers(wells):
+    """
+    Returns the distinct containers of wells, in order of first appearance.
+    """
+    return list({id(well.container): well.container for well in wells}.values())
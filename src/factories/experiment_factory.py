@@ -1,8 +1,18 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from src.models.experiment import *
 from src.factories.inventory_factory import *
 from src.models.labplanner import *
 from src.factories.lab_packet_factory import LabPacketFactory
 from src.factories.oligo_list_factory import *
+from src.utils import profiling
+from src.utils.dirty_tracking import copy_tracking
+
+@dataclass(frozen=True)
+class BatchResult:
+    experiments: list[Experiment]   # one entry per job, None where the job failed
+    errors: dict[int, Exception]    # job index -> the exception that stopped it
+    inventory: Inventory            # the shared inventory after every successful job
 
 class ExperimentFactory:
     '''
@@ -11,6 +21,23 @@ class ExperimentFactory:
     inventoryFactory = InventoryFactory()
     labPacketFactory = LabPacketFactory()
 
+    # InventoryFactory.run updates the boxes and lookup dicts of the inventory it is given,
+    # so every inventory planning step goes through this lock.
+    inventoryLock = threading.Lock()
+
+    def collectSequences(self, cfList):
+        '''
+        Parameters:
+            cfList: a list of ConstructionFile objects
+        Returns:
+            sequences: a dictionary of every named sequence across the construction files
+        '''
+        sequences = {}
+        for cf in cfList:
+            if cf.sequences:
+                sequences.update(cf.sequences)
+        return sequences
+
     def run(self, experimentName, experimentID, cfList, oldInventory):
         '''
         Parameters:
@@ -18,17 +45,83 @@ class ExperimentFactory:
             experimentID: a string of the ID number of the experiment
             cflist: a list of ConstructionFile objects for the corresponding experiment
             oldInventory: an Inventory object for the existing (old) inventory
-        Returns: 
+        Returns:
             experiment: an Experiment object
         '''
-        self.sequences = {}
-        for cf in cfList:
-            if cf.sequences:
-                self.sequences.update(cf.sequences)
-        self.oligoList = None
-        self.inventory = self.inventoryFactory.run(experimentName, experimentID, cfList, oldInventory)
-        self.packet = self.labPacketFactory.run(experimentName, cfList, self.inventory)
-        
-        experiment = Experiment(experimentName, cfList, self.oligoList, self.sequences, self.packet, self.inventory)
+        with profiling.stage("experiment.merge_cfs"):
+            sequences = self.collectSequences(cfList)
+        oligoList = None
+        with self.inventoryLock, profiling.stage("experiment.inventory"):
+            inventory = self.inventoryFactory.run(experimentName, experimentID, cfList, oldInventory)
+        with profiling.stage("experiment.lab_packet"):
+            packet = self.labPacketFactory.run(experimentName, cfList, inventory)
+
+        experiment = Experiment(experimentName, cfList, oligoList, sequences, packet, inventory)
 
         return experiment
+
+    def copyInventory(self, inventory):
+        '''
+        Parameters:
+            inventory: an Inventory object, or None
+        Returns:
+            a new Inventory object with its own box list and lookup dicts, so planning against it
+            leaves the original untouched
+        '''
+        if inventory is None:
+            return None
+        copy = Inventory(list(inventory.boxes),
+                         {construct: set(locs) for construct, locs in inventory.construct_to_locations.items()},
+                         dict(inventory.loc_to_conc),
+                         dict(inventory.loc_to_clone),
+                         dict(inventory.loc_to_culture))
+        copy_tracking(inventory, copy)
+        return copy
+
+    def runBatch(self, jobs, oldInventory, maxWorkers=None):
+        '''
+        Plans many experiments against one shared inventory. Inventory planning runs job by job,
+        in order, so each job sees the samples created by the jobs before it; the lab packets only
+        read their own inventory and are built in a process pool. A failing job is recorded in the
+        errors and does not stop the rest of the batch.
+
+        Parameters:
+            jobs: a list of (experimentName, experimentID, cfList) tuples
+            oldInventory: an Inventory object for the existing (old) inventory, or None; it is not modified
+            maxWorkers: the number of worker processes for lab packet planning (defaults to the CPU count)
+        Returns:
+            result: a BatchResult with the Experiment for each job, the per-job errors, and the final inventory
+        '''
+        experiments = [None] * len(jobs)
+        errors = {}
+        inventories = {}
+        futures = {}
+        inventory = oldInventory
+
+        with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+            for i, (experimentName, experimentID, cfList) in enumerate(jobs):
+                try:
+                    with self.inventoryLock, profiling.stage("batch.inventory"):
+                        newInventory = self.inventoryFactory.run(experimentName, experimentID, cfList,
+                                                                 self.copyInventory(inventory))
+                except Exception as e:
+                    errors[i] = e
+                    continue
+                # the next job plans against a copy, so this snapshot stays fixed while it waits to be sent
+                inventory = newInventory
+                inventories[i] = newInventory
+                futures[i] = executor.submit(self.labPacketFactory.run, experimentName, cfList, newInventory)
+
+            for i, future in futures.items():
+                experimentName, experimentID, cfList = jobs[i]
+                try:
+                    with profiling.stage("batch.lab_packet_wait"):
+                        packet = future.result()
+                except Exception as e:
+                    # the job's samples stay in the inventory, since later jobs were planned around them
+                    errors[i] = e
+                    continue
+                experiments[i] = Experiment(experimentName, cfList, None, self.collectSequences(cfList),
+                                            packet, inventories[i])
+
+        return BatchResult(experiments, errors, inventory)
@@ -1,6 +1,7 @@
 from src.models.inventory import *
 from src.models.labplanner import *
 from string import ascii_uppercase as alcU
+from src.utils.dirty_tracking import copy_tracking
 
 class InventoryFactory:
 
@@ -253,7 +254,7 @@ class InventoryFactory:
             if not currIndex:
                 currIndex = [0, 0]
                 boxIndex += 1
-                samplesArrays[boxIndex] =  [[] for _ in range(10)]   
+                samplesArrays[boxIndex] = [[None for _ in range(10)] for _ in range(10)]
 
         for arrayIndex in samplesArrays:
             newBox = Box(experimentName + 'Box' + str(arrayIndex), 'materials for ' + experimentName, 'minus20', samplesArrays[arrayIndex])
@@ -285,7 +286,10 @@ class InventoryFactory:
                     newSamples.extend(self.genNewMinipreps(step, experimentID, oldInventory))
             newSamples.extend(self.genNewSeqs(cf.sequences, newSamples, oldInventory))
 
+        firstNewBox = len(oldInventory.boxes) if oldInventory else 0
         boxes, cons_to_loc, loc_to_conc, loc_to_clone, loc_to_culture  = self.assignSamples(experimentName, newSamples, oldInventory)
 
         inventory = Inventory(boxes, cons_to_loc, loc_to_conc, loc_to_clone, loc_to_culture)
+        # only the new boxes need writing on the next incremental save
+        copy_tracking(oldInventory, inventory, range(firstNewBox, len(boxes)))
         return inventory
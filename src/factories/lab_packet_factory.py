@@ -1,12 +1,24 @@
 from src.models.experiment import *
 from src.models.inventory import *
 from src.models.labplanner import *
+from src.utils import profiling
+from src.utils.mastermix import apply_mastermix, DEFAULT_OVERAGE
 
 class LabPacketFactory:
     '''
     This class contains functions to construct a Lab Packet for some experiment, which can be eventually serialized.
     '''
 
+    def __init__(self, mastermix=True, overage=DEFAULT_OVERAGE):
+        '''
+        Parameters:
+            mastermix: premix the stocks each sheet's reactions share, filling in Recipe.mastermix
+                (see utils/mastermix.py)
+            overage: extra fraction of reactions to make mastermix for
+        '''
+        self.mastermix = mastermix
+        self.overage = overage
+
     def pcrSheets(self, expName, pcrSteps, inventory):
         '''
         Parameters:
@@ -23,13 +35,13 @@ class LabPacketFactory:
 
         pcrLabSheets = []
         reactions = []
-        reactions.append([Reagent.ddH2O, 32.0])
-        reactions.append([Reagent.PrimeSTAR_dNTP_Mixture_2p5mM, 4.0])
-        reactions.append([Reagent.primer1, 1.0])
-        reactions.append([Reagent.primer2, 1.0])
-        reactions.append([Reagent.template, 1.0])
-        reactions.append([Reagent.PrimeSTAR_GXL_Buffer_5x, 10.0])
-        reactions.append([Reagent.PrimeSTAR_GXL_DNA_Polymerase, 1.0])
+        reactions.append((Reagent.ddH2O, 32.0))
+        reactions.append((Reagent.PrimeSTAR_dNTP_Mixture_2p5mM, 4.0))
+        reactions.append((Reagent.primer1, 1.0))
+        reactions.append((Reagent.primer2, 1.0))
+        reactions.append((Reagent.template, 1.0))
+        reactions.append((Reagent.PrimeSTAR_GXL_Buffer_5x, 10.0))
+        reactions.append((Reagent.PrimeSTAR_GXL_DNA_Polymerase, 1.0))
     
         recipe = Recipe(None, reactions)
 
@@ -478,20 +490,33 @@ class LabPacketFactory:
 
         labSheets = []
         if pcrSteps:
-            labSheets.extend(self.pcrSheets(expName, pcrSteps, inventory))
-            labSheets.extend(self.zymoSheets(expName, pcrSteps, inventory))
-            labSheets.extend(self.gelSheets(expName, pcrSteps, inventory))
+            with profiling.stage("sheet.PCR"):
+                labSheets.extend(self.pcrSheets(expName, pcrSteps, inventory))
+            with profiling.stage("sheet.Zymo"):
+                labSheets.extend(self.zymoSheets(expName, pcrSteps, inventory))
+            with profiling.stage("sheet.Gel"):
+                labSheets.extend(self.gelSheets(expName, pcrSteps, inventory))
         if digestSteps:
-            labSheets.extend(self.digestSheets(expName, digestSteps, inventory))
-            labSheets.extend(self.zymoSheets(expName, digestSteps, inventory))
+            with profiling.stage("sheet.Digest"):
+                labSheets.extend(self.digestSheets(expName, digestSteps, inventory))
+            with profiling.stage("sheet.Zymo"):
+                labSheets.extend(self.zymoSheets(expName, digestSteps, inventory))
         if ligateSteps:
-            labSheets.extend(self.ligateSheets(expName, ligateSteps, inventory))
+            with profiling.stage("sheet.Ligate"):
+                labSheets.extend(self.ligateSheets(expName, ligateSteps, inventory))
         if ggSteps:
-            labSheets.extend(self.ggSheets(expName, ggSteps, inventory))
+            with profiling.stage("sheet.GoldenGate"):
+                labSheets.extend(self.ggSheets(expName, ggSteps, inventory))
         if gibsonSteps:
-            labSheets.extend(self.gibsonSheets(expName, gibsonSteps, inventory))
+            with profiling.stage("sheet.Gibson"):
+                labSheets.extend(self.gibsonSheets(expName, gibsonSteps, inventory))
         if transformSteps:
-            labSheets.extend(self.transformSheets(expName, transformSteps, inventory))
+            with profiling.stage("sheet.Transform"):
+                labSheets.extend(self.transformSheets(expName, transformSteps, inventory))
+
+        if self.mastermix:
+            with profiling.stage("sheet.mastermix"):
+                labSheets = [apply_mastermix(sheet, self.overage) for sheet in labSheets]
 
         labPacket = LabPacket(labSheets)
         return labPacket
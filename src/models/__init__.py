@@ -18,6 +18,7 @@ from .labplanner import (
     Gel,
     Zymo,
     Recipe, 
+    ABSTRACT_REAGENTS,
 )
 from .inventory import Inventory, Box, Sample, Concentration, Culture, Location 
 from .experiment import Experiment
@@ -40,6 +41,7 @@ __all__ = [
     "Gel",
     "Zymo",
     "Recipe",
+    "ABSTRACT_REAGENTS",
     "Inventory",
     "Box",
     "Sample",
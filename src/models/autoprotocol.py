@@ -0,0 +1,53 @@
+from dataclasses import *
+from typing import Optional, Tuple
+from .labplanner import *
+from .inventory import *
+
+
+@dataclass(frozen=True)
+class Reaction:
+    product: str                                   # The construct the reaction makes
+    samples: Tuple[Tuple[Reagent, Location], ...]  # Each abstract recipe reagent (primer1, dna, ...) and the tube it is drawn from
+    destination: Optional[Location] = None         # The tube the product is stored in, if the sheet names one
+
+
+@dataclass(frozen=True)
+class LayoutPlate:
+    plateType: str              # Autoprotocol container type, e.g. "96-pcr"
+    program: str                # The thermocycler program every reaction on the plate runs
+    sheets: Tuple[int, ...]     # Indices in the LabPacket of the sheets with reactions on the plate
+    name: str = ""              # The plate's ref name in protocols and picklists
+
+
+@dataclass(frozen=True)
+class WellAssignment:
+    sheet: int                  # Index in the LabPacket of the reaction's sheet
+    product: str                # The construct the reaction makes
+    plate: int                  # Index into PlateLayout.plates
+    well: int                   # Well index on the plate, row-major as Autoprotocol numbers wells
+
+
+@dataclass(frozen=True)
+class PlateLayout:
+    plates: Tuple[LayoutPlate, ...]
+    assignments: Tuple[WellAssignment, ...]
+    runs: Tuple[Tuple[int, ...], ...]   # Sheets thermocycled together: consecutive sheets with one program
+    travel: float = 0.0                 # Total source-to-destination distance of the layout, in mm
+    wells: dict = field(init=False, repr=False, compare=False)
+    sheetRuns: dict = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "wells", {(a.sheet, a.product): (a.plate, a.well) for a in self.assignments})
+        object.__setattr__(self, "sheetRuns", {sheet: run for run in self.runs for sheet in run})
+
+    def well_of(self, sheet: int, product: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns (plate index, well index) of a sheet's reaction, or None if it has no well.
+        """
+        return self.wells.get((sheet, product))
+
+    def run_of(self, sheet: int) -> Optional[Tuple[int, ...]]:
+        """
+        Returns the run a sheet is thermocycled in, or None if the sheet is in no run.
+        """
+        return self.sheetRuns.get(sheet)
@@ -163,6 +163,12 @@ class Reagent(Enum):
     lb_cam = "LB + Cam Broth"
     lb = "LB Broth"
 
+# The abstract Reagents, which stand for a reaction's own samples rather than a stock
+ABSTRACT_REAGENTS = frozenset({
+    Reagent.mastermix, Reagent.primer1, Reagent.primer2, Reagent.template,
+    Reagent.frag1, Reagent.frag2, Reagent.frag3, Reagent.frag4, Reagent.dna,
+})
+
 @dataclass(frozen=True)
 class Recipe:
     mastermix: List[Tuple[Reagent, float]]  # The reagent and volume in microliters for the mastermix
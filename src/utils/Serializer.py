@@ -22,6 +22,11 @@ class Serializer:
                 for reagent in labSheet.reaction.reaction: 
                     f.write(str(reagent[1]) + 'uL ' + reagent[0].value + '\n')
                 f.write('\n')
+                if labSheet.reaction.mastermix:
+                    f.write('Mastermix:\n')
+                    for reagent in labSheet.reaction.mastermix:
+                        f.write(str(reagent[1]) + 'uL ' + reagent[0].value + '\n')
+                    f.write('\n')
             
             if labSheet.sheetType == PCR:
                 f.write('Program: ' + labSheet.program + '\n' + 'Protocol: ' + labSheet.protocol + '\n' + 'Instrument: ' + labSheet.instrument + '\n\n')
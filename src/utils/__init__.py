@@ -1,7 +1,10 @@
 from .parser import Parser
 from .saver import Saver
+from .cf_parser import ConstructionFileParser, CFParseError
 
 __all__ = [
     "Parser",
     "Saver",
+    "ConstructionFileParser",
+    "CFParseError",
 ]
@@ -0,0 +1,303 @@
+"""
+Single-file experiment archives.
+
+An archive is an ordinary zip file holding the same members as an experiment directory written by
+Saver.save_experiment (experiment.json, metadata.txt, labpacket/..., inventory/...), each compressed
+on its own so any one member can be read without touching the others, plus a toc.json table of
+contents that names the labsheets and boxes. Any zip tool can list or extract it.
+
+Member names are matched without regard to case, so a directory in the write_out layout
+(Experiment.json, LabPacket/lab_sheet_<i>_<title>.txt, Inventory/Inventory.json) archives and
+reads back as well as one in the Saver layout.
+"""
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from typing import Callable, List, Union
+from src.models.inventory import *
+from src.models.labplanner import *
+from src.models.experiment import *
+from src.utils.atomic_writer import write_content
+from src.utils.lab_sheets import parse_lab_sheet
+from src.utils.locations import inventory_from_dict, inventory_from_dicts
+from src.utils.serialization import deserialize
+
+TOC_NAME = "toc.json"
+ARCHIVE_VERSION = 1
+
+# zlib level 3 compresses about as fast as level 1 and ~8% smaller; the default 6 is twice as slow
+DEFAULT_COMPRESSLEVEL = 3
+
+# Members that are stored rather than compressed: small enough that deflate only costs time
+STORE_BELOW = 256
+
+_LAB_SHEET = re.compile(r"(?:^|/)labpacket/(?:lab_sheet_)?(\d+)_(.*)\.txt$", re.IGNORECASE)
+_BOX = re.compile(r"(?:^|/)inventory/(\d+)_Box\.(txt|json)$", re.IGNORECASE)
+
+
+def build_toc(names: List[str]) -> dict:
+    """
+    Builds the table of contents for a list of member names, recognizing the Saver layout.
+
+    Returns:
+        {"version", "members", "labsheets": [{"index", "title", "member"}], "boxes": [{"index", "rows", "data"}]}
+    """
+    labsheets = []
+    boxes = {}
+    for name in names:
+        match = _LAB_SHEET.search(name)
+        if match:
+            labsheets.append({"index": int(match.group(1)), "title": match.group(2), "member": name})
+            continue
+        match = _BOX.search(name)
+        if match:
+            entry = boxes.setdefault(int(match.group(1)), {"index": int(match.group(1)), "rows": None, "data": None})
+            entry["rows" if match.group(2).lower() == "txt" else "data"] = name
+    return {
+        "version": ARCHIVE_VERSION,
+        "members": list(names),
+        "labsheets": sorted(labsheets, key=lambda entry: entry["index"]),
+        "boxes": [boxes[i] for i in sorted(boxes)],
+    }
+
+
+class ExperimentArchiveWriter:
+    """
+    Writes an archive member by member. Members are streamed into the zip as they are added, and
+    the archive is built in a temp file that replaces path only when the writer is closed without
+    an error, so a reader never sees a partial archive.
+
+    It has the add() interface of AtomicBatchWriter, so Saver.add_experiment can target either.
+    """
+
+    def __init__(self, path: str, compression: int = zipfile.ZIP_DEFLATED, compresslevel: int = DEFAULT_COMPRESSLEVEL):
+        """
+        Parameters:
+            path: The archive file to write.
+            compression: The zipfile compression method for members (e.g. ZIP_DEFLATED, ZIP_LZMA).
+            compresslevel: The compression level for members.
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+        os.close(fd)
+        self.zip = zipfile.ZipFile(self.tmp, "w", compression, allowZip64=True, compresslevel=compresslevel)
+        self.names: List[str] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        if excType is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, name: str, content: Union[str, Callable]):
+        """
+        Adds a member.
+
+        Parameters:
+            name: The member name, with '/' separators.
+            content: The text, a function returning it, or an atomic_writer.streaming() function
+                that writes to the text file it is given.
+        """
+        if isinstance(content, str):
+            self.add_bytes(name, content.encode("utf-8"))
+            return
+        with self.open(name) as f:
+            write_content(f, content)
+
+    def add_bytes(self, name: str, data: bytes):
+        """
+        Adds a member from raw bytes, stored uncompressed when it is shorter than STORE_BELOW.
+        """
+        name = self.member_name(name)
+        self.zip.writestr(name, data, None if len(data) >= STORE_BELOW else zipfile.ZIP_STORED)
+
+    def open(self, name: str):
+        """
+        Returns a writable text stream for a new member; closing it finishes the member.
+        """
+        return io.TextIOWrapper(self.open_bytes(name), encoding="utf-8", newline="")
+
+    def open_bytes(self, name: str):
+        """
+        Returns a writable binary stream for a new member; closing it finishes the member.
+        """
+        return self.zip.open(self.member_name(name), "w", force_zip64=True)
+
+    def member_name(self, name: str) -> str:
+        name = name.replace(os.sep, "/")
+        if name == TOC_NAME:
+            raise ValueError(f"{TOC_NAME} is written by the archive itself")
+        self.names.append(name)
+        return name
+
+    def close(self):
+        """
+        Writes the table of contents and moves the finished archive into place.
+        """
+        toc = json.dumps(build_toc(self.names), indent=4)
+        self.zip.writestr(TOC_NAME, toc, zipfile.ZIP_STORED)
+        self.zip.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self):
+        """
+        Discards the partial archive, leaving any existing file at path untouched.
+        """
+        self.zip.close()
+        os.unlink(self.tmp)
+
+
+class ExperimentArchive:
+    """
+    Reads an archive. Opening it reads only the zip directory and the table of contents; each
+    accessor then decompresses just the members it needs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.zip = zipfile.ZipFile(path, "r")
+        if TOC_NAME in self.zip.NameToInfo:
+            self.toc = json.loads(self.zip.read(TOC_NAME))
+        else:
+            self.toc = build_toc([name for name in self.zip.namelist() if not name.endswith("/")])
+        self._folded = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, exc, tb):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def names(self) -> List[str]:
+        return list(self.toc["members"])
+
+    def open(self, name: str):
+        """
+        Returns a readable text stream over one member, decompressed as it is read.
+        """
+        return io.TextIOWrapper(self.zip.open(name, "r"), encoding="utf-8", newline="")
+
+    def read_text(self, name: str) -> str:
+        return self.zip.read(name).decode("utf-8")
+
+    def lab_sheet_titles(self) -> List[str]:
+        return [entry["title"] for entry in self.toc["labsheets"]]
+
+    def lab_sheet_text(self, index: int) -> str:
+        """
+        Returns the text of one labsheet, by its index in the lab packet.
+        """
+        return self.read_text(self._entry("labsheets", index)["member"])
+
+    def lab_sheet(self, index: int) -> LabSheet:
+        """
+        Returns one LabSheet, parsed as its member is decompressed.
+        """
+        member = self._entry("labsheets", index)["member"]
+        with self.open(member) as f:
+            return parse_lab_sheet(f, member)
+
+    def box_rows(self, index: int) -> str:
+        """
+        Returns one box in the row form of Saver.render_box_row_form.
+        """
+        return self.read_text(self._entry("boxes", index)["rows"])
+
+    def box(self, index: int) -> Box:
+        """
+        Returns one Box, reading only its own member.
+        """
+        member = self._entry("boxes", index)["data"]
+        with self.open(member) as f:
+            return deserialize(json.load(f)["box"], Box)
+
+    def member(self, name: str) -> str:
+        """
+        Returns the member called name, or else the one whose name differs from it only in case.
+        """
+        if name in self.zip.NameToInfo:
+            return name
+        if self._folded is None:
+            self._folded = {member.lower(): member for member in self.zip.namelist()}
+        try:
+            return self._folded[name.lower()]
+        except KeyError:
+            raise KeyError(f"No member {name} in {self.path}") from None
+
+    def inventory(self, prefix: str = "inventory/") -> Inventory:
+        """
+        Returns the whole Inventory from the index and box members, or from a single-file
+        inventory.json as write_out writes it.
+        """
+        member = self.member(prefix + "inventory.json")
+        index = json.loads(self.read_text(member))
+        if "version" not in index:
+            return inventory_from_dict(index)
+        directory = member[:len(member) - len("inventory.json")]
+        parts = [json.loads(self.read_text(self.member(directory + name))) for name in index["boxes"]]
+        if index["extra"]:
+            parts.append(index["extra"])
+        return inventory_from_dicts(parts)
+
+    def experiment(self, name: str = "experiment.json") -> Experiment:
+        """
+        Returns the Experiment from its JSON member, streamed out of the archive.
+        """
+        with self.open(self.member(name)) as f:
+            return deserialize(json.load(f), Experiment)
+
+    def _entry(self, kind: str, index: int) -> dict:
+        for entry in self.toc[kind]:
+            if entry["index"] == index:
+                return entry
+        raise KeyError(f"No {kind[:-1]} {index} in {self.path}")
+
+
+def directory_to_archive(indir: str, path: str, compression: int = zipfile.ZIP_DEFLATED) -> int:
+    """
+    Packs an existing output directory (from Saver.save_experiment, write_out.write_experiment_output
+    or anything else) into an archive, streaming each file in.
+
+    Returns:
+        The number of members written.
+    """
+    count = 0
+    with ExperimentArchiveWriter(path, compression) as archive:
+        for root, dirs, files in os.walk(indir):
+            dirs.sort()
+            for filename in sorted(files):
+                filepath = os.path.join(root, filename)
+                name = os.path.relpath(filepath, indir).replace(os.sep, "/")
+                with open(filepath, "rb") as src:
+                    if os.path.getsize(filepath) < STORE_BELOW:
+                        archive.add_bytes(name, src.read())
+                    else:
+                        with archive.open_bytes(name) as dst:
+                            shutil.copyfileobj(src, dst)
+                count += 1
+    return count
+
+
+def archive_to_directory(path: str, outdir: str) -> int:
+    """
+    Unpacks an archive into a directory; the table of contents is not extracted.
+
+    Returns:
+        The number of files written.
+    """
+    with zipfile.ZipFile(path, "r") as archive:
+        members = [name for name in archive.namelist() if name != TOC_NAME]
+        archive.extractall(outdir, members)
+    return len(members)
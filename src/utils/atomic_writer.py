@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Union
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True)
+class WriteStats:
+    files: int          # files written
+    bytes: int          # bytes written, excluding the manifest
+    seconds: float      # wall time of the commit, rendering included
+    kept: int = 0       # unchanged files carried over from the previous commit
+
+    @property
+    def throughput(self) -> float:
+        """
+        Bytes written per second.
+        """
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.files} files, {self.bytes / 1e6:.2f} MB in {self.seconds * 1000:.1f} ms "
+                f"({self.throughput / 1e6:.1f} MB/s), {self.kept} kept")
+
+
+class _HashingFile:
+    """
+    Wraps a text file so everything written through it is also hashed and counted.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.sha256.update(data)
+        self.size += len(data)
+        self.f.write(data)
+        return len(text)
+
+
+def _write_temp(path: str, content: Union[str, Callable], fsync: bool):
+    """
+    Writes content (a string, a zero-argument function returning one, or a streaming() function)
+    to a temp file beside path.
+
+    Returns:
+        (temp path, size in bytes, sha256 hex digest)
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as raw:
+            f = _HashingFile(raw)
+            write_content(f, content)
+            if fsync:
+                raw.flush()
+                os.fsync(raw.fileno())
+        return tmp, f.size, f.sha256.hexdigest()
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def atomic_write(path: str, content: Union[str, Callable], fsync: bool = False) -> int:
+    """
+    Writes one file atomically: readers see either the old file or the complete new one.
+
+    Parameters:
+        path: The file to write.
+        content: The text, or a function returning it, or a function wrapped with streaming()
+            that writes to the file it is given.
+        fsync: Flush the data to disk before the file is replaced.
+
+    Returns:
+        The number of bytes written.
+    """
+    tmp, size, _ = _write_temp(path, content, fsync)
+    os.replace(tmp, path)
+    return size
+
+
+class _Streamed:
+    def __init__(self, write: Callable):
+        self.write = write
+
+
+def streaming(write: Callable) -> _Streamed:
+    """
+    Wraps a function that takes a writable text file, so AtomicBatchWriter and atomic_write pass it
+    the file instead of expecting it to return the text.
+    """
+    return _Streamed(write)
+
+
+def write_content(f, content: Union[str, Callable]):
+    """
+    Writes file content given as text, a function returning the text, or a streaming() function
+    to the writable text file f.
+    """
+    if isinstance(content, _Streamed):
+        content.write(f)
+    else:
+        f.write(content() if callable(content) else content)
+
+
+def read_manifest(outdir: str) -> Optional[dict]:
+    """
+    Returns the manifest of a directory committed by AtomicBatchWriter, or None if there is none,
+    which means the directory was never committed or a save was interrupted.
+    """
+    path = os.path.join(outdir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def verify_directory(outdir: str) -> list:
+    """
+    Checks every file listed in a directory's manifest against its recorded size and hash.
+
+    Returns:
+        A list of problems, empty when the directory matches its manifest.
+    """
+    manifest = read_manifest(outdir)
+    if manifest is None:
+        return [f"{outdir}: no {MANIFEST_NAME}; the directory is incomplete"]
+    problems = []
+    for relpath, entry in manifest["files"].items():
+        path = os.path.join(outdir, relpath)
+        if not os.path.exists(path):
+            problems.append(f"{relpath}: missing")
+            continue
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) != entry["size"] or hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            problems.append(f"{relpath}: does not match the manifest")
+    return problems
+
+
+class AtomicBatchWriter:
+    """
+    Collects the files of one output directory and commits them as a unit.
+
+    commit() renders and writes every file to a temp file beside its destination on a thread pool.
+    Only once all of them succeed does it remove the old manifest, move each temp file into place
+    with os.replace, delete files the previous commit listed that this one does not, and finally
+    write the new manifest (itself atomically). A failure while rendering or writing leaves the
+    directory exactly as it was; a crash during the short replace phase leaves it without a
+    manifest, which read_manifest and verify_directory report as incomplete.
+
+    Files passed to keep() are left as they are and carried into the new manifest, so an
+    incremental save only pays for the files that changed.
+    """
+
+    def __init__(self, outdir: str, maxWorkers: int = None, fsync: bool = False):
+        self.outdir = outdir
+        self.maxWorkers = maxWorkers
+        self.fsync = fsync
+        self.files: Dict[str, Union[str, Callable]] = {}
+        self.kept = set()
+        self.manifest: Optional[dict] = None   # the manifest written by the last commit
+
+    def add(self, relpath: str, content: Union[str, Callable]):
+        """
+        Queues a file.
+
+        Parameters:
+            relpath: The path of the file within the output directory.
+            content: The text, or a function returning it (called on the thread pool), or a
+                function wrapped with streaming() that writes to the file it is given.
+        """
+        if relpath == MANIFEST_NAME:
+            raise ValueError(f"{MANIFEST_NAME} is written by the writer itself")
+        self.files[relpath.replace(os.sep, "/")] = content
+
+    def keep(self, relpath: str):
+        """
+        Carries a file from the previous commit into this one without rewriting it.
+        """
+        self.kept.add(relpath.replace(os.sep, "/"))
+
+    def commit(self) -> WriteStats:
+        """
+        Writes every queued file and the manifest.
+
+        Returns:
+            The WriteStats for the commit.
+        """
+        start = time.perf_counter()
+        os.makedirs(self.outdir, exist_ok=True)
+        previous = read_manifest(self.outdir)
+        previousFiles = previous["files"] if previous is not None else {}
+        kept = self.kept - set(self.files)
+        for relpath in kept:
+            if relpath not in previousFiles or not os.path.exists(os.path.join(self.outdir, *relpath.split("/"))):
+                raise ValueError(f"Cannot keep {relpath}: it is not in the previous commit")
+        paths = {relpath: os.path.join(self.outdir, *relpath.split("/")) for relpath in self.files}
+
+        written = {}
+        failure = None
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            futures = {relpath: executor.submit(_write_temp, paths[relpath], content, self.fsync)
+                       for relpath, content in self.files.items()}
+            for relpath, future in futures.items():
+                try:
+                    written[relpath] = future.result()
+                except BaseException as e:
+                    failure = failure or e
+        if failure is not None:
+            for tmp, _, _ in written.values():
+                os.unlink(tmp)
+            raise failure
+
+        manifest_path = os.path.join(self.outdir, MANIFEST_NAME)
+        if previous is not None:
+            os.unlink(manifest_path)
+        for relpath, (tmp, _, _) in written.items():
+            os.replace(tmp, paths[relpath])
+        if previous is not None:
+            for relpath in previousFiles:
+                if relpath not in written and relpath not in kept:
+                    stale = os.path.join(self.outdir, *relpath.split("/"))
+                    if os.path.exists(stale):
+                        os.unlink(stale)
+
+        files = {relpath: previousFiles[relpath] for relpath in kept}
+        files.update((relpath, {"size": size, "sha256": digest}) for relpath, (_, size, digest) in written.items())
+        manifest = {"version": MANIFEST_VERSION, "files": dict(sorted(files.items()))}
+        atomic_write(manifest_path, json.dumps(manifest, indent=4), self.fsync)
+        self.manifest = manifest
+        self.files = {}
+        self.kept = set()
+        return WriteStats(len(written), sum(size for _, size, _ in written.values()),
+                          time.perf_counter() - start, len(kept))
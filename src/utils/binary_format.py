@@ -0,0 +1,401 @@
+"""
+A compact, versioned binary encoding of the model dataclasses (Experiment, LabPacket, Inventory, ...),
+built only on struct, as a safe and faster alternative to pickle.
+
+Layout:
+    header   MAGIC, SCHEMA_VERSION (uint16), layout checksum (uint32)
+    body     one tagged value
+
+Each value starts with a one-byte tag. Integers are zigzag varints, strings are interned (the first
+occurrence carries the UTF-8 bytes, later ones a varint index into the table built so far), enum members
+and model classes are small integer codes, and Locations pack row and column into one varint and are
+interned like strings, since the same Location is repeated across the inventory lookup dicts.
+"""
+import struct
+import zlib
+from dataclasses import fields
+from enum import Enum
+from src.models.inventory import *
+from src.models.labplanner import *
+from src.models.experiment import *
+
+MAGIC = b"LPBN"
+SCHEMA_VERSION = 1
+
+# Type codes are positions in these tuples: only ever append to them, and bump SCHEMA_VERSION when a
+# dataclass gains, loses or reorders fields (the layout checksum in the header catches a forgotten bump).
+MODEL_TYPES = (
+    Experiment, LabPacket, LabSheet, Recipe, ConstructionFile, Polynucleotide,
+    Inventory, Box, Sample, Location,
+    Step, PCR, Digest, Ligate, GoldenGate, Gibson, Transform, Pick, Miniprep, Gel, Zymo,
+)
+ENUM_TYPES = (Reagent, Concentration, Culture)
+
+_HEADER = struct.Struct("<4sHI")
+_DOUBLE = struct.Struct("<d")
+
+(T_NONE, T_TRUE, T_FALSE, T_INT, T_FLOAT, T_STR, T_STRREF, T_LIST, T_TUPLE, T_SET, T_DICT,
+ T_ENUM, T_TYPE, T_OBJECT, T_LOCATION, T_LOCREF) = range(16)
+
+
+class BinaryFormatError(ValueError):
+    """
+    Raised for data that is not a valid binary encoding for this schema version.
+    """
+
+
+def _layout_checksum():
+    """
+    A CRC of every model type's name and field names and every enum's member names, in code order.
+    """
+    parts = []
+    for cls in MODEL_TYPES:
+        parts.append(cls.__name__ + "(" + ",".join(field.name for field in fields(cls)) + ")")
+    for cls in ENUM_TYPES:
+        parts.append(cls.__name__ + "[" + ",".join(member.name for member in cls) + "]")
+    return zlib.crc32(";".join(parts).encode())
+
+LAYOUT_CHECKSUM = _layout_checksum()
+
+_TYPE_CODES = {cls: code for code, cls in enumerate(MODEL_TYPES)}
+_TYPE_FIELDS = {cls: tuple(field.name for field in fields(cls)) for cls in MODEL_TYPES}
+_ENUM_CODES = {}
+for _code, _cls in enumerate(ENUM_TYPES):
+    for _index, _member in enumerate(_cls):
+        _ENUM_CODES[_member] = (_code, _index)
+_ENUM_MEMBERS = [list(cls) for cls in ENUM_TYPES]
+
+
+class _Encoder:
+    def __init__(self):
+        self.out = bytearray()
+        self.strings = {}
+        self.locations = {}
+        self.dispatch = {
+            type(None): self.none,
+            bool: self.bool,
+            int: self.int,
+            float: self.float,
+            str: self.str,
+            list: self.list,
+            tuple: self.tuple,
+            set: self.set,
+            frozenset: self.set,
+            dict: self.dict,
+            Location: self.location,
+        }
+
+    def varint(self, n):
+        out = self.out
+        if n < 0x80:
+            out.append(n)
+            return
+        while n > 0x7f:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def value(self, value):
+        handler = self.dispatch.get(value.__class__)
+        if handler is None:
+            handler = self.handler_for(value)
+        handler(value)
+
+    def handler_for(self, value):
+        cls = value.__class__
+        if isinstance(value, Enum):
+            if value not in _ENUM_CODES:
+                raise BinaryFormatError(f"Cannot encode enum {cls.__name__}")
+            handler = self.enum
+        elif isinstance(value, type):
+            handler = self.type
+        elif cls in _TYPE_CODES:
+            handler = lambda obj: self.object(obj, cls)
+        else:
+            raise BinaryFormatError(f"Cannot encode type: {cls.__name__}")
+        self.dispatch[cls] = handler
+        return handler
+
+    def none(self, value):
+        self.out.append(T_NONE)
+
+    def bool(self, value):
+        self.out.append(T_TRUE if value else T_FALSE)
+
+    def int(self, value):
+        self.out.append(T_INT)
+        self.varint(value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+    def float(self, value):
+        self.out.append(T_FLOAT)
+        self.out += _DOUBLE.pack(value)
+
+    def str(self, value):
+        index = self.strings.get(value)
+        if index is not None:
+            self.out.append(T_STRREF)
+            if index < 0x80:
+                self.out.append(index)
+            else:
+                self.varint(index)
+            return
+        self.strings[value] = len(self.strings)
+        data = value.encode("utf-8")
+        self.out.append(T_STR)
+        self.varint(len(data))
+        self.out += data
+
+    def items(self, tag, items):
+        self.out.append(tag)
+        self.varint(len(items))
+        value = self.value
+        for item in items:
+            value(item)
+
+    def list(self, value):
+        self.items(T_LIST, value)
+
+    def tuple(self, value):
+        self.items(T_TUPLE, value)
+
+    def set(self, value):
+        self.items(T_SET, value)
+
+    def dict(self, mapping):
+        self.out.append(T_DICT)
+        self.varint(len(mapping))
+        value = self.value
+        for key, item in mapping.items():
+            value(key)
+            value(item)
+
+    def enum(self, member):
+        code, index = _ENUM_CODES[member]
+        self.out.append(T_ENUM)
+        self.varint(code)
+        self.varint(index)
+
+    def type(self, cls):
+        if cls not in _TYPE_CODES:
+            raise BinaryFormatError(f"Cannot encode class: {cls.__name__}")
+        self.out.append(T_TYPE)
+        self.varint(_TYPE_CODES[cls])
+
+    def location(self, location):
+        index = self.locations.get(location)
+        if index is not None:
+            self.out.append(T_LOCREF)
+            self.varint(index)
+            return
+        row, col = location.row, location.col
+        if not (row.__class__ is int and col.__class__ is int and 0 <= row < 256 and 0 <= col < 256):
+            # not a grid position the packed form can hold
+            self.object(location, Location)
+            return
+        self.locations[location] = len(self.locations)
+        self.out.append(T_LOCATION)
+        self.value(location.boxname)
+        self.varint(row << 8 | col)
+        self.value(location.label)
+        self.value(location.sidelabel)
+
+    def object(self, obj, cls):
+        self.out.append(T_OBJECT)
+        self.varint(_TYPE_CODES[cls])
+        value = self.value
+        for name in _TYPE_FIELDS[cls]:
+            value(getattr(obj, name))
+
+
+class _Decoder:
+    def __init__(self, data, offset):
+        self.data = data
+        self.pos = offset
+        self.strings = []
+        self.locations = []
+        self.dispatch = [
+            self.none, self.true, self.false, self.int, self.float, self.str, self.strref,
+            self.list, self.tuple, self.set, self.dict, self.enum, self.type, self.object,
+            self.location, self.locref,
+        ]
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        byte = data[pos]
+        pos += 1
+        if byte < 0x80:
+            self.pos = pos
+            return byte
+        result = byte & 0x7f
+        shift = 7
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                self.pos = pos
+                return result
+            shift += 7
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        # an unknown tag raises IndexError, reported by decode_binary as corrupt data
+        return self.dispatch[tag]()
+
+    def none(self):
+        return None
+
+    def true(self):
+        return True
+
+    def false(self):
+        return False
+
+    def int(self):
+        n = self.varint()
+        return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+    def float(self):
+        value = _DOUBLE.unpack_from(self.data, self.pos)[0]
+        self.pos += 8
+        return value
+
+    def str(self):
+        length = self.varint()
+        end = self.pos + length
+        if end > len(self.data):
+            raise IndexError("string runs past the end of the data")
+        value = str(self.data[self.pos:end], "utf-8")
+        self.pos = end
+        self.strings.append(value)
+        return value
+
+    def strref(self):
+        return self.strings[self.varint()]
+
+    def list(self):
+        value = self.value
+        return [value() for _ in range(self.varint())]
+
+    def tuple(self):
+        value = self.value
+        return tuple([value() for _ in range(self.varint())])
+
+    def set(self):
+        value = self.value
+        return {value() for _ in range(self.varint())}
+
+    def dict(self):
+        value = self.value
+        out = {}
+        for _ in range(self.varint()):
+            key = value()
+            out[key] = value()
+        return out
+
+    def enum(self):
+        code = self.varint()
+        return _ENUM_MEMBERS[code][self.varint()]
+
+    def type(self):
+        return MODEL_TYPES[self.varint()]
+
+    def object(self):
+        cls = MODEL_TYPES[self.varint()]
+        value = self.value
+        return cls(*[value() for _ in _TYPE_FIELDS[cls]])
+
+    def location(self):
+        boxname = self.value()
+        packed = self.varint()
+        location = Location(boxname, packed >> 8, packed & 0xff, self.value(), self.value())
+        self.locations.append(location)
+        return location
+
+    def locref(self):
+        return self.locations[self.varint()]
+
+
+def encode_binary(obj) -> bytes:
+    """
+    Encodes a model object (an Experiment, LabPacket, Inventory, or any value built from the model
+    dataclasses, enums, and builtin containers) in the binary format.
+
+    Parameters:
+        obj: The object to encode.
+
+    Returns:
+        The encoded bytes, starting with the format header.
+    """
+    encoder = _Encoder()
+    encoder.out += _HEADER.pack(MAGIC, SCHEMA_VERSION, LAYOUT_CHECKSUM)
+    encoder.value(obj)
+    return bytes(encoder.out)
+
+
+def decode_binary(data, cls=None):
+    """
+    Decodes bytes produced by encode_binary. Only model types and builtins are ever constructed,
+    so untrusted input can at worst raise BinaryFormatError.
+
+    Parameters:
+        data: The encoded bytes.
+        cls: If given, the type the decoded object must have.
+
+    Returns:
+        The decoded object.
+    """
+    if len(data) < _HEADER.size:
+        raise BinaryFormatError("Data is too short for the format header")
+    magic, version, checksum = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise BinaryFormatError("Not a binary experiment file")
+    if version != SCHEMA_VERSION:
+        raise BinaryFormatError(f"Unsupported schema version {version} (expected {SCHEMA_VERSION})")
+    if checksum != LAYOUT_CHECKSUM:
+        raise BinaryFormatError("Data was written with different model definitions")
+
+    decoder = _Decoder(data, _HEADER.size)
+    try:
+        obj = decoder.value()
+    except BinaryFormatError:
+        raise
+    except RecursionError:
+        raise BinaryFormatError(f"Values nested too deeply near offset {decoder.pos}") from None
+    except (IndexError, KeyError, TypeError, ValueError, struct.error) as e:
+        raise BinaryFormatError(f"Corrupt data near offset {decoder.pos}: {e}") from None
+    if decoder.pos != len(data):
+        raise BinaryFormatError(f"{len(data) - decoder.pos} unexpected trailing bytes")
+    if cls is not None and not isinstance(obj, cls):
+        raise BinaryFormatError(f"Expected {cls.__name__}, found {type(obj).__name__}")
+    return obj
+
+
+def write_binary(obj, filepath: str) -> int:
+    """
+    Parameters:
+        obj: The object to encode.
+        filepath: The path to write.
+
+    Returns:
+        The number of bytes written.
+    """
+    data = encode_binary(obj)
+    with open(filepath, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def read_binary(filepath: str, cls=None):
+    """
+    Parameters:
+        filepath: A file written by write_binary.
+        cls: If given, the type the decoded object must have.
+
+    Returns:
+        The decoded object.
+    """
+    with open(filepath, "rb") as f:
+        return decode_binary(f.read(), cls)
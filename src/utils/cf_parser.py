@@ -0,0 +1,304 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Dict
+from src.models.labplanner import *
+
+
+class CFParseError(ValueError):
+    '''
+    Raised for a malformed construction file, with the file path and line number of the problem.
+    '''
+    def __init__(self, message: str, lineno: int = None, path: str = None):
+        self.message = message
+        self.lineno = lineno
+        self.path = path
+        where = f"{path or '<input>'}:{lineno}" if lineno else (path or '<input>')
+        super().__init__(f"{where}: {message}")
+
+
+# Characters allowed in sequence payloads (IUPAC nucleotide codes)
+SEQUENCE_CHARS = frozenset('ACGTURYSWKMBDHVNacgturyswkmbdhvn')
+
+# Sequence line keyword -> (is_double_stranded, is_circular)
+SEQUENCE_KINDS = {
+    'oligo': (False, False),
+    'dsdna': (True, False),
+    'plasmid': (True, True),
+}
+
+# Case-insensitive lookup of enzymes by Reagent name or value, e.g. 'EcoRI' or 'hindiii'
+_REAGENTS = {}
+for _reagent in Reagent:
+    _REAGENTS[_reagent.name.lower()] = _reagent
+    _REAGENTS[_reagent.value.lower()] = _reagent
+
+
+class ConstructionFileParser:
+    '''
+    Streaming parser for the tab/space-separated construction file text format, e.g.
+
+        PCR        ca1067F   ca1067R     pSB1AK3-b0015  pcrpdt
+        Digest     pcrpdt    EcoRI,SpeI  1              pcrdig
+        Ligate     pcrdig    vectdig     pSB1A2-Bca9128
+        Transform  pSB1A2-Bca9128  Mach1  Amp  37  product
+
+        oligo      ca1067F   ccagtGAATTC...
+        plasmid    pSB1AK3-b0015  cagaaatcat...
+
+    A file may hold several construction files: a step line that follows sequence lines starts the next one.
+    Long sequences may be wrapped; a line holding only sequence characters continues the sequence above it.
+    Lines starting with '#' are comments.
+    '''
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, chunkSize: int = CHUNK_SIZE):
+        self.chunkSize = chunkSize
+
+    def iter_lines(self, f) -> Iterator[tuple]:
+        '''
+        Reads an open text file in fixed-size chunks and yields its lines.
+
+        Parameters:
+            f: an open text file
+
+        Returns:
+            An iterator of (line number, line without its newline) tuples.
+        '''
+        lineno = 0
+        pending = []
+        while True:
+            chunk = f.read(self.chunkSize)
+            if not chunk:
+                break
+            start = 0
+            end = chunk.find('\n')
+            while end != -1:
+                lineno += 1
+                if pending:
+                    pending.append(chunk[start:end])
+                    yield lineno, ''.join(pending).rstrip('\r')
+                    pending = []
+                else:
+                    yield lineno, chunk[start:end].rstrip('\r')
+                start = end + 1
+                end = chunk.find('\n', start)
+            if start < len(chunk):
+                pending.append(chunk[start:])
+        if pending:
+            yield lineno + 1, ''.join(pending).rstrip('\r')
+
+    def iter_construction_files(self, inpath: str) -> Iterator[ConstructionFile]:
+        '''
+        Lazily parses a construction file text file.
+
+        Parameters:
+            inpath: The path of the construction file text file.
+
+        Returns:
+            An iterator of ConstructionFile objects, one per construction file in the input.
+        '''
+        with open(inpath, 'r') as f:
+            try:
+                yield from self.iter_from_lines(self.iter_lines(f))
+            except CFParseError as e:
+                raise CFParseError(e.message, e.lineno, inpath) from None
+
+    def iter_from_lines(self, lines) -> Iterator[ConstructionFile]:
+        '''
+        Parameters:
+            lines: an iterable of (line number, line) tuples, as produced by iter_lines
+        Returns:
+            An iterator of ConstructionFile objects.
+        '''
+        steps = []
+        sequences = {}
+        seqParts = None     # pieces of the sequence being read, while continuation lines may follow
+        seqInfo = None      # (name, kind) for the sequence being read
+
+        for lineno, line in lines:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                if seqInfo:
+                    sequences[seqInfo[0]] = self.make_polynucleotide(seqInfo, seqParts)
+                    seqInfo = seqParts = None
+                continue
+
+            tokens = stripped.split()
+            keyword = tokens[0]
+
+            if seqInfo and len(tokens) == 1 and keyword.lower() not in SEQUENCE_KINDS:
+                self.check_sequence(keyword, lineno)
+                seqParts.append(keyword)
+                continue
+            if seqInfo:
+                sequences[seqInfo[0]] = self.make_polynucleotide(seqInfo, seqParts)
+                seqInfo = seqParts = None
+
+            kind = keyword.lower()
+            if kind in SEQUENCE_KINDS:
+                if len(tokens) < 2:
+                    raise CFParseError(f"'{keyword}' line needs a name", lineno)
+                if tokens[1] in sequences:
+                    raise CFParseError(f"Duplicate sequence name '{tokens[1]}'", lineno)
+                for part in tokens[2:]:
+                    self.check_sequence(part, lineno)
+                seqInfo = (tokens[1], kind)
+                seqParts = tokens[2:]
+                continue
+
+            if sequences:
+                # a step after the sequence block starts the next construction file
+                yield ConstructionFile(steps, sequences)
+                steps = []
+                sequences = {}
+            steps.append(self.parse_step(tokens, lineno))
+
+        if seqInfo:
+            sequences[seqInfo[0]] = self.make_polynucleotide(seqInfo, seqParts)
+        if steps or sequences:
+            yield ConstructionFile(steps, sequences)
+
+    def parse_file(self, inpath: str) -> List[ConstructionFile]:
+        '''
+        Parameters:
+            inpath: The path of the construction file text file.
+        Returns:
+            A list of every ConstructionFile in the file.
+        '''
+        return list(self.iter_construction_files(inpath))
+
+    def parse_directory(self, indir: str, maxWorkers: int = None, suffix: str = '.txt') -> Dict[str, List[ConstructionFile]]:
+        '''
+        Parses every construction file in a directory, one file per worker process.
+
+        Parameters:
+            indir: The directory containing construction file text files.
+            maxWorkers: the number of worker processes (defaults to the CPU count)
+            suffix: only files ending with this suffix are parsed
+
+        Returns:
+            A dictionary of file path -> list of ConstructionFile objects, in sorted path order.
+        '''
+        paths = [os.path.join(indir, name) for name in sorted(os.listdir(indir)) if name.endswith(suffix)]
+        with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+            results = executor.map(self.parse_file, paths)
+            return dict(zip(paths, results))
+
+    def check_sequence(self, sequence: str, lineno: int):
+        '''
+        Raises a CFParseError if the sequence holds anything other than IUPAC nucleotide codes.
+        '''
+        if not SEQUENCE_CHARS.issuperset(sequence):
+            bad = sorted(set(sequence) - SEQUENCE_CHARS)
+            raise CFParseError(f"Invalid sequence characters {''.join(bad)!r}", lineno)
+
+    def make_polynucleotide(self, seqInfo, seqParts) -> Polynucleotide:
+        name, kind = seqInfo
+        doubleStranded, circular = SEQUENCE_KINDS[kind]
+        return Polynucleotide(''.join(seqParts), is_double_stranded=doubleStranded, is_circular=circular)
+
+    def parse_enzyme(self, name: str, lineno: int) -> Reagent:
+        enzyme = _REAGENTS.get(name.lower())
+        if enzyme is None:
+            raise CFParseError(f"Unknown enzyme '{name}'", lineno)
+        return enzyme
+
+    def parse_step(self, tokens: List[str], lineno: int) -> Step:
+        '''
+        Parameters:
+            tokens: the whitespace-separated fields of a step line
+            lineno: the line number, for error messages
+        Returns:
+            The Step subclass instance for the line.
+        '''
+        op = tokens[0]
+        args = tokens[1:]
+        key = op.lower()
+
+        def expect(counts):
+            if len(args) not in counts:
+                wanted = ' or '.join(str(c) for c in counts)
+                raise CFParseError(f"{op} takes {wanted} fields, got {len(args)}", lineno)
+
+        if key == 'pcr':
+            expect((4, 5))
+            fwd, rev, template, output = args[:4]
+            size = self.parse_int(args[4], 'product size', lineno) if len(args) == 5 else None
+            return PCR('PCR', output, fwd, rev, template, size)
+        if key == 'digest':
+            expect((4, 5))
+            dna, enzymes, fragSelect, output = args[:4]
+            size = self.parse_int(args[4], 'product size', lineno) if len(args) == 5 else None
+            return Digest('Digest', output, dna, [self.parse_enzyme(e, lineno) for e in enzymes.split(',')],
+                          fragSelect, size)
+        if key == 'ligate':
+            if len(args) < 2:
+                raise CFParseError("Ligate needs at least one DNA and a product", lineno)
+            return Ligate('Ligate', args[-1], args[:-1])
+        if key in ('goldengate', 'gg'):
+            if len(args) < 3:
+                raise CFParseError("GoldenGate needs DNAs, an enzyme and a product", lineno)
+            return GoldenGate('Golden Gate', args[-1], args[:-2], self.parse_enzyme(args[-2], lineno))
+        if key == 'gibson':
+            if len(args) < 2:
+                raise CFParseError("Gibson needs at least one DNA and a product", lineno)
+            return Gibson('Gibson', args[-1], args[:-1])
+        if key == 'transform':
+            expect((4, 5))
+            dna, strain, antibiotics = args[:3]
+            temperature = self.parse_int(args[3], 'temperature', lineno) if len(args) == 5 else None
+            return Transform('Transform', args[-1], dna, strain, antibiotics.split(','), temperature)
+        raise CFParseError(f"Unknown operation '{op}'", lineno)
+
+    def parse_int(self, value: str, what: str, lineno: int) -> int:
+        try:
+            return int(value)
+        except ValueError:
+            raise CFParseError(f"Expected an integer {what}, got '{value}'", lineno) from None
+
+    def format_construction_file(self, cf: ConstructionFile) -> str:
+        '''
+        Parameters:
+            cf: a ConstructionFile object
+        Returns:
+            the construction file in the text format read by this parser
+        '''
+        lines = []
+        for step in cf.steps:
+            if isinstance(step, PCR):
+                fields = [step.forward_oligo, step.reverse_oligo, step.template, step.output]
+                if step.product_size is not None:
+                    fields.append(str(step.product_size))
+            elif isinstance(step, Digest):
+                enzymes = ','.join(e.name if isinstance(e, Reagent) else str(e) for e in step.enzymes)
+                fields = [step.dna, enzymes, str(step.fragSelect), step.output]
+                if step.product_size is not None:
+                    fields.append(str(step.product_size))
+            elif isinstance(step, GoldenGate):
+                enzyme = step.enzyme.name if isinstance(step.enzyme, Reagent) else str(step.enzyme)
+                fields = list(step.dnas) + [enzyme, step.output]
+            elif isinstance(step, (Ligate, Gibson)):
+                fields = list(step.dnas) + [step.output]
+            elif isinstance(step, Transform):
+                fields = [step.dna, step.strain, ','.join(step.antibiotics)]
+                if step.temperature is not None:
+                    fields.append(str(step.temperature))
+                fields.append(step.output)
+            else:
+                raise ValueError(f"Cannot format step type: {type(step).__name__}")
+            op = 'GoldenGate' if isinstance(step, GoldenGate) else step.operation
+            lines.append('\t'.join([op] + fields))
+
+        if cf.sequences:
+            lines.append('')
+            for name, poly in cf.sequences.items():
+                sequence = poly.sequence if isinstance(poly, Polynucleotide) else poly
+                if isinstance(poly, Polynucleotide) and poly.is_circular:
+                    kind = 'plasmid'
+                elif isinstance(poly, Polynucleotide) and poly.is_double_stranded:
+                    kind = 'dsdna'
+                else:
+                    kind = 'oligo'
+                lines.append(f"{kind}\t{name}\t{sequence}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,149 @@
+"""
+Autoprotocol container refs for inventory tubes, reagent stocks and reaction plates.
+
+A ContainerRefManager gives each physical container one ref per protocol: every inventory Location
+is a tube named "<box>_<row letter><col>", every reagent stock a tube named "stock_<reagent>", and
+asking again returns the cached Well. Names do not depend on the protocol, so a manager can be
+bound to each protocol of a batch in turn and the same tube keeps the same name (and site
+container id, when one is known) in all of them.
+"""
+from string import ascii_uppercase as alcU
+from typing import Dict, Iterable, Tuple
+from src.models.inventory import *
+from src.models.labplanner import *
+
+TUBE = "micro-1.5"
+STOCK_TUBE = "micro-1.5"
+TUBE_STORAGE = "cold_20"
+
+
+def tube_name(location: Location) -> str:
+    return f"{location.boxname}_{alcU[location.row]}{location.col + 1}"
+
+
+def stock_name(reagent: Reagent) -> str:
+    return f"stock_{reagent.name}"
+
+
+def sheet_locations(lab_sheet: LabSheet) -> Iterable[Location]:
+    """
+    Yields every Location in a sheet's sources and destinations, whatever the row shape.
+    """
+    stack = [lab_sheet.destinations, lab_sheet.sources]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, Location):
+            yield item
+        elif isinstance(item, (list, tuple)):
+            stack.extend(reversed(item))
+
+
+class ContainerRefManager:
+    """
+    Creates and caches the refs of one protocol at a time (see bind).
+    """
+
+    def __init__(self, containerIds: Dict[str, str] = None, inventory: Inventory = None,
+                 tubeType: str = TUBE, stockType: str = STOCK_TUBE):
+        '''
+        Parameters:
+            containerIds: the site's ids for existing containers, by ref name; tubes listed here
+                are referenced rather than created new
+            inventory: used to label each tube's well with the sample it holds
+            tubeType: the container type of inventory tubes
+            stockType: the container type of reagent stock tubes
+        '''
+        self.containerIds = dict(containerIds or {})
+        self.tubeType = tubeType
+        self.stockType = stockType
+        self.samples = {}
+        if inventory is not None:
+            self.add_inventory(inventory)
+        self.protocol = None
+        self.wells: Dict[str, object] = {}   # ref name -> Well, for the bound protocol
+        self.plates = []
+        self.created = 0                      # refs created, over every protocol bound so far
+
+    def add_inventory(self, inventory: Inventory):
+        """
+        Indexes an inventory's samples by tube name, for labelling tube wells.
+        """
+        for box in inventory.boxes:
+            for row, samples in enumerate(box.samples):
+                for col, sample in enumerate(samples):
+                    if sample is not None:
+                        self.samples[f"{box.name}_{alcU[row]}{col + 1}"] = sample
+
+    def bind(self, protocol):
+        """
+        Starts handing out refs in protocol. Refs already made for another protocol are dropped,
+        since a ref belongs to one protocol; names and container ids carry over.
+        """
+        if protocol is not self.protocol:
+            self.protocol = protocol
+            self.wells = {}
+            self.plates = []
+        return self
+
+    def _ref(self, name: str, contType: str, storage: str):
+        self.created += 1
+        containerId = self.containerIds.get(name)
+        if containerId is not None:
+            return self.protocol.ref(name, id=containerId, cont_type=contType, storage=storage)
+        return self.protocol.ref(name, cont_type=contType, storage=storage)
+
+    def tube(self, location: Location):
+        """
+        Returns the Well of the tube at an inventory Location.
+        """
+        name = tube_name(location)
+        well = self.wells.get(name)
+        if well is None:
+            well = self.wells[name] = self._ref(name, self.tubeType, TUBE_STORAGE).well(0)
+            sample = self.samples.get(name)
+            if sample is not None:
+                well.set_name(sample.label)
+                well.add_properties({"construct": sample.construct, "concentration": sample.concentration.value})
+        return well
+
+    def stock(self, reagent: Reagent):
+        """
+        Returns the Well of a reagent's stock tube.
+        """
+        name = stock_name(reagent)
+        well = self.wells.get(name)
+        if well is None:
+            well = self.wells[name] = self._ref(name, self.stockType, TUBE_STORAGE).well(0)
+            well.set_name(reagent.value)
+        return well
+
+    def box(self, box: Box) -> Dict[Tuple[int, int], object]:
+        """
+        Returns {(row, col): Well} for every occupied position of a Box.
+        """
+        return {(row, col): self.tube(Location(box.name, row, col, sample.label, sample.sidelabel))
+                for row, samples in enumerate(box.samples)
+                for col, sample in enumerate(samples) if sample is not None}
+
+    def plate(self, prefix: str, contType: str, storage: str = "cold_4", name: str = None):
+        """
+        Returns a new plate, named name, or by prefix and the number of plates in the protocol so far.
+        """
+        plate = self._ref(name or f"{prefix}_{len(self.plates)}", contType, storage)
+        self.plates.append(plate)
+        return plate
+
+    def resolve(self, lab_packet: LabPacket) -> Dict[str, object]:
+        """
+        Creates the tube refs for every Location on every sheet of a packet in one pass, each once.
+
+        Returns:
+            {tube name: Well} for the packet's tubes.
+        """
+        names = {}
+        for sheet in lab_packet.labsheets:
+            for location in sheet_locations(sheet):
+                name = tube_name(location)
+                if name not in names:
+                    names[name] = location
+        return {name: self.tube(names[name]) for name in sorted(names)}
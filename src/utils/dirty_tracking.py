@@ -0,0 +1,78 @@
+"""
+Per-box change tracking for incremental saves.
+
+Inventory and Box are frozen dataclasses, so the tracking state is attached with object.__setattr__
+and is not a dataclass field: it never shows up in equality, repr or serialization.
+
+An Inventory is either untracked (nothing is known, so every box must be written) or tracked, with
+the set of box indexes changed since it was last saved. InventoryFactory.run marks the boxes it adds;
+anything else that edits a box or the lookup entries of its samples should call mark_dirty.
+A tracked inventory also carries the lookup entries that belong to no box sample (see
+locations.extra_lookups_to_dict), which a full save computes once and later saves reuse.
+"""
+
+from typing import Iterable, Optional
+from src.models.inventory import *
+
+_DIRTY = "_dirty_boxes"
+_EXTRA = "_extra_lookups"
+_SAVED = "_saved_hashes"
+
+
+def track(inventory: Inventory, dirty: Iterable[int] = (), extra: Optional[dict] = None):
+    """
+    Starts tracking an inventory, with the given box indexes marked as changed and its extra lookup entries.
+    """
+    object.__setattr__(inventory, _DIRTY, set(dirty))
+    object.__setattr__(inventory, _EXTRA, extra)
+
+
+def extra_lookups(inventory: Inventory) -> Optional[dict]:
+    """
+    Returns the extra lookup entries recorded for a tracked inventory.
+    """
+    return getattr(inventory, _EXTRA, None)
+
+
+def dirty_boxes(inventory: Inventory) -> Optional[set]:
+    """
+    Returns the indexes of boxes changed since the last save, or None for an untracked inventory.
+    """
+    return getattr(inventory, _DIRTY, None)
+
+
+def mark_dirty(inventory: Inventory, indexes: Iterable[int]):
+    """
+    Marks boxes as changed. An untracked inventory stays untracked, since all its boxes already count as changed.
+    """
+    dirty = dirty_boxes(inventory)
+    if dirty is not None:
+        dirty.update(indexes)
+
+
+def mark_clean(inventory: Inventory, extra: Optional[dict] = None):
+    """
+    Records that every box has been saved, along with the extra lookup entries that were written.
+    """
+    track(inventory, (), extra)
+
+
+def copy_tracking(source: Inventory, target: Inventory, added: Iterable[int] = ()):
+    """
+    Gives target the tracking state of source plus the added box indexes. If source is None the
+    target is tracked with only the added boxes dirty; if source is untracked so is target.
+    """
+    dirty = set() if source is None else dirty_boxes(source)
+    if dirty is not None:
+        track(target, dirty | set(added), None if source is None else extra_lookups(source))
+
+
+def saved_hashes(box: Box) -> Optional[tuple]:
+    """
+    Returns the content hashes of the files last written for a box, or None if it was never saved.
+    """
+    return getattr(box, _SAVED, None)
+
+
+def remember_saved(box: Box, hashes: tuple):
+    object.__setattr__(box, _SAVED, hashes)
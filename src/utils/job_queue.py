@@ -0,0 +1,350 @@
+"""
+A persistent planning job queue with per-stage checkpoints, in SQLite.
+
+A job plans one experiment through four stages, each checkpointed in the binary format
+(utils/binary_format.py) as soon as it finishes:
+
+    parse       the ConstructionFiles read from the job's construction file paths
+    inventory   the Inventory InventoryFactory plans against the job's old inventory
+    packet      the LabPacket LabPacketFactory builds
+    save        what Saver.save_experiment wrote: {"dir", "files", "bytes"}
+
+The inventory checkpoint is the planned Inventory itself, not a delta against the old inventory
+file, so a resumed job never depends on that file being unchanged.
+
+Workers claim jobs with a lease. A stage's checkpoint, the job's stage and a renewed lease are
+committed in one transaction, and only while the worker still holds the job. A worker that crashes
+stops renewing; once its lease runs out, another worker claims the job and resumes after its last
+checkpoint. A stage that raises fails the job, keeping its checkpoints, so retry resumes it too.
+Any number of worker processes can drain one queue: claims are serialized by SQLite's write lock,
+and the database runs in WAL mode so status reads do not block them.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from src.factories.experiment_factory import ExperimentFactory
+from src.factories.inventory_factory import InventoryFactory
+from src.factories.lab_packet_factory import LabPacketFactory
+from src.models.experiment import *
+from src.models.inventory import *
+from src.models.labplanner import *
+from src.utils import profiling
+from src.utils.binary_format import decode_binary, encode_binary, read_binary
+from src.utils.cf_parser import ConstructionFileParser
+from src.utils.saver import Saver
+
+STAGES = ("parse", "inventory", "packet", "save")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# Seconds a claim lasts without a checkpoint before another worker may take the job over
+DEFAULT_LEASE = 300.0
+
+# Claims of one job (crashed workers included) before it is failed rather than claimed again
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Seconds a connection waits for another worker's write lock
+BUSY_TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    experiment_id TEXT NOT NULL,
+    cf_paths TEXT NOT NULL,
+    outdir TEXT NOT NULL,
+    inventory_path TEXT,
+    state TEXT NOT NULL,
+    stage TEXT,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    stage TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+_parser = ConstructionFileParser()
+_inventoryFactory = InventoryFactory()
+_labPacketFactory = LabPacketFactory()
+
+
+class LeaseLost(RuntimeError):
+    """
+    Raised when a worker checkpoints a job whose lease has passed to another worker.
+    """
+
+
+@dataclass(frozen=True)
+class QueuedJob:
+    jobId: int
+    name: str                       # experiment name
+    experimentId: str
+    cfPaths: Tuple[str, ...]        # construction file text files, parsed in order
+    outdir: str                     # Saver.save_experiment writes outdir/<name>
+    inventoryPath: Optional[str]    # the old inventory, written by write_binary, or None
+    stage: Optional[str]            # the last stage checkpointed
+    attempts: int
+    worker: Optional[str]
+
+
+def default_worker() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """
+    One connection to a job queue database.
+    """
+
+    def __init__(self, path: str, lease: float = DEFAULT_LEASE, maxAttempts: int = DEFAULT_MAX_ATTEMPTS):
+        '''
+        Parameters:
+            path: the SQLite database file, created if missing
+            lease: seconds a claim lasts without a checkpoint
+            maxAttempts: claims of one job before it is failed
+        '''
+        self.path = path
+        self.lease = lease
+        self.maxAttempts = maxAttempts
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self):
+        return _Transaction(self.db)
+
+    def submit(self, name: str, experimentId: str, cfPaths: Sequence[str], outdir: str,
+               inventoryPath: str = None) -> int:
+        """
+        Queues a job.
+
+        Parameters:
+            name, experimentId: the experiment's name and ID
+            cfPaths: the construction file text files to plan
+            outdir: where Saver.save_experiment writes the experiment
+            inventoryPath: the old inventory, as written by write_binary
+
+        Returns:
+            The job ID.
+        """
+        now = time.time()
+        cursor = self.db.execute(
+            "INSERT INTO jobs (name, experiment_id, cf_paths, outdir, inventory_path, state, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, experimentId, json.dumps(list(cfPaths)), outdir, inventoryPath, QUEUED, now, now))
+        return cursor.lastrowid
+
+    def claim(self, worker: str = None) -> Optional[QueuedJob]:
+        """
+        Claims the oldest queued job, or a running job whose lease has run out.
+
+        Returns:
+            The QueuedJob, or None when there is nothing to claim.
+        """
+        worker = worker or default_worker()
+        now = time.time()
+        with self._transaction():
+            # jobs whose workers keep crashing are failed instead of claimed again
+            self.db.execute(
+                "UPDATE jobs SET state = ?, error = ?, worker = NULL, updated = ?"
+                " WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, "lease expired too many times", now, RUNNING, now, self.maxAttempts))
+            row = self.db.execute(
+                "SELECT id FROM jobs WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY id LIMIT 1",
+                (QUEUED, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1, error = NULL,"
+                " updated = ? WHERE id = ?",
+                (RUNNING, worker, now + self.lease, now, row[0]))
+            return self.job(row[0])
+
+    def job(self, jobId: int) -> Optional[QueuedJob]:
+        row = self.db.execute(
+            "SELECT id, name, experiment_id, cf_paths, outdir, inventory_path, stage, attempts, worker"
+            " FROM jobs WHERE id = ?", (jobId,)).fetchone()
+        if row is None:
+            return None
+        return QueuedJob(row[0], row[1], row[2], tuple(json.loads(row[3])), row[4], row[5], row[6], row[7], row[8])
+
+    def checkpoint(self, job: QueuedJob, stage: str, data: bytes):
+        """
+        Stores a stage's output, advances the job's stage and renews its lease, in one transaction.
+
+        Raises:
+            LeaseLost: if the job is no longer running under job.worker
+        """
+        now = time.time()
+        with self._transaction():
+            updated = self.db.execute(
+                "UPDATE jobs SET stage = ?, lease_until = ?, updated = ? WHERE id = ? AND worker = ? AND state = ?",
+                (stage, now + self.lease, now, job.jobId, job.worker, RUNNING)).rowcount
+            if not updated:
+                raise LeaseLost(f"Job {job.jobId} is no longer held by {job.worker}")
+            self.db.execute("INSERT OR REPLACE INTO checkpoints (job_id, stage, data, created) VALUES (?, ?, ?, ?)",
+                            (job.jobId, stage, data, now))
+
+    def checkpoints(self, jobId: int) -> Dict[str, bytes]:
+        """
+        Returns {stage: checkpoint bytes} for the stages a job has completed.
+        """
+        return dict(self.db.execute("SELECT stage, data FROM checkpoints WHERE job_id = ?", (jobId,)))
+
+    def _finish(self, job: QueuedJob, state: str, error: str = None):
+        self.db.execute(
+            "UPDATE jobs SET state = ?, error = ?, worker = NULL, lease_until = NULL, updated = ?"
+            " WHERE id = ? AND worker = ?",
+            (state, error, time.time(), job.jobId, job.worker))
+
+    def complete(self, job: QueuedJob):
+        self._finish(job, DONE)
+
+    def fail(self, job: QueuedJob, error: str):
+        self._finish(job, FAILED, error)
+
+    def retry(self, jobId: int) -> bool:
+        """
+        Queues a failed job again; it resumes after its last checkpoint. Returns False if the job
+        has not failed.
+        """
+        return bool(self.db.execute(
+            "UPDATE jobs SET state = ?, attempts = 0, error = NULL, updated = ? WHERE id = ? AND state = ?",
+            (QUEUED, time.time(), jobId, FAILED)).rowcount)
+
+    def status(self, jobId: int) -> Optional[dict]:
+        """
+        Returns a job's state, last stage, attempts, worker and error.
+        """
+        row = self.db.execute("SELECT state, stage, attempts, worker, error FROM jobs WHERE id = ?", (jobId,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("state", "stage", "attempts", "worker", "error"), row))
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns the number of jobs in each state.
+        """
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+
+class _Transaction:
+    """
+    BEGIN IMMEDIATE ... COMMIT, rolled back on an exception; IMMEDIATE takes the write lock up front,
+    so two workers never both read a job as claimable.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, excType, exc, tb):
+        self.db.execute("ROLLBACK" if excType else "COMMIT")
+
+
+def run_job(queue: JobQueue, job: QueuedJob, saver: Saver = None) -> Experiment:
+    """
+    Runs a claimed job's stages, skipping those already checkpointed.
+
+    Returns:
+        The planned Experiment.
+    """
+    done = queue.checkpoints(job.jobId)
+
+    if "parse" in done:
+        cfList = decode_binary(done["parse"], list)
+    else:
+        with profiling.stage("job.parse"):
+            cfList = [cf for path in job.cfPaths for cf in _parser.parse_file(path)]
+        queue.checkpoint(job, "parse", encode_binary(cfList))
+
+    if "inventory" in done:
+        inventory = decode_binary(done["inventory"], Inventory)
+    else:
+        with profiling.stage("job.inventory"):
+            oldInventory = read_binary(job.inventoryPath, Inventory) if job.inventoryPath else None
+            inventory = _inventoryFactory.run(job.name, job.experimentId, cfList, oldInventory)
+        queue.checkpoint(job, "inventory", encode_binary(inventory))
+
+    if "packet" in done:
+        packet = decode_binary(done["packet"], LabPacket)
+    else:
+        with profiling.stage("job.lab_packet"):
+            packet = _labPacketFactory.run(job.name, cfList, inventory)
+        queue.checkpoint(job, "packet", encode_binary(packet))
+
+    experiment = Experiment(job.name, cfList, None, ExperimentFactory().collectSequences(cfList), packet, inventory)
+    if "save" not in done:
+        with profiling.stage("job.save"):
+            stats = (saver or Saver()).save_experiment(experiment, job.outdir)
+        queue.checkpoint(job, "save", encode_binary({"dir": os.path.join(job.outdir, job.name),
+                                                     "files": stats.files, "bytes": stats.bytes}))
+    return experiment
+
+
+def work(path: str, worker: str = None, lease: float = DEFAULT_LEASE, maxJobs: int = None) -> int:
+    """
+    Claims and runs jobs until the queue has none left to claim (or maxJobs have run). A job that
+    raises is failed with the error; one whose lease was lost is left to the worker that took it.
+
+    Returns:
+        The number of jobs this worker completed.
+    """
+    worker = worker or default_worker()
+    completed = 0
+    with JobQueue(path, lease) as queue:
+        while maxJobs is None or completed < maxJobs:
+            job = queue.claim(worker)
+            if job is None:
+                break
+            try:
+                run_job(queue, job)
+            except LeaseLost:
+                continue
+            except Exception as e:
+                queue.fail(job, f"{type(e).__name__}: {e}")
+                continue
+            queue.complete(job)
+            completed += 1
+    return completed
+
+
+def drain(path: str, workers: int = None, lease: float = DEFAULT_LEASE) -> int:
+    """
+    Drains a queue with several worker processes at once.
+
+    Returns:
+        The number of jobs completed.
+    """
+    workers = workers or os.cpu_count() or 1
+    JobQueue(path).close()      # create the schema before the workers race to
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(work, path, None, lease) for _ in range(workers)]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,153 @@
+import json
+from dataclasses import fields, is_dataclass
+from enum import Enum
+from src.models.inventory import *
+from src.models.labplanner import *
+from src.models.experiment import *
+from src.utils.serialization import serialize, location_to_string
+
+# Dataclasses whose fields are written one at a time; anything else is small enough to
+# serialize and encode in one piece.
+STREAMED_TYPES = (Experiment, LabPacket, LabSheet, Inventory, ConstructionFile)
+
+# Lists, sets and dicts longer than this are written item by item
+STREAM_THRESHOLD = 32
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+
+class JSONStreamWriter:
+    """
+    Writes an object as JSON incrementally, walking dataclasses and large containers instead of
+    building the complete nested dict first. The output is identical to
+    json.dump(serialize(obj), f, indent=indent), or to separators=(",", ":") in compact mode,
+    so it can be read back with json.load and deserialize.
+    """
+
+    def __init__(self, f, indent: int = 4, compact: bool = False, chunkSize: int = DEFAULT_CHUNK_SIZE):
+        """
+        Parameters:
+            f: a writable text file
+            indent: spaces per nesting level (ignored when compact)
+            compact: write without whitespace between tokens
+            chunkSize: buffered characters written to f at a time
+        """
+        self.f = f
+        self.compact = compact
+        self.indent = None if compact or indent is None else " " * indent
+        self.chunkSize = chunkSize
+        self.itemSeparator = "," if compact or indent is not None else ", "
+        self.keySeparator = ":" if compact else ": "
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        if compact:
+            self.encoder = json.JSONEncoder(separators=(",", ":"))
+        else:
+            self.encoder = json.JSONEncoder(indent=indent)
+
+    def write(self, obj):
+        """
+        Writes obj as JSON and flushes the remaining buffer.
+        """
+        self._value(obj, 0)
+        self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.f.write("".join(self.buffer))
+            self.written += self.buffered
+            self.buffer = []
+            self.buffered = 0
+
+    def _emit(self, text):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.chunkSize:
+            self.flush()
+
+    def _newline(self, level):
+        return "\n" + self.indent * level if self.indent is not None else ""
+
+    def _value(self, value, level):
+        if isinstance(value, Enum) or isinstance(value, type):
+            self._leaf(value, level)
+        elif is_dataclass(value) and isinstance(value, STREAMED_TYPES):
+            self._object(((field.name, getattr(value, field.name)) for field in fields(value)),
+                         bool(fields(value)), level)
+        elif isinstance(value, (list, tuple, set)) and (len(value) > STREAM_THRESHOLD or self._holdsStreamed(value)):
+            self._array(value, level)
+        elif isinstance(value, dict) and len(value) > STREAM_THRESHOLD:
+            self._object(((self._key(k), v) for k, v in value.items()), True, level)
+        else:
+            self._leaf(value, level)
+
+    def _holdsStreamed(self, items):
+        # e.g. the handful of LabSheets in a LabPacket, each of which can be large
+        return any(isinstance(item, STREAMED_TYPES) for item in items)
+
+    def _leaf(self, value, level):
+        text = self.encoder.encode(serialize(value))
+        if level and self.indent is not None and "\n" in text:
+            # JSON strings never hold raw newlines, so every newline here is indentation
+            text = text.replace("\n", self._newline(level))
+        self._emit(text)
+
+    def _array(self, items, level):
+        first = True
+        for item in items:
+            self._emit(("[" if first else self.itemSeparator) + self._newline(level + 1))
+            first = False
+            self._value(item, level + 1)
+        self._emit("[]" if first else self._newline(level) + "]")
+
+    def _object(self, items, nonEmpty, level):
+        if not nonEmpty:
+            self._emit("{}")
+            return
+        first = True
+        for key, value in items:
+            self._emit(("{" if first else self.itemSeparator) + self._newline(level + 1)
+                       + json.dumps(key) + self.keySeparator)
+            first = False
+            self._value(value, level + 1)
+        self._emit("{}" if first else self._newline(level) + "}")
+
+    def _key(self, key):
+        """
+        Converts a dict key the way serialize and json.dump would.
+        """
+        if key.__class__ is str:
+            return key
+        if key.__class__ is Location:
+            return location_to_string(key)
+        key = serialize(key)
+        if key is True:
+            return "true"
+        if key is False:
+            return "false"
+        if key is None:
+            return "null"
+        if isinstance(key, float):
+            return float.__repr__(key)
+        return str(key)
+
+
+def stream_json(obj, filepath: str, indent: int = 4, compact: bool = False, chunkSize: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes obj to filepath as JSON without materializing the serialized form.
+
+    Parameters:
+        obj: the object to write, e.g. an Experiment
+        filepath: the output path
+        indent: spaces per nesting level (ignored when compact)
+        compact: write without whitespace between tokens
+        chunkSize: buffered characters written at a time
+
+    Returns:
+        The number of characters written.
+    """
+    with open(filepath, "w") as f:
+        writer = JSONStreamWriter(f, indent, compact, chunkSize)
+        writer.write(obj)
+    return writer.written
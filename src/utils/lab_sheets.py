@@ -0,0 +1,436 @@
+"""
+The labsheet text format, written by Saver and read back by Deserializer.
+
+A sheet file is:
+
+    <title>
+    Type: <sheet type>
+    Program: <program>          \
+    Protocol: <protocol>         > each omitted when None
+    Instrument: <instrument>    /
+    Reaction:       one row per reagent, <volume>uL<TAB><reagent>
+    Mastermix:      likewise
+    Steps:          one row per step, <step type><TAB><fields>
+    Sources:        one row per source
+    Destinations:   one row per destination
+    Notes:          each note on a "- " line, continued on lines indented by two spaces
+
+The recipe sections are written when present and the list sections when non-empty. The columns of
+source and destination rows come from SHEET_LAYOUTS, one entry per sheet type, and those of step
+rows from STEP_COLUMNS; each column renders and parses its own cells, so the writer and the parser
+are driven by the same table. A Location takes three cells: label, box/well, sidelabel. None is an
+empty cell.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from string import ascii_uppercase as alcU
+from typing import Iterable, List, Tuple
+from src.models.inventory import *
+from src.models.labplanner import *
+
+# Directories with fewer sheets than this are parsed in-process: starting workers costs more
+PARALLEL_THRESHOLD = 256
+
+
+class LabSheetFormatError(ValueError):
+    """
+    Raised for a labsheet file that does not follow the format, with the line number of the problem.
+    """
+    def __init__(self, message: str, lineno: int = None, path: str = None):
+        self.message = message
+        self.lineno = lineno
+        self.path = path
+        where = f"{path or '<input>'}:{lineno}" if lineno else (path or '<input>')
+        super().__init__(f"{where}: {message}")
+
+
+class Column:
+    """
+    One value in a row: how many cells it takes, and how to render and parse them.
+    """
+    width = 1
+
+    def render(self, value) -> List[str]:
+        return ["" if value is None else str(value)]
+
+    def parse(self, cells: List[str]):
+        return cells[0] or None
+
+
+class IntColumn(Column):
+    def parse(self, cells):
+        return int(cells[0]) if cells[0] else None
+
+
+class NumberColumn(Column):
+    def parse(self, cells):
+        if not cells[0]:
+            return None
+        return int(cells[0]) if cells[0].lstrip("-").isdigit() else float(cells[0])
+
+
+class EnumColumn(Column):
+    def __init__(self, enum):
+        self.enum = enum
+        self.members = {member.value: member for member in enum}
+
+    def render(self, value):
+        return ["" if value is None else value.value]
+
+    def parse(self, cells):
+        if not cells[0]:
+            return None
+        member = self.members.get(cells[0])
+        if member is None:
+            raise ValueError(f"'{cells[0]}' is not a {self.enum.__name__}")
+        return member
+
+
+class ListColumn(Column):
+    """
+    A list written as one comma-separated cell.
+    """
+    def __init__(self, item: Column):
+        self.item = item
+
+    def render(self, values):
+        return [", ".join(self.item.render(value)[0] for value in values)]
+
+    def parse(self, cells):
+        return [self.item.parse([item]) for item in cells[0].split(", ")] if cells[0] else []
+
+
+class LocationColumn(Column):
+    width = 3
+
+    def render(self, location):
+        return [location.label or "", f"{location.boxname}/{alcU[location.row]}{location.col}", location.sidelabel or ""]
+
+    def parse(self, cells):
+        boxname, _, well = cells[1].rpartition("/")
+        return Location(boxname, alcU.index(well[0]), int(well[1:]), cells[0] or None, cells[2] or None)
+
+
+TEXT = Column()
+INT = IntColumn()
+NUMBER = NumberColumn()
+CONCENTRATION = EnumColumn(Concentration)
+REAGENT = EnumColumn(Reagent)
+TEXT_LIST = ListColumn(TEXT)
+REAGENT_LIST = ListColumn(REAGENT)
+LOCATION = LocationColumn()
+
+
+@dataclass(frozen=True)
+class Rows:
+    """
+    The columns of the rows of one list section. A grouped section holds a list of lists (the
+    sources of each ligation), and each row starts with the index of its group.
+    """
+    columns: Tuple[Column, ...]
+    grouped: bool = False
+
+    def __post_init__(self):
+        spans, start = [], 0
+        for column in self.columns:
+            spans.append((column, start, start + column.width))
+            start += column.width
+        object.__setattr__(self, "width", start)
+        object.__setattr__(self, "spans", tuple(spans))
+
+
+@dataclass(frozen=True)
+class SheetLayout:
+    sources: Rows
+    destinations: Rows
+
+
+_LOCATED = Rows((LOCATION, TEXT))
+_INSTRUMENT = Rows((TEXT,))
+
+# Sheet type -> the layout of its sources and destinations, matching what LabPacketFactory builds
+SHEET_LAYOUTS = {
+    PCR: SheetLayout(Rows((LOCATION, TEXT, CONCENTRATION)), _LOCATED),
+    Digest: SheetLayout(_LOCATED, _LOCATED),
+    Ligate: SheetLayout(Rows((LOCATION, TEXT), grouped=True), _LOCATED),
+    GoldenGate: SheetLayout(_LOCATED, _LOCATED),
+    Gibson: SheetLayout(_LOCATED, _LOCATED),
+    Transform: SheetLayout(_LOCATED, Rows((LOCATION, TEXT, TEXT, TEXT_LIST, INT))),
+    Pick: SheetLayout(_LOCATED, Rows((LOCATION, TEXT, TEXT, TEXT_LIST, INT))),
+    Miniprep: SheetLayout(_LOCATED, Rows((LOCATION, TEXT, TEXT))),
+    Gel: SheetLayout(_INSTRUMENT, Rows((LOCATION, TEXT, INT))),
+    Zymo: SheetLayout(_INSTRUMENT, _LOCATED),
+}
+
+# Step type -> the columns of its fields after operation, which each type's __post_init__ sets
+STEP_COLUMNS = {
+    PCR: Rows((TEXT, TEXT, TEXT, TEXT, INT)),
+    Digest: Rows((TEXT, TEXT, REAGENT_LIST, TEXT, INT)),
+    Ligate: Rows((TEXT, TEXT_LIST)),
+    GoldenGate: Rows((TEXT, TEXT_LIST, REAGENT)),
+    Gibson: Rows((TEXT, TEXT_LIST)),
+    Transform: Rows((TEXT, TEXT, TEXT, TEXT_LIST, INT)),
+    Pick: Rows((TEXT,)),
+    Miniprep: Rows((TEXT,)),
+    Gel: Rows((TEXT, TEXT, INT)),
+    Zymo: Rows((TEXT, NUMBER)),
+}
+
+_SHEET_TYPES = {cls.__name__: cls for cls in SHEET_LAYOUTS}
+_STEP_TYPES = {cls.__name__: cls for cls in STEP_COLUMNS}
+_HEADER_FIELDS = ("Program", "Protocol", "Instrument")
+_VOLUME = re.compile(r"^(.*)uL$")
+
+
+def _render_row(rows: Rows, entry) -> str:
+    cells = []
+    for column, value in zip(rows.columns, entry if isinstance(entry, tuple) else (entry,)):
+        cells.extend(column.render(value))
+    return "\t".join(cells)
+
+
+def _render_rows(rows: Rows, entries) -> Iterable[str]:
+    if not rows.grouped:
+        return (_render_row(rows, entry) for entry in entries)
+    return (f"{group}\t{_render_row(rows, entry)}" for group, members in enumerate(entries) for entry in members)
+
+
+def _render_step(step: Step) -> str:
+    rows = STEP_COLUMNS.get(type(step))
+    if rows is None:
+        raise ValueError(f"No labsheet format for step type {type(step).__name__}")
+    values = tuple(getattr(step, field.name) for field in fields(step) if field.name != "operation")
+    return f"{type(step).__name__}\t{_render_row(rows, values)}"
+
+
+def lab_sheet_lines(lab_sheet: LabSheet) -> Iterable[str]:
+    """
+    Yields the lines of a labsheet file, without newlines.
+    """
+    layout = SHEET_LAYOUTS.get(lab_sheet.sheetType)
+    if layout is None:
+        raise ValueError(f"No labsheet format for sheet type {lab_sheet.sheetType}")
+    yield lab_sheet.title
+    yield f"Type: {lab_sheet.sheetType.__name__}"
+    for name in _HEADER_FIELDS:
+        value = getattr(lab_sheet, name.lower())
+        if value is not None:
+            yield f"{name}: {value}"
+    recipe = lab_sheet.reaction
+    if recipe is not None:
+        for header, reagents in (("Reaction:", recipe.reaction), ("Mastermix:", recipe.mastermix)):
+            if reagents is not None:
+                yield header
+                yield from (f"{volume}uL\t{reagent.value}" for reagent, volume in reagents)
+    if lab_sheet.steps:
+        yield "Steps:"
+        yield from (_render_step(step) for step in lab_sheet.steps)
+    for header, rows, entries in (("Sources:", layout.sources, lab_sheet.sources),
+                                  ("Destinations:", layout.destinations, lab_sheet.destinations)):
+        if entries:
+            yield header
+            yield from _render_rows(rows, entries)
+    if lab_sheet.notes:
+        yield "Notes:"
+        for note in lab_sheet.notes:
+            first, *rest = note.split("\n")
+            yield "- " + first
+            yield from ("  " + line for line in rest)
+
+
+def render_lab_sheet(lab_sheet: LabSheet) -> str:
+    """
+    Returns the text of a labsheet file.
+    """
+    return "\n".join(lab_sheet_lines(lab_sheet)) + "\n"
+
+
+class LabSheetParser:
+    """
+    Parses a labsheet file in one pass, a line at a time: each line either names a section, which
+    switches the parser to that section's row handler, or is handed to the current handler.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.lineno = 0
+        self.title = None
+        self.sheetType = None
+        self.header = {}
+        self.recipe = {}
+        self.lists = {"Steps:": [], "Sources:": [], "Destinations:": [], "Notes:": []}
+        self.handler = self.header_line
+        self.rows = None
+        self.handlers = {
+            "Reaction:": self.reagent_line,
+            "Mastermix:": self.reagent_line,
+            "Steps:": self.step_line,
+            "Sources:": self.entry_line,
+            "Destinations:": self.entry_line,
+            "Notes:": self.note_line,
+        }
+        self.section = None
+
+    def error(self, message: str) -> LabSheetFormatError:
+        return LabSheetFormatError(message, self.lineno, self.path)
+
+    def feed(self, line: str):
+        self.lineno += 1
+        line = line.rstrip("\r\n")
+        if self.title is None:
+            self.title = line
+        elif self.section != "Notes:" and line in self.handlers:
+            if self.sheetType is None:
+                raise self.error("The Type line must come before any section")
+            self.section = line
+            self.handler = self.handlers[line]
+            if line in self.lists:
+                self.rows = self.lists[line]
+            else:
+                self.rows = self.recipe[line] = []
+        elif line or self.section == "Notes:":
+            self.handler(line)
+
+    def header_line(self, line: str):
+        name, sep, value = line.partition(": ")
+        if not sep:
+            name, value = line.rstrip(":"), ""
+        if name == "Type":
+            self.sheetType = _SHEET_TYPES.get(value)
+            if self.sheetType is None:
+                raise self.error(f"Unknown sheet type '{value}'")
+        elif name in _HEADER_FIELDS:
+            self.header[name.lower()] = value
+        else:
+            raise self.error(f"Unexpected line '{line}'")
+
+    def reagent_line(self, line: str):
+        volume, _, reagent = line.partition("\t")
+        match = _VOLUME.match(volume)
+        try:
+            self.rows.append((REAGENT.parse([reagent]), NUMBER.parse([match.group(1)])))
+        except (AttributeError, ValueError):
+            raise self.error(f"Bad reagent row '{line}'") from None
+
+    def split(self, rows: Rows, cells: List[str]) -> tuple:
+        if len(cells) != rows.width:
+            raise self.error(f"Expected {rows.width} cells, found {len(cells)}")
+        try:
+            return tuple([column.parse(cells[start:end]) for column, start, end in rows.spans])
+        except (IndexError, ValueError) as e:
+            raise self.error(f"Bad value in row: {e}") from None
+
+    def step_line(self, line: str):
+        name, _, rest = line.partition("\t")
+        cls = _STEP_TYPES.get(name)
+        if cls is None:
+            raise self.error(f"Unknown step type '{name}'")
+        self.rows.append(cls(name, *self.split(STEP_COLUMNS[cls], rest.split("\t"))))
+
+    def entry_line(self, line: str):
+        layout = SHEET_LAYOUTS[self.sheetType]
+        rows = layout.sources if self.section == "Sources:" else layout.destinations
+        cells = line.split("\t")
+        if rows.grouped:
+            try:
+                group = int(cells.pop(0))
+            except (IndexError, ValueError):
+                raise self.error(f"Bad group in row '{line}'") from None
+            # a row may only add to an existing group or start the next one
+            if group < 0 or group > len(self.rows):
+                raise self.error(f"Group {group} out of order in row '{line}'")
+            while len(self.rows) <= group:
+                self.rows.append([])
+            target = self.rows[group]
+        else:
+            target = self.rows
+        values = self.split(rows, cells)
+        target.append(values if len(values) > 1 else values[0])
+
+    def note_line(self, line: str):
+        if line.startswith("- "):
+            self.rows.append(line[2:])
+        elif line.startswith("  ") and self.rows:
+            self.rows[-1] += "\n" + line[2:]
+        else:
+            raise self.error(f"Bad note line '{line}'")
+
+    def finish(self) -> LabSheet:
+        if self.title is None or self.sheetType is None:
+            raise self.error("Missing the title or Type line")
+        reaction = None
+        if self.recipe:
+            reaction = Recipe(self.recipe.get("Mastermix:"), self.recipe.get("Reaction:"))
+        return LabSheet(
+            title=self.title,
+            sheetType=self.sheetType,
+            steps=self.lists["Steps:"],
+            sources=self.lists["Sources:"],
+            destinations=self.lists["Destinations:"],
+            program=self.header.get("program"),
+            protocol=self.header.get("protocol"),
+            instrument=self.header.get("instrument"),
+            notes=self.lists["Notes:"],
+            reaction=reaction,
+        )
+
+
+def parse_lab_sheet(lines: Iterable[str], path: str = None) -> LabSheet:
+    """
+    Parses the lines of a labsheet file (e.g. an open file, read lazily) into a LabSheet.
+    """
+    parser = LabSheetParser(path)
+    for line in lines:
+        parser.feed(line)
+    return parser.finish()
+
+
+def read_lab_sheet(filepath: str) -> LabSheet:
+    if not os.path.exists(filepath):
+        raise FileNotFoundError(f"LabSheet file not found: {filepath}")
+    with open(filepath, "r") as f:
+        return parse_lab_sheet(f, filepath)
+
+
+def lab_sheet_paths(indir: str) -> List[str]:
+    """
+    Returns the labsheet files of a lab packet directory, in packet order: Saver names them
+    <index>_<title>.txt, so they are sorted by the index, not the name.
+    """
+    names = [name for name in os.listdir(indir) if name.endswith(".txt")]
+    return [os.path.join(indir, name) for name in sorted(names, key=_packet_order)]
+
+
+def _packet_order(name: str) -> tuple:
+    prefix = name.split("_", 1)[0]
+    return (int(prefix) if prefix.isdigit() else float("inf"), name)
+
+
+def read_lab_sheets(paths: List[str], maxWorkers: int = None) -> List[LabSheet]:
+    """
+    Parses many labsheet files, on a process pool once there are PARALLEL_THRESHOLD or more and
+    more than one worker is available.
+
+    Parameters:
+        paths: The files to parse.
+        maxWorkers: The number of worker processes (defaults to the executor's default).
+
+    Returns:
+        The LabSheets, in the order of paths.
+    """
+    workers = maxWorkers or os.cpu_count() or 1
+    if len(paths) < PARALLEL_THRESHOLD or workers == 1:
+        return [read_lab_sheet(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_lab_sheet, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+
+def read_lab_packet(indir: str, maxWorkers: int = None) -> LabPacket:
+    """
+    Reads a lab packet directory written by Saver.save_lab_packet or Saver.save_experiment.
+    """
+    if not os.path.exists(indir):
+        raise FileNotFoundError(f"LabPacket directory not found: {indir}")
+    return LabPacket(labsheets=read_lab_sheets(lab_sheet_paths(indir), maxWorkers))
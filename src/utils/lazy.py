@@ -0,0 +1,217 @@
+"""
+Lazy views of an experiment directory written by Saver.save_experiment.
+
+LazyExperiment has the attributes of Experiment, but reads nothing until an attribute is used: the
+lab packet is a listing of the labpacket directory, each labsheet is parsed the first time it is
+indexed, and each box is read from its own {i}_Box.json shard. Everything loaded is cached, so
+looking up one sheet or one box in a large saved experiment reads one small file.
+
+The views are read-only; materialize() returns the equivalent plain dataclasses.
+"""
+import json
+import os
+from collections.abc import Sequence
+from functools import cached_property
+from typing import Callable, List
+from src.models.inventory import *
+from src.models.labplanner import *
+from src.models.experiment import *
+from src.utils.lab_sheets import lab_sheet_paths, read_lab_sheet, LabSheetParser
+from src.utils.locations import inventory_from_dicts
+from src.utils.parser import Parser
+from src.utils.serialization import deserialize
+
+_MISSING = object()
+
+
+class LazyList(Sequence):
+    """
+    A read-only list whose items are loaded by load(i) the first time they are accessed.
+    """
+
+    def __init__(self, count: int, load: Callable[[int], object]):
+        self._items = [_MISSING] * count
+        self._load = load
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self._items)))]
+        item = self._items[i]
+        if item is _MISSING:
+            item = self._items[i] = self._load(i % len(self._items))
+        return item
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Sequence) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"LazyList({self.loaded}/{len(self)} loaded)"
+
+    @property
+    def loaded(self) -> int:
+        """
+        The number of items loaded so far.
+        """
+        return sum(item is not _MISSING for item in self._items)
+
+
+class LazyLabPacket:
+    """
+    A lab packet directory: labsheets[i] parses the i-th sheet on first access.
+    """
+
+    def __init__(self, indir: str):
+        if not os.path.exists(indir):
+            raise FileNotFoundError(f"LabPacket directory not found: {indir}")
+        self.paths = lab_sheet_paths(indir)
+        self.labsheets = LazyList(len(self.paths), lambda i: read_lab_sheet(self.paths[i]))
+
+    def sheet_type(self, i: int) -> type:
+        """
+        Returns the type of the i-th sheet, reading only the head of its file.
+        """
+        parser = LabSheetParser(self.paths[i])
+        with open(self.paths[i], "r") as f:
+            for line in f:
+                parser.feed(line)
+                if parser.sheetType is not None:
+                    return parser.sheetType
+        raise parser.error("Missing the Type line")
+
+    def sheets_of_type(self, sheetType: type) -> List[LabSheet]:
+        """
+        Returns the sheets of one type, parsing only those.
+        """
+        return [self.labsheets[i] for i in range(len(self.paths)) if self.sheet_type(i) == sheetType]
+
+    def materialize(self) -> LabPacket:
+        return LabPacket(labsheets=list(self.labsheets))
+
+
+class LazyInventory:
+    """
+    An inventory directory with an inventory.json index: boxes[i] reads the i-th box shard on first
+    access. The lookup dicts need every shard, so using any of them reads the rest.
+    """
+
+    def __init__(self, indir: str, index: dict):
+        self.indir = indir
+        self.index = index
+        self._shards = {}
+        self.boxes = LazyList(len(index["boxes"]), lambda i: deserialize(self.shard(i)["box"], Box))
+
+    def shard(self, i: int) -> dict:
+        shard = self._shards.get(i)
+        if shard is None:
+            with open(os.path.join(self.indir, self.index["boxes"][i]), "r") as f:
+                shard = self._shards[i] = json.load(f)
+        return shard
+
+    @cached_property
+    def _lookups(self) -> Inventory:
+        # the boxes themselves are left to self.boxes, so loaded ones are not decoded twice
+        parts = [{key: value for key, value in self.shard(i).items() if key != "box"}
+                 for i in range(len(self.boxes))]
+        if self.index["extra"]:
+            parts.append(self.index["extra"])
+        return inventory_from_dicts(parts)
+
+    @property
+    def construct_to_locations(self):
+        return self._lookups.construct_to_locations
+
+    @property
+    def loc_to_conc(self):
+        return self._lookups.loc_to_conc
+
+    @property
+    def loc_to_clone(self):
+        return self._lookups.loc_to_clone
+
+    @property
+    def loc_to_culture(self):
+        return self._lookups.loc_to_culture
+
+    def materialize(self) -> Inventory:
+        """
+        Returns the whole Inventory, tracked and clean like one read by Parser.parse_inventory.
+        """
+        lookups = self._lookups
+        inventory = Inventory(list(self.boxes), lookups.construct_to_locations, lookups.loc_to_conc,
+                              lookups.loc_to_clone, lookups.loc_to_culture)
+        Parser().track_saved_inventory(self.indir, inventory, self.index["extra"])
+        return inventory
+
+
+class LazyExperiment:
+    """
+    An experiment directory written by Saver.save_experiment, loaded attribute by attribute.
+    """
+
+    def __init__(self, indir: str):
+        if not os.path.exists(indir):
+            raise FileNotFoundError(f"Input directory does not exist: {indir}")
+        self.indir = indir
+
+    @cached_property
+    def name(self) -> str:
+        if "_metadata" in self.__dict__:
+            return self._metadata["name"]
+        with open(os.path.join(self.indir, "metadata.txt"), "r") as f:
+            return f.readline().split(": ", 1)[1].strip()
+
+    @cached_property
+    def _metadata(self) -> dict:
+        from .deserializer import Deserializer
+        return Deserializer().deserialize_metadata(self.indir)
+
+    @property
+    def oligos(self):
+        return self._metadata["oligos"]
+
+    @property
+    def nameToPoly(self):
+        return self._metadata["nameToPoly"]
+
+    @cached_property
+    def cfs(self) -> list:
+        """
+        The construction files, from experiment.json when it was saved (empty otherwise).
+        """
+        path = os.path.join(self.indir, "experiment.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return deserialize(json.load(f)["cfs"], list[ConstructionFile])
+
+    @cached_property
+    def labPacket(self) -> LazyLabPacket:
+        return LazyLabPacket(os.path.join(self.indir, "labpacket"))
+
+    @cached_property
+    def inventory(self):
+        """
+        A LazyInventory for a directory with an inventory.json index; older layouts are read whole.
+        """
+        indir = os.path.join(self.indir, "inventory")
+        path = os.path.join(indir, "inventory.json")
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                index = json.load(f)
+            if "version" in index:
+                return LazyInventory(indir, index)
+        return Parser().parse_inventory(indir)
+
+    def materialize(self) -> Experiment:
+        inventory = self.inventory
+        return Experiment(
+            name=self.name,
+            cfs=self.cfs,
+            oligos=self.oligos,
+            nameToPoly=self.nameToPoly,
+            labPacket=self.labPacket.materialize(),
+            inventory=inventory.materialize() if isinstance(inventory, LazyInventory) else inventory,
+        )
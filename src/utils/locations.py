@@ -0,0 +1,203 @@
+from typing import Iterable, Iterator, List, Optional
+from src.models.inventory import *
+from src.utils.serialization import serialize, deserialize
+
+
+class LocationRegistry:
+    """
+    Assigns each distinct Location a stable integer ID, in first-seen order, so files can store one
+    location table and refer to locations by ID instead of formatting and re-parsing a string key
+    for every reference.
+    """
+
+    def __init__(self, locations=()):
+        self.locations: List[Location] = []
+        self.ids = {}
+        for location in locations:
+            self.register(location)
+
+    def register(self, location: Location) -> int:
+        """
+        Returns the ID of location, assigning the next free ID the first time it is seen.
+        """
+        location_id = self.ids.get(location)
+        if location_id is None:
+            location_id = self.ids[location] = len(self.locations)
+            self.locations.append(location)
+        return location_id
+
+    def location(self, location_id: int) -> Location:
+        """
+        Returns the Location registered under location_id.
+        """
+        return self.locations[location_id]
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __iter__(self) -> Iterator[Location]:
+        return iter(self.locations)
+
+    def __contains__(self, location) -> bool:
+        return location in self.ids
+
+    def to_table(self) -> list:
+        """
+        Returns the registry as a JSON-compatible list of [boxname, row, col, label, sidelabel] rows,
+        where a location's ID is its row index.
+        """
+        return [[loc.boxname, loc.row, loc.col, loc.label, loc.sidelabel] for loc in self.locations]
+
+    @classmethod
+    def from_table(cls, table: list) -> "LocationRegistry":
+        """
+        Rebuilds a registry from the output of to_table, keeping every ID.
+        """
+        registry = cls()
+        registry.locations = [Location(*row) for row in table]
+        registry.ids = {location: i for i, location in enumerate(registry.locations)}
+        return registry
+
+
+def inventory_to_dict(inventory: Inventory) -> dict:
+    """
+    Converts an Inventory into a JSON-compatible dict with a single location table. The lookup dicts
+    refer to locations by their ID in the table: construct_to_locations maps each construct to a list
+    of IDs, and the loc_to_* dicts become lists of [ID, value] pairs.
+
+    Parameters:
+        inventory: The Inventory to convert.
+
+    Returns:
+        A dict that inventory_from_dict turns back into an equal Inventory.
+    """
+    registry = LocationRegistry()
+    register = registry.register
+    construct_to_locations = {
+        construct: [register(location) for location in locations]
+        for construct, locations in inventory.construct_to_locations.items()
+    }
+    loc_to_conc = [[register(loc), conc.name if conc is not None else None]
+                   for loc, conc in inventory.loc_to_conc.items()]
+    loc_to_clone = [[register(loc), clone] for loc, clone in inventory.loc_to_clone.items()]
+    loc_to_culture = [[register(loc), culture.name if culture is not None else None]
+                      for loc, culture in inventory.loc_to_culture.items()]
+    return {
+        "locations": registry.to_table(),
+        "boxes": [serialize(box) for box in inventory.boxes],
+        "construct_to_locations": construct_to_locations,
+        "loc_to_conc": loc_to_conc,
+        "loc_to_clone": loc_to_clone,
+        "loc_to_culture": loc_to_culture,
+    }
+
+
+def _enum_name(member):
+    return member.name if member is not None else None
+
+
+def box_locations(box: Box) -> Iterator[tuple]:
+    """
+    Yields (Location, Sample) for every sample in a box, with the Location InventoryFactory
+    records for it in the inventory lookup dicts.
+    """
+    for row, samples in enumerate(box.samples):
+        for col, sample in enumerate(samples):
+            if sample:
+                yield Location(box.name, row, col, sample.label, sample.sidelabel), sample
+
+
+def box_to_dict(box: Box, inventory: Inventory) -> dict:
+    """
+    Converts one Box and the lookup entries for its samples into a JSON-compatible dict in the
+    format of inventory_to_dict, with "box" in place of "boxes". Only the box's own locations are
+    looked up, so the cost does not grow with the size of the inventory.
+
+    Parameters:
+        box: The Box to convert.
+        inventory: The Inventory holding the box.
+
+    Returns:
+        A dict for inventory_from_dicts.
+    """
+    registry = LocationRegistry()
+    construct_to_locations = {}
+    loc_to_conc, loc_to_clone, loc_to_culture = [], [], []
+    for location, sample in box_locations(box):
+        i = registry.register(location)
+        if location in inventory.construct_to_locations.get(sample.construct, ()):
+            construct_to_locations.setdefault(sample.construct, []).append(i)
+        if location in inventory.loc_to_conc:
+            loc_to_conc.append([i, _enum_name(inventory.loc_to_conc[location])])
+        if location in inventory.loc_to_clone:
+            loc_to_clone.append([i, inventory.loc_to_clone[location]])
+        if location in inventory.loc_to_culture:
+            loc_to_culture.append([i, _enum_name(inventory.loc_to_culture[location])])
+    return {
+        "locations": registry.to_table(),
+        "box": serialize(box),
+        "construct_to_locations": construct_to_locations,
+        "loc_to_conc": loc_to_conc,
+        "loc_to_clone": loc_to_clone,
+        "loc_to_culture": loc_to_culture,
+    }
+
+
+def extra_lookups_to_dict(inventory: Inventory) -> Optional[dict]:
+    """
+    Converts the lookup entries that box_to_dict does not cover, i.e. those for locations that no
+    sample in a box accounts for, in the format of inventory_to_dict without boxes.
+
+    Returns:
+        The dict, or None when every entry belongs to a box sample.
+    """
+    covered = {location for box in inventory.boxes for location, _ in box_locations(box)}
+    extra = Inventory(
+        [],
+        {construct: locations - covered for construct, locations in inventory.construct_to_locations.items()
+         if not locations or not locations <= covered},
+        {loc: value for loc, value in inventory.loc_to_conc.items() if loc not in covered},
+        {loc: value for loc, value in inventory.loc_to_clone.items() if loc not in covered},
+        {loc: value for loc, value in inventory.loc_to_culture.items() if loc not in covered},
+    )
+    if not (extra.construct_to_locations or extra.loc_to_conc or extra.loc_to_clone or extra.loc_to_culture):
+        return None
+    data = inventory_to_dict(extra)
+    del data["boxes"]
+    return data
+
+
+def inventory_from_dict(data: dict) -> Inventory:
+    """
+    Rebuilds an Inventory from the output of inventory_to_dict.
+
+    Parameters:
+        data: The dict, e.g. as loaded from an inventory.json file.
+
+    Returns:
+        An Inventory object.
+    """
+    return inventory_from_dicts([data])
+
+
+def inventory_from_dicts(parts: Iterable[dict]) -> Inventory:
+    """
+    Rebuilds one Inventory from several dicts from inventory_to_dict, box_to_dict or
+    extra_lookups_to_dict, each with its own location table, merging boxes and lookup entries in order.
+    """
+    boxes = []
+    construct_to_locations = {}
+    loc_to_conc, loc_to_clone, loc_to_culture = {}, {}, {}
+    for data in parts:
+        locations = LocationRegistry.from_table(data["locations"]).locations
+        if "box" in data:
+            boxes.append(deserialize(data["box"], Box))
+        boxes.extend(deserialize(box, Box) for box in data.get("boxes", ()))
+        for construct, ids in data["construct_to_locations"].items():
+            construct_to_locations.setdefault(construct, set()).update(locations[i] for i in ids)
+        loc_to_conc.update((locations[i], Concentration[conc] if conc is not None else None)
+                           for i, conc in data["loc_to_conc"])
+        loc_to_clone.update((locations[i], clone) for i, clone in data["loc_to_clone"])
+        loc_to_culture.update((locations[i], Culture[culture] if culture is not None else None)
+                              for i, culture in data["loc_to_culture"])
+    return Inventory(boxes, construct_to_locations, loc_to_conc, loc_to_clone, loc_to_culture)
@@ -0,0 +1,204 @@
+"""
+Mastermixes for reactions that share reagents.
+
+Reactions set up together share most of their recipe: a PCR sheet's reactions differ only in their
+primers and template, a digest sheet's only in their DNA. The stocks every reaction has in common
+(at the smallest volume any of them uses) are premixed for all the reactions at once, with overage
+for pipetting loss, and each reaction then gets one addition of mastermix plus its own components:
+
+    Recipe(mastermix=[(stock, total uL to mix), ...],
+           reaction=[(Reagent.mastermix, uL per reaction), (own component, uL), ...])
+
+Mastermix volumes are totals for mixReactions reactions: the reaction count plus the overage,
+rounded up to whole reactions (and at least one extra), so a total divided by mixReactions gives
+back the per-reaction volume exactly. expand_recipe undoes the mixing for consumers that need
+per-reaction volumes. A mix too large for one tube is split evenly over several.
+"""
+import math
+from dataclasses import dataclass, replace
+from typing import List, Sequence, Tuple
+from src.models.labplanner import *
+
+# Extra fraction of reactions to make mastermix for
+DEFAULT_OVERAGE = 0.1
+
+# Fewer reactions than this are set up without a mastermix
+MIN_REACTIONS = 2
+
+# The most mastermix made up in one tube, in microliters
+MAX_TUBE_VOLUME = 1500.0
+
+Components = List[Tuple[Reagent, float]]
+
+
+@dataclass(frozen=True)
+class MastermixPlan:
+    mastermix: Components           # stock and total microliters to mix
+    mixReactions: int               # reactions' worth of mastermix made (reactions plus overage)
+    perReaction: float              # microliters of mastermix added to each reaction
+    reactions: List[Components]     # what is left to add to each reaction besides the mastermix
+    tubes: int                      # tubes the mastermix is split across
+
+    @property
+    def volume(self) -> float:
+        return sum(volume for reagent, volume in self.mastermix)
+
+
+def mix_reactions(count: int, overage: float = DEFAULT_OVERAGE) -> int:
+    """
+    Returns the reactions' worth of mastermix to make for count reactions: count plus the overage,
+    rounded up, and at least one more than count.
+    """
+    return max(count + 1, math.ceil(count * (1 + overage) - 1e-9))
+
+
+def common_components(reactions: Sequence[Components]) -> Components:
+    """
+    Returns the stocks every reaction uses, each at the smallest volume any reaction uses, in the
+    order of the first reaction. Abstract reagents (samples) are never common.
+    """
+    if not reactions:
+        return []
+    common = {}
+    for reagent, volume in reactions[0]:
+        if reagent not in ABSTRACT_REAGENTS:
+            common[reagent] = common.get(reagent, 0.0) + volume
+    for reaction in reactions[1:]:
+        volumes = {}
+        for reagent, volume in reaction:
+            volumes[reagent] = volumes.get(reagent, 0.0) + volume
+        common = {reagent: min(volume, volumes[reagent]) for reagent, volume in common.items()
+                  if reagent in volumes}
+    return [(reagent, volume) for reagent, volume in common.items() if volume > 0]
+
+
+def plan_mastermix(reactions: Sequence[Components], overage: float = DEFAULT_OVERAGE,
+                   minReactions: int = MIN_REACTIONS, maxTubeVolume: float = MAX_TUBE_VOLUME):
+    """
+    Plans a mastermix for a set of reactions, each given as its (Reagent, microliters) components.
+
+    Returns:
+        A MastermixPlan, or None when there are fewer than minReactions reactions or nothing is
+        common to all of them.
+    """
+    if len(reactions) < minReactions:
+        return None
+    # a sheet's reactions are mostly identical, so each distinct one is worked out once
+    distinct = {}
+    for reaction in reactions:
+        distinct.setdefault(tuple(reaction), None)
+    common = common_components(list(distinct))
+    if not common:
+        return None
+    mixCount = mix_reactions(len(reactions), overage)
+    shared = dict(common)
+    for reaction in distinct:
+        left = dict(shared)
+        own = []
+        for reagent, volume in reaction:
+            take = min(volume, left.get(reagent, 0.0))
+            if take:
+                left[reagent] -= take
+            if volume - take > 0:
+                own.append((reagent, volume - take))
+        distinct[reaction] = own
+    remaining = [distinct[tuple(reaction)] for reaction in reactions]
+    mastermix = [(reagent, volume * mixCount) for reagent, volume in common]
+    total = sum(volume for reagent, volume in mastermix)
+    return MastermixPlan(mastermix, mixCount, sum(volume for reagent, volume in common), remaining,
+                         tube_count(total, maxTubeVolume))
+
+
+def tube_count(volume: float, maxTubeVolume: float = MAX_TUBE_VOLUME) -> int:
+    """
+    Returns the tubes a mastermix of volume microliters is split evenly across.
+    """
+    return max(1, math.ceil(volume / maxTubeVolume - 1e-9))
+
+
+def mastermix_recipe(recipe: Recipe, count: int, overage: float = DEFAULT_OVERAGE,
+                     minReactions: int = MIN_REACTIONS, maxTubeVolume: float = MAX_TUBE_VOLUME):
+    """
+    Rewrites the recipe of count identical reactions to use a mastermix.
+
+    Returns:
+        (Recipe, MastermixPlan), or (recipe, None) when the recipe is left as it is: it already has a
+        mastermix, or there is nothing to premix.
+    """
+    if recipe is None or recipe.mastermix:
+        return recipe, None
+    plan = plan_mastermix([recipe.reaction] * count, overage, minReactions, maxTubeVolume)
+    if plan is None:
+        return recipe, None
+    reaction = [(Reagent.mastermix, plan.perReaction)] + plan.reactions[0]
+    return Recipe(plan.mastermix, reaction), plan
+
+
+def expand_recipe(recipe: Recipe) -> Components:
+    """
+    Returns a recipe's per-reaction components with the mastermix addition replaced by the stocks
+    it carries; a recipe without a mastermix is returned as it is.
+    """
+    if not recipe.mastermix:
+        return list(recipe.reaction)
+    perReaction = sum(volume for reagent, volume in recipe.reaction if reagent == Reagent.mastermix)
+    total = sum(volume for reagent, volume in recipe.mastermix)
+    mixCount = round(total / perReaction)
+    expanded = [(reagent, round(volume / mixCount, 6)) for reagent, volume in recipe.mastermix]
+    return expanded + [(reagent, volume) for reagent, volume in recipe.reaction if reagent != Reagent.mastermix]
+
+
+def _enzymes(step) -> Sequence[Reagent]:
+    if isinstance(step, Digest):
+        return step.enzymes
+    if isinstance(step, GoldenGate):
+        return [step.enzyme]
+    return ()
+
+
+def sheet_enzymes(lab_sheet: LabSheet) -> tuple:
+    """
+    Returns the enzymes a Digest or Golden Gate sheet was split for, in recipe order: the recipe's
+    reagents that are enzymes of the steps listed on it. Sheets of other types give ().
+    """
+    listed = {enzyme for step in lab_sheet.steps for enzyme in _enzymes(step)}
+    recipe = lab_sheet.reaction
+    return tuple(dict.fromkeys(reagent for part in (recipe.mastermix, recipe.reaction)
+                               for reagent, volume in part or () if reagent in listed))
+
+
+def step_on_sheet(step, enzymes: tuple) -> bool:
+    """
+    Whether a step is set up on a sheet split for enzymes (see sheet_enzymes). LabPacketFactory
+    makes one Digest sheet per tuple of enzymes and one Golden Gate sheet per enzyme, all listing
+    the same steps, so a step belongs to the sheet whose enzymes are exactly its own; a step whose
+    enzymes are only part of a sheet's belongs to another sheet. Other steps belong to every sheet
+    they are listed on.
+    """
+    return tuple(dict.fromkeys(_enzymes(step))) == enzymes
+
+
+def sheet_reactions(lab_sheet: LabSheet) -> int:
+    """
+    Counts the reactions set up on a sheet (see step_on_sheet).
+    """
+    if lab_sheet.reaction is None:
+        return 0
+    enzymes = sheet_enzymes(lab_sheet)
+    return sum(1 for step in lab_sheet.steps if step_on_sheet(step, enzymes))
+
+
+def apply_mastermix(lab_sheet: LabSheet, overage: float = DEFAULT_OVERAGE, minReactions: int = MIN_REACTIONS,
+                    maxTubeVolume: float = MAX_TUBE_VOLUME) -> LabSheet:
+    """
+    Returns the sheet with its recipe rewritten to use a mastermix for its reactions, and a note
+    saying how to split the mix when it needs more than one tube.
+    """
+    recipe, plan = mastermix_recipe(lab_sheet.reaction, sheet_reactions(lab_sheet), overage, minReactions,
+                                    maxTubeVolume)
+    if plan is None:
+        return lab_sheet
+    notes = lab_sheet.notes
+    if plan.tubes > 1:
+        notes = list(notes) + [f"Make the mastermix in {plan.tubes} tubes of {plan.volume / plan.tubes:.1f}uL each"]
+    return replace(lab_sheet, reaction=recipe, notes=notes)
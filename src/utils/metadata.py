@@ -0,0 +1,144 @@
+"""
+The metadata.txt format, written by Saver.save_metadata and write_out.write_metadata.
+
+    Experiment Name: <name>
+    Format: 2
+    Oligos: <JSON list, or null>
+    Polynucleotides:
+    ["<name>", "<sequence>", <ext5>, <ext3>, <is_double_stranded>, <is_circular>, <mod_ext5>, <mod_ext3>]
+    ...
+
+Each polynucleotide is one JSON array in Polynucleotide field order, with trailing fields that
+have their default values left off, so any name or sequence (including ones containing ": ") is
+unambiguous and a line is decoded by json.loads without evaluating anything. The parser reads one
+line at a time, so its cost is linear in the number of sequences.
+
+Files without a Format line are the original format, "Oligos: a, b" and one "<name>: <sequence>"
+line per polynucleotide, and are still read.
+"""
+import ast
+import json
+from dataclasses import fields, MISSING
+from typing import Iterable, Iterator, Tuple
+from src.models.labplanner import Polynucleotide
+
+METADATA_VERSION = 2
+
+_POLY_FIELDS = fields(Polynucleotide)
+_POLY_DEFAULTS = [field.default for field in _POLY_FIELDS]
+_REQUIRED = sum(field.default is MISSING for field in _POLY_FIELDS)
+
+
+class MetadataFormatError(ValueError):
+    """
+    Raised for a metadata file that does not follow the format, with the line number of the problem.
+    """
+    def __init__(self, message: str, lineno: int = None, path: str = None):
+        self.message = message
+        self.lineno = lineno
+        self.path = path
+        where = f"{path or '<input>'}:{lineno}" if lineno else (path or '<input>')
+        super().__init__(f"{where}: {message}")
+
+
+def polynucleotide_line(name: str, poly: Polynucleotide) -> str:
+    values = [name] + [getattr(poly, field.name) for field in _POLY_FIELDS]
+    end = len(values)
+    while end > 1 + _REQUIRED and values[end - 1] == _POLY_DEFAULTS[end - 2]:
+        end -= 1
+    return json.dumps(values[:end])
+
+
+def metadata_lines(experiment) -> Iterator[str]:
+    """
+    Yields the lines of an experiment's metadata.txt, without newlines.
+    """
+    oligos = experiment.oligos
+    yield f"Experiment Name: {experiment.name}"
+    yield f"Format: {METADATA_VERSION}"
+    yield f"Oligos: {json.dumps(list(oligos) if isinstance(oligos, (list, tuple)) else oligos)}"
+    yield "Polynucleotides:"
+    for name, poly in experiment.nameToPoly.items():
+        yield polynucleotide_line(name, poly)
+
+
+def _header_value(line: str, key: str, lineno: int, path: str) -> str:
+    prefix = key + ":"
+    if not line.startswith(prefix):
+        raise MetadataFormatError(f"Expected '{prefix}'", lineno, path)
+    return line[len(prefix):].strip()
+
+
+def iter_polynucleotides(lines: Iterable[str], version: int = METADATA_VERSION, start: int = 0,
+                         path: str = None) -> Iterator[Tuple[str, Polynucleotide]]:
+    """
+    Yields (name, Polynucleotide) for each polynucleotide line.
+
+    Parameters:
+        lines: The lines after "Polynucleotides:".
+        version: The metadata format version.
+        start: The line number before the first of lines, for error messages.
+        path: The file being read, for error messages.
+    """
+    for lineno, line in enumerate(lines, start + 1):
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        if version < 2:
+            name, sep, sequence = line.partition(": ")
+            if not sep:
+                raise MetadataFormatError("Expected '<name>: <sequence>'", lineno, path)
+            yield name, Polynucleotide(sequence=sequence)
+            continue
+        try:
+            values = json.loads(line)
+        except ValueError:
+            values = None
+        if not isinstance(values, list) or not 1 + _REQUIRED <= len(values) <= 1 + len(_POLY_FIELDS):
+            raise MetadataFormatError("Expected a JSON array of a name and polynucleotide fields", lineno, path)
+        yield values[0], Polynucleotide(*values[1:])
+
+
+def parse_metadata(lines: Iterable[str], path: str = None) -> dict:
+    """
+    Parses the lines of a metadata.txt file (e.g. an open file, read lazily).
+
+    Returns:
+        {"name": str, "oligos": list or None, "nameToPoly": {name: Polynucleotide}}
+    """
+    lines = iter(lines)
+    lineno = 0
+
+    def header(key):
+        nonlocal lineno
+        lineno += 1
+        return _header_value(next(lines, ""), key, lineno, path)
+
+    name = header("Experiment Name")
+    line = next(lines, "")
+    lineno += 1
+    version = 1
+    if line.startswith("Format:"):
+        version = int(_header_value(line, "Format", lineno, path))
+        if version > METADATA_VERSION:
+            raise MetadataFormatError(f"Unsupported metadata format {version}", lineno, path)
+        oligos = header("Oligos")
+    else:
+        oligos = _header_value(line, "Oligos", lineno, path)
+
+    try:
+        if version >= 2:
+            oligos = json.loads(oligos)
+        elif oligos.startswith("[") and oligos.endswith("]"):
+            oligos = ast.literal_eval(oligos)
+        else:
+            oligos = oligos.split(", ") if oligos else []
+    except (ValueError, SyntaxError):
+        raise MetadataFormatError("Cannot read the Oligos line", lineno, path) from None
+    header("Polynucleotides")
+    return {"name": name, "oligos": oligos, "nameToPoly": dict(iter_polynucleotides(lines, version, lineno, path))}
+
+
+def read_metadata(filepath: str) -> dict:
+    with open(filepath, "r") as f:
+        return parse_metadata(f, filepath)
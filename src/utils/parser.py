@@ -1,6 +1,11 @@
 from src.models.inventory import Inventory, Box, Sample, Concentration, Culture
 from typing import List
+import json
+import os
 import pickle
+from src.utils.locations import inventory_from_dict, inventory_from_dicts
+from src.utils.atomic_writer import read_manifest
+from src.utils.dirty_tracking import mark_clean, remember_saved
 
 
 class Parser:
@@ -47,7 +52,11 @@ class Parser:
 
     def parse_inventory(self, indir: str) -> Inventory:
         '''
-        Parses a previously serialized inventory directory.
+        Parses a previously serialized inventory directory: the inventory.json index and box files
+        written by Saver, a single-file inventory.json, or else the pickled lookup dicts and <i>-Box.txt
+        box files of older outputs.
+        An inventory read from a Saver index comes back tracked and clean, so saving it again to the
+        same place only writes the boxes that change.
 
         Parameters:
             indir: The directory containing serialized Inventory components.
@@ -55,7 +64,17 @@ class Parser:
         Returns:
             An Inventory object.
         '''
-        boxes: List[Box] = []
+        json_path = os.path.join(indir, 'inventory.json')
+        if os.path.exists(json_path):
+            with open(json_path, 'r') as file:
+                data = json.load(file)
+            if 'version' not in data:
+                return inventory_from_dict(data)
+            return self.parse_inventory_index(indir, data)
+
+        # older outputs wrote each box in row form, as <i>-Box.txt
+        boxes: List[Box] = [self.parse_box_row_form(os.path.join(indir, filename))
+                            for filename in sorted(os.listdir(indir)) if filename.endswith('-Box.txt')]
         with open(f'{indir}/construct_to_locations', 'rb') as file:
             construct_to_locations = pickle.load(file)
         with open(f'{indir}/location_to_concentration', 'rb') as file:
@@ -66,3 +85,44 @@ class Parser:
             loc_to_culture = pickle.load(file)
 
         return Inventory(boxes, construct_to_locations, loc_to_conc, loc_to_clone, loc_to_culture)
+
+    def parse_inventory_index(self, indir: str, index: dict) -> Inventory:
+        '''
+        Parameters:
+            indir: The inventory directory.
+            index: The loaded inventory.json index, naming one JSON file per box.
+        Returns:
+            An Inventory object, marked clean, with each box's saved file hashes taken from the manifest.
+        '''
+        parts = []
+        for name in index['boxes']:
+            with open(os.path.join(indir, name), 'r') as file:
+                parts.append(json.load(file))
+        if index['extra']:
+            parts.append(index['extra'])
+        inventory = inventory_from_dicts(parts)
+        self.track_saved_inventory(indir, inventory, index['extra'])
+        return inventory
+
+    def track_saved_inventory(self, indir: str, inventory: Inventory, extra: dict):
+        '''
+        Marks an inventory just read from indir clean, remembering the saved hashes of its box files.
+
+        Parameters:
+            indir: The inventory directory it was read from.
+            inventory: The Inventory.
+            extra: The lookup entries outside the boxes, from the inventory.json index.
+        '''
+        # the manifest is in the inventory directory, or in the experiment directory above it
+        prefix = ''
+        manifest = read_manifest(indir)
+        if manifest is None:
+            manifest = read_manifest(os.path.dirname(os.path.abspath(indir)))
+            prefix = os.path.basename(os.path.abspath(indir)) + '/'
+        if manifest is not None:
+            files = manifest['files']
+            for i, box in enumerate(inventory.boxes):
+                rows, data = files.get(f'{prefix}{i}_Box.txt'), files.get(f'{prefix}{i}_Box.json')
+                if rows and data:
+                    remember_saved(box, (rows['sha256'], data['sha256']))
+        mark_clean(inventory, extra)
@@ -0,0 +1,208 @@
+"""
+Liquid-handler picklists for a lab packet.
+
+A picklist is a CSV of transfers, one per row, with the columns generic liquid handlers import:
+
+    Source Plate,Source Well,Destination Plate,Destination Well,Volume
+
+Volumes are in microliters. Reactions go where a PlateLayout puts them (see utils/plate_layout.py),
+on plates named as the AutoprotocolFactory names them. A 9x9 inventory box is a source plate named
+after the box, its tubes wells A1-I9. Each stock is a tube named as in utils/container_refs.py
+("stock_<reagent>"), and a sheet's premixed mastermix a tube "mastermix_<sheet index>", both at A1.
+A mastermix too large for one tube (see mastermix.tube_count) is made in tubes
+"mastermix_<sheet index>_<n>", each serving an even share of the sheet's reactions.
+
+Transfers come in stages. For layout run k, stage 3k makes the run's mastermixes from their stocks,
+stage 3k + 1 sets up the reactions, and stage 3k + 2 moves the products that have a destination tube
+off the run's plates, after thermocycling. Each mastermix tube receives the recipe's totals in
+proportion to the reactions it serves, so every tube carries the same overage over what is drawn
+from it. packet_transfers yields the stages in one pass over the packet.
+
+write_picklists files each row by (stage, source plate) as it arrives, then writes one CSV per stage
+and source plate, sorted by destination plate and then column, so a deck holds one source plate per
+file and changes destination plates as rarely as it can. The manifest lists the files in the order to run them.
+"""
+import csv
+import os
+from collections import Counter, defaultdict
+from string import ascii_uppercase as alcU
+from typing import Dict, Iterable, Iterator, List, Tuple
+from src.models.autoprotocol import PlateLayout
+from src.models.inventory import *
+from src.models.labplanner import *
+from src.utils.container_refs import stock_name
+from src.utils.mastermix import MAX_TUBE_VOLUME, tube_count
+from src.utils.plate_layout import DEFAULT_PLATE_TYPES, PLATE_TYPES, lab_sheet_reactions, layout_packet, reaction_volumes
+
+HEADER = ("Source Plate", "Source Well", "Destination Plate", "Destination Well", "Volume")
+MANIFEST = "manifest.csv"
+TUBE_WELL = "A1"
+
+# (stage, source plate, source well, destination plate, destination well, microliters)
+Transfer = Tuple[int, str, str, str, str, float]
+
+
+def well_name(index: int, columns: int) -> str:
+    return f"{alcU[index // columns]}{index % columns + 1}"
+
+
+def mastermix_name(sheetIndex: int, tube: int = None) -> str:
+    """
+    Returns the name of a sheet's mastermix tube; tube counts from 1 when the mix is split.
+    """
+    return f"mastermix_{sheetIndex}" if tube is None else f"mastermix_{sheetIndex}_{tube}"
+
+
+def mastermix_tubes(sheetIndex: int, recipe: Recipe, count: int, maxTubeVolume: float = MAX_TUBE_VOLUME) -> List[str]:
+    """
+    Returns the mastermix tube each of count reactions draws from, splitting the reactions into
+    contiguous shares as even as the tubes allow.
+    """
+    tubes = tube_count(sum(volume for reagent, volume in recipe.mastermix), maxTubeVolume)
+    if tubes == 1:
+        return [mastermix_name(sheetIndex)] * count
+    return [mastermix_name(sheetIndex, i * tubes // count + 1) for i in range(count)]
+
+
+def _tube_well(location: Location) -> str:
+    return f"{alcU[location.row]}{location.col + 1}"
+
+
+def _occupied(inventory: Inventory) -> set:
+    return {(box.name, row, col) for box in inventory.boxes
+            for row, samples in enumerate(box.samples) for col, sample in enumerate(samples) if sample is not None}
+
+
+def packet_transfers(lab_packet: LabPacket, inventory: Inventory = None, layout: PlateLayout = None,
+                     plateTypes=DEFAULT_PLATE_TYPES, maxTubeVolume: float = MAX_TUBE_VOLUME) -> Iterator[Transfer]:
+    """
+    Yields every liquid-handler transfer of a lab packet, stage by stage (see the module docstring).
+
+    Parameters:
+        lab_packet: the LabPacket
+        inventory: when given, every source tube must hold one of its samples
+        layout: the PlateLayout the reactions are set up on; layout_packet(lab_packet, plateTypes)
+            by default
+        plateTypes: the plate types the default layout may choose from
+        maxTubeVolume: the most mastermix made in one tube, as the lab packet was planned with
+
+    Returns:
+        An iterator of (stage, source plate, source well, destination plate, destination well,
+        microliters) tuples.
+    """
+    layout = layout or layout_packet(lab_packet, plateTypes)
+    occupied = _occupied(inventory) if inventory is not None else None
+    sheets = lab_packet.labsheets
+    made = set()
+    for runIndex, run in enumerate(layout.runs):
+        mix, setup = 3 * runIndex, 3 * runIndex + 1
+        runReactions = []
+        for index in run:
+            reactions = [reaction for reaction in lab_sheet_reactions(sheets[index]) if reaction.product not in made]
+            made.update(reaction.product for reaction in reactions)
+            if reactions:
+                tubes = None
+                if sheets[index].reaction.mastermix:
+                    tubes = mastermix_tubes(index, sheets[index].reaction, len(reactions), maxTubeVolume)
+                runReactions.append((index, reactions, tubes))
+
+        for index, reactions, tubes in runReactions:
+            if tubes is None:
+                continue
+            for tube, served in Counter(tubes).items():
+                for reagent, volume in sheets[index].reaction.mastermix:
+                    yield (mix, stock_name(reagent), TUBE_WELL, tube, TUBE_WELL, volume * served / len(tubes))
+
+        moves = []
+        for index, reactions, tubes in runReactions:
+            sheet = sheets[index]
+            stocks = [(reagent, volume) for reagent, volume in sheet.reaction.reaction
+                      if reagent == Reagent.mastermix or reagent not in ABSTRACT_REAGENTS]
+            sampleVolume = {reagent: volume for reagent, volume in sheet.reaction.reaction if reagent in ABSTRACT_REAGENTS}
+            volumes = reaction_volumes(sheet.reaction, reactions)
+            for i, (reaction, volume) in enumerate(zip(reactions, volumes)):
+                place = layout.well_of(index, reaction.product)
+                if place is None:
+                    raise ValueError(f"The layout has no well for {reaction.product} on LabSheet {sheet.title!r}")
+                plate = layout.plates[place[0]]
+                well = well_name(place[1], PLATE_TYPES[plate.plateType][1])
+                for reagent, stockVolume in stocks:
+                    source = tubes[i] if reagent == Reagent.mastermix else stock_name(reagent)
+                    yield (setup, source, TUBE_WELL, plate.name, well, stockVolume)
+                for reagent, location in reaction.samples:
+                    if occupied is not None and (location.boxname, location.row, location.col) not in occupied:
+                        raise ValueError(f"No sample in {location.boxname} {_tube_well(location)} for {reaction.product}")
+                    yield (setup, location.boxname, _tube_well(location), plate.name, well, sampleVolume[reagent])
+                if reaction.destination is not None:
+                    destination = reaction.destination
+                    moves.append((setup + 1, plate.name, well, destination.boxname, _tube_well(destination), volume))
+        yield from moves
+
+
+def _well_order(well: str) -> Tuple[int, int]:
+    return (int(well[1:]), ord(well[0]))
+
+
+def write_picklists(transfers: Iterable[Transfer], directory: str) -> List[Tuple[int, str, str, int]]:
+    """
+    Writes transfers as one picklist per stage and source plate, plus a manifest.
+
+    Parameters:
+        transfers: (stage, source plate, source well, destination plate, destination well,
+            microliters) tuples, e.g. from packet_transfers; read once
+        directory: the directory to write into (created if missing)
+
+    Returns:
+        [(stage, source plate, path, rows)] in the order the picklists are run, as in the manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    groups: Dict[Tuple[int, str], list] = defaultdict(list)
+    firstSeen = {}
+    for stage, sourcePlate, sourceWell, destPlate, destWell, volume in transfers:
+        key = (stage, sourcePlate)
+        if key not in firstSeen:
+            firstSeen[key] = len(firstSeen)
+        groups[key].append((sourceWell, destPlate, destWell, volume))
+
+    orders = {}
+    written = []
+    for key in sorted(groups, key=lambda key: (key[0], firstSeen[key])):
+        stage, sourcePlate = key
+        rows = groups.pop(key)
+        for row in rows:
+            if row[2] not in orders:
+                orders[row[2]] = _well_order(row[2])
+        rows.sort(key=lambda row: (row[1], orders[row[2]]))
+        path = os.path.join(directory, f"{stage:02d}_{sourcePlate}.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADER)
+            writer.writerows((sourcePlate, sourceWell, destPlate, destWell, f"{volume:g}")
+                             for sourceWell, destPlate, destWell, volume in rows)
+        written.append((stage, sourcePlate, path, len(rows)))
+
+    with open(os.path.join(directory, MANIFEST), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(("Stage", "Source Plate", "File", "Transfers"))
+        writer.writerows((stage, sourcePlate, os.path.basename(path), rows) for stage, sourcePlate, path, rows in written)
+    return written
+
+
+def export_picklists(lab_packet: LabPacket, directory: str, inventory: Inventory = None, layout: PlateLayout = None,
+                     plateTypes=DEFAULT_PLATE_TYPES, maxTubeVolume: float = MAX_TUBE_VOLUME) -> List[Tuple[int, str, str, int]]:
+    """
+    Writes the picklists of a lab packet to directory (see packet_transfers and write_picklists).
+    """
+    return write_picklists(packet_transfers(lab_packet, inventory, layout, plateTypes, maxTubeVolume), directory)
+
+
+def read_picklist(path: str) -> List[Tuple[str, str, str, str, float]]:
+    """
+    Reads a picklist back as (source plate, source well, destination plate, destination well,
+    microliters) rows.
+    """
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        return [(sourcePlate, sourceWell, destPlate, destWell, float(volume))
+                for sourcePlate, sourceWell, destPlate, destWell, volume in reader]
@@ -0,0 +1,495 @@
+"""
+A local HTTP/JSON planning service.
+
+Scripts that plan an experiment start Python, import the factories and plan once. The service keeps
+a pool of warm worker processes instead, so a LIMS can post construction files and read the lab
+sheets back over HTTP. Each job runs ExperimentFactory.run in a worker process, which also
+serializes the results, so the event loop only moves JSON.
+
+Endpoints (JSON bodies; streams are newline-delimited JSON in a chunked response):
+
+    POST   /jobs              queue a job: 202 {"job": id, "position": n}, or 503 with Retry-After
+                              when maxQueued jobs are already waiting
+    GET    /jobs/<id>         the job's state
+    GET    /jobs/<id>/events  stream the job's events, from the first, as they happen
+    DELETE /jobs/<id>         cancel the job
+    POST   /plan              queue a job and stream its events in the same response; hanging up
+                              cancels the job
+    GET    /health            state, queue depth and job counters
+    GET    /metrics           (the same document)
+
+A job payload is {"name": ..., "id": ..., "text": construction files in the ConstructionFileParser
+format} or, in place of "text", {"construction_files": [serialized ConstructionFile, ...]}, with
+an optional "inventory" (in the inventory_to_dict format) to plan against instead of the
+service's own inventory. The service's inventory is never changed by a job.
+
+Events, in order:
+
+    {"event": "queued", "job": id, "position": n}
+    {"event": "started", "job": id}
+    {"event": "inventory", "job": id, "boxes": [box_to_dict(...) + {"index": i}, ...]}
+    {"event": "labsheet", "job": id, "index": i, "sheet": serialized LabSheet}    one per sheet
+    {"event": "done", "job": id, "seconds": s}
+    or {"event": "error", "job": id, "error": message} / {"event": "cancelled", "job": id}
+
+"inventory" holds only the boxes the job added or changed. Backpressure works at both ends: at most
+maxQueued jobs wait for a worker, and a stream only runs as fast as its client reads, since every
+write waits for the socket to drain. A job cancelled while queued never runs; one already running
+in a worker process finishes there, and its results are dropped.
+
+Run with `python -m src.utils.planning_service --port 8750`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from src.factories.experiment_factory import ExperimentFactory
+from src.models.labplanner import *
+from src.utils.cf_parser import ConstructionFileParser
+from src.utils.dirty_tracking import dirty_boxes, track
+from src.utils.locations import box_to_dict, inventory_from_dict
+from src.utils.serialization import deserialize, serialize
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8750
+
+# Jobs that may wait for a worker before new ones are refused
+DEFAULT_MAX_QUEUED = 64
+
+# Finished jobs kept for GET /jobs/<id>, oldest dropped first
+DEFAULT_KEEP_JOBS = 256
+
+# Largest request body accepted, in bytes
+DEFAULT_MAX_BODY = 64 * 1024 * 1024
+
+_MAX_HEADERS = 100
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 503: "Service Unavailable"}
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+_FINAL = {DONE: "done", FAILED: "error", CANCELLED: "cancelled"}
+
+
+# --- worker processes ---
+
+_factory = ExperimentFactory()
+_inventory = None
+
+
+def _init_worker(inventory):
+    """
+    Runs once in each worker process: keeps the service's inventory, tracked so a job's changes
+    to its copy show up as dirty boxes.
+    """
+    global _inventory
+    if inventory is not None:
+        track(inventory)
+    _inventory = inventory
+
+
+def _warm():
+    return os.getpid()
+
+
+def construction_files(payload: dict) -> List[ConstructionFile]:
+    """
+    Returns the ConstructionFiles of a job payload, from its "text" or its "construction_files".
+    """
+    if payload.get("text") is not None:
+        parser = ConstructionFileParser()
+        return list(parser.iter_from_lines(enumerate(payload["text"].splitlines(), 1)))
+    return [deserialize(data, ConstructionFile) for data in payload["construction_files"]]
+
+
+def plan_payload(payload: dict) -> dict:
+    """
+    Plans a job payload; runs in a worker process.
+
+    Returns:
+        {"inventory": [changed boxes, as box_to_dict with their "index"], "labsheets": [serialized LabSheet]}
+    """
+    cfList = construction_files(payload)
+    if payload.get("inventory") is not None:
+        inventory = inventory_from_dict(payload["inventory"])
+        track(inventory)
+    else:
+        inventory = _factory.copyInventory(_inventory)
+    experiment = _factory.run(payload["name"], payload["id"], cfList, inventory)
+    result = experiment.inventory
+    dirty = dirty_boxes(result)
+    indexes = sorted(dirty) if dirty is not None else range(len(result.boxes))
+    return {
+        "inventory": [dict(box_to_dict(result.boxes[i], result), index=i) for i in indexes],
+        "labsheets": [serialize(sheet) for sheet in experiment.labPacket.labsheets],
+    }
+
+
+# --- jobs ---
+
+class Job:
+    """
+    A queued planning job and the events it has produced so far.
+    """
+
+    def __init__(self, jobId: str, payload: dict):
+        self.jobId = jobId
+        self.payload = payload
+        self.state = QUEUED
+        self.events: List[dict] = []
+        self.submitted = time.monotonic()
+        self.seconds = None
+        self._wake = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in _FINAL
+
+    def emit(self, event: str, **fields):
+        self.events.append(dict(event=event, job=self.jobId, **fields))
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    def finish(self, state: str, **fields):
+        self.state = state
+        self.emit(_FINAL[state], **fields)
+
+    def wait(self):
+        """
+        Returns an awaitable for the next event, bound now so no event between this call and the
+        first await is missed.
+        """
+        return self._wake.wait()
+
+    def status(self) -> dict:
+        return {"job": self.jobId, "state": self.state, "events": len(self.events), "seconds": self.seconds}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Dict[str, str] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class PlanningService:
+    """
+    The job queue, the worker pool and the HTTP front end (see the module docstring).
+    """
+
+    def __init__(self, maxWorkers: int = None, maxQueued: int = DEFAULT_MAX_QUEUED, inventory=None,
+                 keepJobs: int = DEFAULT_KEEP_JOBS, maxBody: int = DEFAULT_MAX_BODY):
+        '''
+        Parameters:
+            maxWorkers: worker processes, and jobs planned at once (defaults to the CPU count)
+            maxQueued: jobs that may wait for a worker before submissions are refused
+            inventory: the Inventory jobs plan against unless their payload brings one
+            keepJobs: finished jobs remembered for status requests
+            maxBody: the largest request body accepted, in bytes
+        '''
+        self.maxWorkers = maxWorkers or os.cpu_count() or 1
+        self.maxQueued = maxQueued
+        self.inventory = inventory
+        self.keepJobs = keepJobs
+        self.maxBody = maxBody
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor = None
+        self.server = None
+        self.workers = []
+        self.ids = itertools.count(1)
+        self.running = 0
+        self.started = time.monotonic()
+        self.counts = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+        # running totals rather than a list of times, so a long-lived service stays the same size
+        self.planSeconds = {"count": 0, "total": 0.0, "max": 0.0}
+
+    def _queue(self) -> asyncio.Queue:
+        if self.queue is None:
+            self.queue = asyncio.Queue(self.maxQueued)
+        return self.queue
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        """
+        Starts the worker processes (warming each up) and the HTTP server.
+
+        Returns:
+            The asyncio Server; its sockets give the port when port is 0.
+        """
+        loop = asyncio.get_running_loop()
+        self.executor = ProcessPoolExecutor(self.maxWorkers, initializer=_init_worker, initargs=(self.inventory,))
+        await asyncio.gather(*(loop.run_in_executor(self.executor, _warm) for _ in range(self.maxWorkers)))
+        self.workers = [asyncio.ensure_future(self._work()) for _ in range(self.maxWorkers)]
+        self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    async def close(self):
+        """
+        Stops taking requests, cancels the jobs still queued and shuts the worker processes down.
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for job in self.jobs.values():
+            if job.state == QUEUED:
+                self.cancel(job.jobId)
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, payload: dict) -> Job:
+        """
+        Queues a job.
+
+        Raises:
+            HTTPError: 400 for a payload without a name, id and construction files; 503 when the
+                queue is full
+        """
+        if not isinstance(payload, dict) or "name" not in payload or "id" not in payload:
+            raise HTTPError(400, "A job needs a name and an id")
+        if payload.get("text") is None and not isinstance(payload.get("construction_files"), list):
+            raise HTTPError(400, "A job needs construction files: 'text' or 'construction_files'")
+        job = Job(str(next(self.ids)), payload)
+        try:
+            self._queue().put_nowait(job)
+        except asyncio.QueueFull:
+            self.counts["rejected"] += 1
+            raise HTTPError(503, "The planning queue is full", {"Retry-After": "1"}) from None
+        self.counts["submitted"] += 1
+        self.jobs[job.jobId] = job
+        job.emit("queued", position=self._queue().qsize())
+        self._forget()
+        return job
+
+    def cancel(self, jobId: str) -> Optional[Job]:
+        """
+        Cancels a job that has not finished; returns the job, or None if there is no such job.
+        """
+        job = self.jobs.get(jobId)
+        if job is not None and not job.finished:
+            self.counts["cancelled"] += 1
+            job.finish(CANCELLED)
+        return job
+
+    def _forget(self):
+        finished = [jobId for jobId, job in self.jobs.items() if job.finished]
+        for jobId in finished[:max(0, len(finished) - self.keepJobs)]:
+            del self.jobs[jobId]
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        queue = self._queue()
+        while True:
+            job = await queue.get()
+            if job.finished:
+                continue
+            job.state = RUNNING
+            job.emit("started")
+            self.running += 1
+            start = time.monotonic()
+            try:
+                result = await loop.run_in_executor(self.executor, plan_payload, job.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not job.finished:
+                    self.counts["failed"] += 1
+                    job.finish(FAILED, error=f"{type(e).__name__}: {e}")
+                continue
+            finally:
+                self.running -= 1
+            job.seconds = time.monotonic() - start
+            self._timed(job.seconds)
+            if job.finished:
+                continue    # cancelled while it ran
+            job.emit("inventory", boxes=result["inventory"])
+            for index, sheet in enumerate(result["labsheets"]):
+                job.emit("labsheet", index=index, sheet=sheet)
+            self.counts["completed"] += 1
+            job.finish(DONE, seconds=round(job.seconds, 3))
+            self._forget()
+
+    def _timed(self, seconds: float):
+        times = self.planSeconds
+        times["count"] += 1
+        times["total"] += seconds
+        times["max"] = max(times["max"], seconds)
+
+    def metrics(self) -> dict:
+        """
+        Returns the service's state: queue depth, jobs running, job counters and planning times.
+        """
+        times = self.planSeconds
+        count = times["count"]
+        return {
+            "status": "ok" if self.server is not None and self.server.is_serving() else "stopped",
+            "workers": self.maxWorkers,
+            "queued": self._queue().qsize(),
+            "max_queued": self.maxQueued,
+            "running": self.running,
+            "jobs": dict(self.counts),
+            "plan_seconds": {
+                "count": count,
+                "total": round(times["total"], 3),
+                "mean": round(times["total"] / count, 3) if count else None,
+                "max": round(times["max"], 3) if count else None,
+            },
+            "uptime_s": round(time.monotonic() - self.started, 3),
+        }
+
+    # --- HTTP ---
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                method, path, body = await _read_request(reader, self.maxBody)
+                await self._route(method, path, body, reader, writer)
+            except HTTPError as e:
+                await _send_json(writer, e.status, {"error": e.message}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, reader, writer):
+        parts = [part for part in path.split("?", 1)[0].split("/") if part]
+        if parts in (["health"], ["metrics"]) and method == "GET":
+            return await _send_json(writer, 200, self.metrics())
+        if parts == ["jobs"] and method == "POST":
+            job = self.submit(_json_body(body))
+            return await _send_json(writer, 202, {"job": job.jobId, "position": job.events[0]["position"]})
+        if parts == ["plan"] and method == "POST":
+            return await self._stream(self.submit(_json_body(body)), reader, writer, cancelOnClose=True)
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HTTPError(404, f"No job {parts[1]}")
+            if len(parts) == 3 and parts[2] == "events" and method == "GET":
+                return await self._stream(job, reader, writer, cancelOnClose=False)
+            if len(parts) == 2 and method == "GET":
+                return await _send_json(writer, 200, job.status())
+            if len(parts) == 2 and method == "DELETE":
+                return await _send_json(writer, 200, self.cancel(job.jobId).status())
+            raise HTTPError(405, f"{method} {path} is not supported")
+        raise HTTPError(404, f"No route {method} {path}")
+
+    async def _stream(self, job: Job, reader, writer, cancelOnClose: bool):
+        """
+        Writes a job's events as NDJSON chunks until it finishes, waiting for each write to drain.
+        The client sends nothing more, so reading end-of-file means it hung up.
+        """
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        hangup = asyncio.ensure_future(reader.read(1))
+        try:
+            index = 0
+            while True:
+                while index < len(job.events):
+                    data = json.dumps(job.events[index]).encode() + b"\n"
+                    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    await writer.drain()
+                    index += 1
+                if job.finished:
+                    break
+                wake = asyncio.ensure_future(job.wait())
+                done, pending = await asyncio.wait({wake, hangup}, return_when=asyncio.FIRST_COMPLETED)
+                if hangup in done:
+                    wake.cancel()
+                    if not hangup.result():
+                        raise ConnectionResetError("client hung up")
+                    hangup = asyncio.ensure_future(reader.read(1))
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            if cancelOnClose:
+                self.cancel(job.jobId)
+            raise
+        finally:
+            hangup.cancel()
+
+
+async def _read_request(reader: asyncio.StreamReader, maxBody: int):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("no request")
+    try:
+        method, path, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line") from None
+    headers = {}
+    for _ in range(_MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HTTPError(400, "Too many headers")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Bad Content-Length") from None
+    if length > maxBody:
+        raise HTTPError(413, f"Request bodies are limited to {maxBody} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, body
+
+
+def _json_body(body: bytes):
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise HTTPError(400, f"Invalid JSON: {e}") from None
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, document, headers: Dict[str, str] = None):
+    data = json.dumps(document).encode()
+    head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Content-Type: application/json",
+            f"Content-Length: {len(data)}", "Connection: close"]
+    head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+    await writer.drain()
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **options):
+    """
+    Runs a PlanningService until cancelled; options are PlanningService's parameters.
+    """
+    service = PlanningService(**options)
+    server = await service.start(host, port)
+    print(f"Planning service on {', '.join(str(sock.getsockname()) for sock in server.sockets)}")
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve experiment planning over HTTP/JSON.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (defaults to the CPU count)")
+    parser.add_argument("--max-queued", type=int, default=DEFAULT_MAX_QUEUED, help="jobs waiting before 503s")
+    parser.add_argument("--inventory", help="an inventory JSON file in the inventory_to_dict format")
+    args = parser.parse_args(argv)
+    inventory = None
+    if args.inventory:
+        with open(args.inventory) as f:
+            inventory = inventory_from_dict(json.load(f))
+    try:
+        asyncio.run(serve(args.host, args.port, maxWorkers=args.workers, maxQueued=args.max_queued,
+                          inventory=inventory))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Plate layouts for the reactions of a lab packet.
+
+Reaction sheets list their samples as tubes in 9x9 boxes; a liquid handler sets the reactions up in
+96- or 384-well plates. layout_packet assigns every reaction a plate and well:
+
+1. Runs. Consecutive reaction sheets with the same thermocycler program (the digest sheets split
+   by enzyme set, Golden Gate and Gibson) form one run and share plates, so each plate is
+   thermocycled once for the whole run. Each run gets the densest plate type whose wells hold its
+   largest reaction.
+2. Blocks. Each sheet's reactions (one recipe, one enzyme set) fill whole columns of a plate, so an
+   8- or 16-channel head dispensing the sheet's stocks or mastermix covers a column of the same
+   recipe at a time. Blocks are packed into the run's plates largest first, first fit by columns;
+   a block bigger than a plate fills whole plates first.
+3. Travel. Within a block, reactions are paired with wells greedily (sources sorted by deck
+   position against wells column by column), then improved by swapping pairs of wells while that
+   shortens the total source-to-destination distance, for a few passes per plate.
+
+Distances come from a simple deck model: tube boxes in one row of deck slots and plates in the row
+behind, slots reused in turn when there are more boxes or plates than slots.
+"""
+import math
+from typing import Dict, List, Sequence, Tuple
+from src.models.autoprotocol import *
+from src.models.labplanner import *
+from src.utils.mastermix import expand_recipe, sheet_enzymes, step_on_sheet
+
+# Plate types a layout can use: (rows, columns, well capacity in microliters)
+PLATE_TYPES = {
+    "96-pcr": (8, 12, 160.0),
+    "384-pcr": (16, 24, 40.0),
+}
+DEFAULT_PLATE_TYPES = ("96-pcr",)
+
+# Deck geometry, in millimeters
+DECK_SLOTS = 6
+SLOT_PITCH = 140.0
+PLATE_ROW_Y = 160.0
+TUBE_PITCH = 13.0
+PLATE_WIDTH = 108.0     # from the first to past the last column, so pitch = PLATE_WIDTH / columns
+
+# Swap passes over each plate block in the local search
+DEFAULT_PASSES = 3
+
+
+def _pcr_reactions(lab_sheet):
+    reactions = []
+    for i, step in enumerate(lab_sheet.steps):
+        forward, reverse, template = lab_sheet.sources[3 * i:3 * i + 3]
+        samples = ((Reagent.primer1, forward[0]), (Reagent.primer2, reverse[0]), (Reagent.template, template[0]))
+        reactions.append(Reaction(step.output, samples))
+    return reactions
+
+
+def _digest_reactions(lab_sheet):
+    steps = {step.output: step for step in lab_sheet.steps}
+    enzymes = sheet_enzymes(lab_sheet)
+    return [Reaction(product, ((Reagent.dna, source),), destination)
+            for (source, dna), (destination, product) in zip(lab_sheet.sources, lab_sheet.destinations)
+            if step_on_sheet(steps[product], enzymes)]
+
+
+def _ligate_reactions(lab_sheet):
+    return [Reaction(product, tuple((Reagent.dna, location) for location, dna in dnaLocs), destination)
+            for dnaLocs, (destination, product) in zip(lab_sheet.sources, lab_sheet.destinations)]
+
+
+def _assembly_reactions(lab_sheet):
+    sourceOf = {dna: location for location, dna in lab_sheet.sources}
+    enzymes = sheet_enzymes(lab_sheet)
+    return [Reaction(step.output, tuple((Reagent.dna, sourceOf[dna]) for dna in step.dnas))
+            for step in lab_sheet.steps if step_on_sheet(step, enzymes)]
+
+
+# sheetType -> the reactions set up on a sheet of that type; Gibson sheets have the GoldenGate type
+REACTION_SHEETS = {
+    PCR: _pcr_reactions,
+    Digest: _digest_reactions,
+    Ligate: _ligate_reactions,
+    GoldenGate: _assembly_reactions,
+}
+
+
+def lab_sheet_reactions(lab_sheet: LabSheet) -> List[Reaction]:
+    """
+    Returns the reactions set up on a sheet, each with the tubes its samples come from: one per step
+    on the sheet (see mastermix.step_on_sheet). Sheets that set up no reactions give an empty list.
+    """
+    extract = REACTION_SHEETS.get(lab_sheet.sheetType)
+    if extract is None or lab_sheet.reaction is None:
+        return []
+    return extract(lab_sheet)
+
+
+def reaction_volumes(recipe: Recipe, reactions: Sequence[Reaction]) -> List[float]:
+    """
+    Returns the volume of each reaction: the recipe's stocks plus one sample volume per sample.
+    """
+    components = expand_recipe(recipe)
+    shared = sum(volume for reagent, volume in components if reagent not in ABSTRACT_REAGENTS)
+    sampleVolume = {reagent: volume for reagent, volume in components if reagent in ABSTRACT_REAGENTS}
+    return [shared + sum(sampleVolume[reagent] for reagent, location in reaction.samples) for reaction in reactions]
+
+
+def choose_plate_type(volume: float, plateTypes: Sequence[str] = DEFAULT_PLATE_TYPES) -> str:
+    """
+    Returns the plate type with the most wells whose wells hold volume.
+    """
+    fits = [plateType for plateType in plateTypes if PLATE_TYPES[plateType][2] >= volume]
+    if not fits:
+        raise ValueError(f"No plate type in {list(plateTypes)} holds a {volume}uL reaction")
+    return max(fits, key=lambda plateType: PLATE_TYPES[plateType][0] * PLATE_TYPES[plateType][1])
+
+
+class _Deck:
+    """
+    Positions of tubes and wells on the deck model.
+    """
+
+    def __init__(self, boxNames: Sequence[str]):
+        self.boxSlots = {name: i % DECK_SLOTS for i, name in enumerate(sorted(boxNames))}
+
+    def tube(self, location: Location) -> Tuple[float, float]:
+        return (self.boxSlots[location.boxname] * SLOT_PITCH + location.col * TUBE_PITCH,
+                location.row * TUBE_PITCH)
+
+    def well(self, plate: int, plateType: str, well: int) -> Tuple[float, float]:
+        rows, cols, capacity = PLATE_TYPES[plateType]
+        pitch = PLATE_WIDTH / cols
+        return ((plate % DECK_SLOTS) * SLOT_PITCH + (well % cols) * pitch,
+                PLATE_ROW_Y + (well // cols) * pitch)
+
+
+def _travel(sources: Sequence[Tuple[float, float]], x: float, y: float) -> float:
+    return sum(math.hypot(sx - x, sy - y) for sx, sy in sources)
+
+
+def improve_assignment(cost: List[List[float]], order: List[int], passes: int = DEFAULT_PASSES) -> List[int]:
+    """
+    Local search over an assignment of reactions to wells: order[i] is the well of reaction i and
+    cost[i][w] the cost of putting reaction i in well w. Swaps the wells of two reactions whenever
+    that lowers the total, for up to passes sweeps or until a sweep changes nothing.
+    """
+    count = len(order)
+    for _ in range(passes):
+        swapped = False
+        for i in range(count):
+            row = cost[i]
+            for j in range(i + 1, count):
+                a, b = order[i], order[j]
+                other = cost[j]
+                if row[b] + other[a] < row[a] + other[b] - 1e-9:
+                    order[i], order[j] = b, a
+                    swapped = True
+        if not swapped:
+            break
+    return order
+
+
+def _runs(lab_packet: LabPacket, reactionsBySheet: Dict[int, List[Reaction]]) -> List[List[int]]:
+    runs = []
+    lastProgram = None
+    for index, sheet in enumerate(lab_packet.labsheets):
+        if sheet.sheetType not in REACTION_SHEETS:
+            lastProgram = None
+            continue
+        if sheet.program == lastProgram:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+        lastProgram = sheet.program
+    return [run for run in runs if any(reactionsBySheet.get(index) for index in run)]
+
+
+def layout_packet(lab_packet: LabPacket, plateTypes: Sequence[str] = DEFAULT_PLATE_TYPES,
+                  passes: int = DEFAULT_PASSES) -> PlateLayout:
+    """
+    Lays out every reaction of a lab packet on plates.
+
+    Parameters:
+        lab_packet: the LabPacket
+        plateTypes: the plate types to choose from, per run (see choose_plate_type)
+        passes: swap passes of the local search per plate block
+
+    Returns:
+        A PlateLayout whose well_of(sheet index, product) gives each reaction's plate and well.
+    """
+    sheets = lab_packet.labsheets
+    reactionsBySheet = {index: lab_sheet_reactions(sheet) for index, sheet in enumerate(sheets)}
+    deck = _Deck({location.boxname for reactions in reactionsBySheet.values()
+                  for reaction in reactions for reagent, location in reaction.samples})
+
+    plates = []
+    assignments = []
+    travel = 0.0
+    runs = _runs(lab_packet, reactionsBySheet)
+    for run in runs:
+        blocks = [(index, reactionsBySheet[index]) for index in run if reactionsBySheet[index]]
+        volume = max(max(reaction_volumes(sheets[index].reaction, reactions)) for index, reactions in blocks)
+        plateType = choose_plate_type(volume, plateTypes)
+        rows, cols, capacity = PLATE_TYPES[plateType]
+        first = len(plates)
+        freeColumns = []            # per plate of the run, the first free column
+        plateSheets = []
+        placements = []             # (sheet index, reactions, plate, first column)
+
+        def new_plate():
+            freeColumns.append(0)
+            plateSheets.append([])
+            return len(freeColumns) - 1
+
+        for index, reactions in sorted(blocks, key=lambda block: -len(block[1])):
+            sources = {id(reaction): [deck.tube(location) for reagent, location in reaction.samples]
+                       for reaction in reactions}
+            ordered = sorted(reactions, key=lambda reaction: _mean(sources[id(reaction)]))
+            while len(ordered) >= rows * cols:
+                plate = new_plate()
+                placements.append((index, ordered[:rows * cols], plate, 0, sources))
+                freeColumns[plate] = cols
+                plateSheets[plate].append(index)
+                ordered = ordered[rows * cols:]
+            if not ordered:
+                continue
+            need = -(-len(ordered) // rows)
+            plate = next((p for p, free in enumerate(freeColumns) if cols - free >= need), None)
+            if plate is None:
+                plate = new_plate()
+            placements.append((index, ordered, plate, freeColumns[plate], sources))
+            freeColumns[plate] += need
+            plateSheets[plate].append(index)
+
+        for plateSheetList in plateSheets:
+            name = f"{sheets[min(plateSheetList)].sheetType.__name__.lower()}_rxn{len(plates)}"
+            plates.append(LayoutPlate(plateType, sheets[run[0]].program, tuple(sorted(plateSheetList)), name))
+
+        for index, reactions, plate, column, sources in placements:
+            wells = [(column + k // rows) + (k % rows) * cols for k in range(len(reactions))]
+            positions = [deck.well(first + plate, plateType, well) for well in wells]
+            cost = [[_travel(sources[id(reaction)], x, y) for x, y in positions] for reaction in reactions]
+            order = improve_assignment(cost, list(range(len(reactions))), passes)
+            for i, reaction in enumerate(reactions):
+                assignments.append(WellAssignment(index, reaction.product, first + plate, wells[order[i]]))
+                travel += cost[i][order[i]]
+
+    return PlateLayout(tuple(plates), tuple(assignments), tuple(tuple(run) for run in runs), travel)
+
+
+def _mean(points: Sequence[Tuple[float, float]]) -> Tuple[float, float]:
+    if not points:
+        return (0.0, 0.0)
+    return (sum(x for x, y in points) / len(points), sum(y for x, y in points) / len(points))
@@ -0,0 +1,187 @@
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+class Profiler:
+    """
+    Collects wall time, call counts and (optionally) peak traced memory for named pipeline stages.
+
+    Stages nest: a stage's time and peak memory include everything run inside it.
+    Peak memory comes from tracemalloc, which traces the whole process, so numbers recorded
+    while several threads run stages at once include each other's allocations.
+    """
+
+    def __init__(self, trackMemory: bool = False, cprofile: bool = False):
+        self.trackMemory = trackMemory
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._startedTracemalloc = False
+        self._cprofile = cProfile.Profile() if cprofile else None
+
+    def start(self):
+        """
+        starts tracemalloc and cProfile collection if they were requested.
+        """
+        if self.trackMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._startedTracemalloc = True
+        if self._cprofile:
+            self._cprofile.enable()
+
+    def stop(self):
+        """
+        stops any tracemalloc and cProfile collection started by this profiler.
+        """
+        if self._cprofile:
+            self._cprofile.disable()
+        if self._startedTracemalloc:
+            tracemalloc.stop()
+            self._startedTracemalloc = False
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        times the enclosed block and records it under the given stage name.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        tracing = self.trackMemory and tracemalloc.is_tracing()
+        frame = {"peak": 0, "base": 0}
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # resetting the peak for this stage would lose the enclosing stage's peak, so keep it
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            frame["base"] = current
+            tracemalloc.reset_peak()
+        stack.append(frame)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            peakBytes = None
+            if tracing and tracemalloc.is_tracing():
+                peak = max(tracemalloc.get_traced_memory()[1], frame["peak"])
+                if stack:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+                peakBytes = max(peak - frame["base"], 0)
+            self._record(name, elapsed, peakBytes)
+
+    def _record(self, name, elapsed, peakBytes):
+        with self._lock:
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = self.stats[name] = {"calls": 0, "total_s": 0.0, "max_s": 0.0, "peak_bytes": None}
+            entry["calls"] += 1
+            entry["total_s"] += elapsed
+            entry["max_s"] = max(entry["max_s"], elapsed)
+            if peakBytes is not None:
+                entry["peak_bytes"] = max(entry["peak_bytes"] or 0, peakBytes)
+
+    def report(self, cprofileLimit: int = 25) -> dict:
+        """
+        builds a JSON-compatible report of every recorded stage.
+
+        Parameters:
+            cprofileLimit: how many functions to include from the cProfile capture, sorted by cumulative time
+
+        Returns:
+            A dict with a "stages" entry (name -> calls, total_s, mean_s, max_s, peak_bytes),
+            plus a "cprofile" entry when cProfile capture is on.
+        """
+        with self._lock:
+            stages = {
+                name: dict(entry, mean_s=entry["total_s"] / entry["calls"])
+                for name, entry in self.stats.items()
+            }
+        report = {"stages": stages}
+        if self._cprofile:
+            out = io.StringIO()
+            pstats.Stats(self._cprofile, stream=out).sort_stats("cumulative").print_stats(cprofileLimit)
+            report["cprofile"] = out.getvalue()
+        return report
+
+    def to_json(self, filepath: str = None, cprofileLimit: int = 25) -> str:
+        """
+        returns the report as a JSON string, and writes it to filepath when one is given.
+        """
+        text = json.dumps(self.report(cprofileLimit), indent=4)
+        if filepath:
+            with open(filepath, "w") as f:
+                f.write(text)
+        return text
+
+
+# Module-level switch: profiling is off until enable() is called, and stage() is then a no-op.
+
+_active = None
+_NULL_STAGE = nullcontext()
+
+def enable(trackMemory: bool = False, cprofile: bool = False) -> Profiler:
+    """
+    Turns on profiling for the planning pipeline.
+
+    Parameters:
+        trackMemory: record peak traced memory per stage with tracemalloc (slower)
+        cprofile: also capture a cProfile of everything run while enabled
+
+    Returns:
+        The active Profiler, whose report() holds the results.
+    """
+    global _active
+    disable()
+    _active = Profiler(trackMemory, cprofile)
+    _active.start()
+    return _active
+
+def disable() -> Profiler:
+    """
+    Turns profiling off and returns the profiler that was active, if any.
+    """
+    global _active
+    profiler, _active = _active, None
+    if profiler:
+        profiler.stop()
+    return profiler
+
+def active() -> Profiler:
+    """
+    Returns the active Profiler, or None when profiling is off.
+    """
+    return _active
+
+def stage(name: str):
+    """
+    Context manager recording the enclosed block under `name` when profiling is on.
+    """
+    profiler = _active
+    if profiler is None:
+        return _NULL_STAGE
+    return profiler.stage(name)
+
+def profiled(name: str):
+    """
+    Decorator recording every call of the wrapped function under `name` when profiling is on.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active
+            if profiler is None:
+                return func(*args, **kwargs)
+            with profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
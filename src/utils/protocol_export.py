@@ -0,0 +1,292 @@
+"""
+Streaming Autoprotocol JSON export.
+
+A protocol is written as the document Protocol.as_dict() describes, but instruction by instruction:
+"instructions" comes first, so instructions can be written as they are generated and dropped, and
+the refs (and "outs", the well names and properties) are written last, once every ref exists. Only
+one instruction is ever serialized at a time.
+
+With ndjson=True a protocol is written as newline-delimited records instead, each holding up to
+chunkSize instructions, then one record with the rest of the document:
+
+    {"protocol": name, "instructions": [...]}
+    {"protocol": name, "instructions": [...]}
+    {"protocol": name, "outs": {...}, "refs": {...}}
+
+A batch file holds many protocols one after another, each on one line (or, with ndjson=True, on its
+run of record lines), and ends with an index line giving each protocol's byte range:
+
+    {"index": {name: {"offset", "length", "instructions", "refs"}}}
+
+so read_protocol can pick one protocol out of a batch without reading the rest.
+"""
+import json
+import os
+from typing import Dict, Iterable, Optional
+from autoprotocol.container import Container, Well, WellGroup
+from autoprotocol.instruction import Instruction
+
+# Instructions per record in ndjson mode
+DEFAULT_CHUNK_SIZE = 256
+
+_PLAIN = {str, int, float, bool, type(None)}
+
+# Bytes read at a time when looking for the index line at the end of a batch file
+_TAIL_BLOCK = 1 << 16
+
+
+class Refifier:
+    """
+    Converts instructions to their Autoprotocol JSON form as Protocol._refify does, but looks ref
+    names up in a table instead of scanning every ref for each container an instruction names
+    (which makes refifying a protocol quadratic in its size). The table is rebuilt when a container
+    is missing from it, since refs are still being added while instructions stream out.
+    """
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.names = {}
+
+    def name(self, container) -> Optional[str]:
+        name = self.names.get(id(container))
+        if name is None:
+            self.names = {id(ref.container): key for key, ref in self.protocol.refs.items()}
+            name = self.names.get(id(container))
+        return name
+
+    def __call__(self, value):
+        kind = type(value)
+        if kind is dict:
+            return {key: self(item) for key, item in value.items()}
+        if kind is list:
+            return [self(item) for item in value]
+        if isinstance(value, Well):
+            return f"{self.name(value.container)}/{value.index}"
+        if isinstance(value, WellGroup):
+            return [f"{self.name(well.container)}/{well.index}" for well in value.wells]
+        if isinstance(value, Container):
+            return self.name(value)
+        if isinstance(value, Instruction):
+            return self(value._as_AST())
+        if kind in _PLAIN:
+            return value
+        # units, refs, compounds and informatics: rare enough for the protocol's own conversion
+        return self.protocol._refify(value)
+
+
+def protocol_tail(protocol) -> dict:
+    """
+    Returns protocol.as_dict() without its instructions: the refs, outs and time constraints, in
+    as_dict's key order.
+    """
+    instructions = protocol.instructions
+    protocol.instructions = []
+    try:
+        tail = protocol.as_dict()
+    finally:
+        protocol.instructions = instructions
+    del tail["instructions"]
+    return tail
+
+
+class ProtocolWriter:
+    """
+    Writes protocols to a text file as they are generated (see the module docstring for the layout).
+    Everything is written with ensure_ascii, so characters written are bytes written.
+    """
+
+    def __init__(self, f, ndjson: bool = False, compact: bool = True, chunkSize: int = DEFAULT_CHUNK_SIZE):
+        """
+        Parameters:
+            f: a writable text file
+            ndjson: write newline-delimited records of up to chunkSize instructions
+            compact: write without spaces between tokens
+            chunkSize: instructions per record in ndjson mode
+        """
+        self.f = f
+        self.ndjson = ndjson
+        self.chunkSize = chunkSize
+        self.encoder = json.JSONEncoder(separators=(",", ":") if compact else (", ", ": "))
+        self.written = 0
+        self.index: Dict[str, dict] = {}
+
+    def _emit(self, text: str):
+        self.f.write(text)
+        self.written += len(text)
+
+    def write(self, protocol, instructions: Iterable = None, name: str = None, batch: bool = False) -> dict:
+        """
+        Writes one protocol.
+
+        Parameters:
+            protocol: the autoprotocol Protocol whose refs the instructions use
+            instructions: the instructions to write, e.g. a generator producing them; defaults to
+                protocol.instructions. The refs are read after the last instruction is written.
+            name: the protocol's name in records and in the index
+            batch: write the protocol as a batch entry, on its own line(s) and named in the records
+
+        Returns:
+            The protocol's index entry: {"offset", "length", "instructions", "refs"}.
+        """
+        if instructions is None:
+            instructions = protocol.instructions
+        named = self.ndjson or batch
+        if named and name is None:
+            raise ValueError("A protocol written as records needs a name")
+        if batch and name in self.index:
+            raise ValueError(f"Duplicate protocol name in batch: {name}")
+        encode = self.encoder.encode
+        separator = self.encoder.item_separator
+        offset = self.written
+        prefix = encode({"protocol": name})[:-1] + separator if named else "{"
+        head = prefix + json.dumps("instructions") + self.encoder.key_separator + "["
+        refify = Refifier(protocol)
+        count = 0
+        if self.ndjson:
+            chunk = []
+            for instruction in instructions:
+                chunk.append(encode(refify(instruction)))
+                count += 1
+                if len(chunk) == self.chunkSize:
+                    self._emit(head + separator.join(chunk) + "]}\n")
+                    chunk = []
+            if chunk:
+                self._emit(head + separator.join(chunk) + "]}\n")
+            self._emit(self._close(prefix, protocol, "\n"))
+        else:
+            self._emit(head)
+            for instruction in instructions:
+                self._emit((separator if count else "") + encode(refify(instruction)))
+                count += 1
+            self._emit(self._close("]" + separator, protocol, "\n" if batch else ""))
+        entry = {"offset": offset, "length": self.written - offset, "instructions": count,
+                 "refs": len(protocol.refs)}
+        if batch:
+            self.index[name] = entry
+        return entry
+
+    def _close(self, prefix: str, protocol, end: str) -> str:
+        """
+        Returns the rest of a protocol's document after its instructions: prefix and the refs and
+        outs, closing the object.
+        """
+        tail = protocol_tail(protocol)
+        if not tail:
+            return prefix[:-len(self.encoder.item_separator)] + "}" + end
+        return prefix + self.encoder.encode(tail)[1:] + end
+
+    def write_index(self):
+        """
+        Ends a batch with its index line.
+        """
+        self._emit(self.encoder.encode({"index": self.index}) + "\n")
+
+
+def export_protocol(protocol, filepath: str, instructions: Iterable = None, ndjson: bool = False,
+                    compact: bool = True, chunkSize: int = DEFAULT_CHUNK_SIZE, name: str = "protocol") -> int:
+    """
+    Writes one protocol to filepath, streaming its instructions.
+
+    Parameters:
+        protocol: the autoprotocol Protocol
+        filepath: the output path
+        instructions: the instructions to write as they are produced (defaults to protocol.instructions)
+        ndjson: write newline-delimited records of up to chunkSize instructions
+        compact: write without spaces between tokens
+        chunkSize: instructions per record in ndjson mode
+        name: the protocol's name in ndjson records
+
+    Returns:
+        The number of bytes written.
+    """
+    with open(filepath, "w") as f:
+        writer = ProtocolWriter(f, ndjson, compact, chunkSize)
+        writer.write(protocol, instructions, name if ndjson else None)
+    return writer.written
+
+
+def export_protocols(protocols: Iterable[tuple], filepath: str, ndjson: bool = False, compact: bool = True,
+                     chunkSize: int = DEFAULT_CHUNK_SIZE) -> Dict[str, dict]:
+    """
+    Writes a batch of protocols to one file, followed by their index. protocols is consumed lazily,
+    so each protocol can be generated, written and dropped before the next is made.
+
+    Parameters:
+        protocols: (name, protocol) or (name, protocol, instructions) tuples
+        filepath: the output path
+        ndjson: write each protocol as records of up to chunkSize instructions, not one line
+        compact: write without spaces between tokens
+        chunkSize: instructions per record in ndjson mode
+
+    Returns:
+        The index: {name: {"offset", "length", "instructions", "refs"}}.
+    """
+    with open(filepath, "w") as f:
+        writer = ProtocolWriter(f, ndjson, compact, chunkSize)
+        for item in protocols:
+            name, protocol = item[:2]
+            writer.write(protocol, item[2] if len(item) > 2 else None, name, batch=True)
+        writer.write_index()
+    return writer.index
+
+
+def read_protocol_index(filepath: str) -> Dict[str, dict]:
+    """
+    Reads the index line at the end of a batch file, without reading the protocols before it.
+    """
+    with open(filepath, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        tail = b""
+        position = end
+        # the file ends with a newline, so the index line starts after the one before it
+        while position > 0 and tail.count(b"\n") < 2:
+            step = min(_TAIL_BLOCK, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+    line = tail.rstrip(b"\n").rsplit(b"\n", 1)[-1]
+    record = json.loads(line)
+    if "index" not in record:
+        raise ValueError(f"{filepath} is not a protocol batch file")
+    return record["index"]
+
+
+def _merge_records(lines: Iterable) -> dict:
+    document = {"instructions": []}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        record.pop("protocol", None)
+        document["instructions"].extend(record.pop("instructions", ()))
+        document.update(record)
+    return document
+
+
+def read_protocol(filepath: str, name: Optional[str] = None) -> dict:
+    """
+    Reads a protocol back as the dict Protocol.as_dict() would give.
+
+    Parameters:
+        filepath: a file written by export_protocol or export_protocols
+        name: the protocol to read from a batch file, found through the index; None reads a
+            single-protocol file
+
+    Returns:
+        The protocol document, with keys "instructions", "refs" and (when present) "outs" and
+        "time_constraints".
+    """
+    if name is not None:
+        entry = read_protocol_index(filepath).get(name)
+        if entry is None:
+            raise KeyError(f"No protocol named {name} in {filepath}")
+        with open(filepath, "rb") as f:
+            f.seek(entry["offset"])
+            data = f.read(entry["length"])
+        return _merge_records(data.decode("ascii").splitlines())
+    with open(filepath) as f:
+        first = f.readline()
+        record = json.loads(first)
+        if "protocol" not in record:
+            return record
+        return _merge_records([first] + list(f))
@@ -0,0 +1,275 @@
+"""
+An optimization pass over a generated Autoprotocol instruction list.
+
+1. Dependencies. Each instruction reads, adds to, or rewrites wells and containers: a transfer
+   reads its source and adds to its destination, a provision adds, and container-level ops
+   (thermocycle, seal, spin, ...) rewrite the whole container. Two instructions are independent
+   unless one rewrites something the other touches, or one reads what the other adds to; adds
+   commute with adds and reads with reads.
+2. Reordering. Instructions are list-scheduled in dependency order, preferring a transfer from the
+   source of the one just emitted (so they can share a tip), then an instruction on a container
+   already on the deck, then the original order.
+3. Merging. Back-to-back transfers from the same source well that never aspirate at their
+   destinations become one liquid_handle instruction, which Autoprotocol runs with one tip (the
+   shape Protocol.transfer(..., one_tip=True) produces).
+4. Thermocycles. Adjacent identical groups in a program are folded into one group with the cycles
+   added up. Thermocycles themselves are never dropped: a plate cycled twice was cycled twice on
+   purpose, and the simulator records both.
+
+optimize_protocol replays the protocol before and after in the simulator and reports whether the
+end states match.
+"""
+import heapq
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from autoprotocol.instruction import LiquidHandle
+from src.utils.simulator import estimate_runtime, liquid_volumes, normalize_groups, same_state, simulate, well_key
+
+READ, ADD, WRITE = "read", "add", "write"
+
+# Ops that only change the wells they name; anything else not listed rewrites the containers it names
+_WELL_OPS = {"provision", "liquid_handle"}
+
+_GLOBAL = ("global",)
+
+
+@dataclass(frozen=True)
+class OptimizationReport:
+    before: Dict[str, int]      # protocol_stats of the instructions going in
+    after: Dict[str, int]       # protocol_stats of the optimized instructions
+    equivalent: Optional[bool]  # whether the simulated end states match (None when not checked)
+
+    def __str__(self):
+        lines = [f"{name:16s} {self.before[name]:8d} -> {self.after[name]:8d}" for name in self.before]
+        if self.equivalent is not None:
+            lines.append(f"same end state: {self.equivalent}")
+        return "\n".join(lines)
+
+
+def containers_of(instruction) -> List[str]:
+    """
+    Returns the names of the containers an instruction touches, in order.
+    """
+    data = instruction.data
+    if instruction.op == "liquid_handle":
+        names = [location["location"].container.name for location in data["locations"]]
+    elif instruction.op == "provision":
+        names = [entry["well"].container.name for entry in data["to"]]
+    elif hasattr(data.get("object"), "name"):
+        names = [data["object"].name]
+    else:
+        return []
+    return list(dict.fromkeys(names))
+
+
+def accesses(instruction) -> List[tuple]:
+    """
+    Returns (key, mode) for everything an instruction touches. Keys are ("well", container, index)
+    or ("container", name); well-level ops hold their containers in READ mode, so they stay ordered
+    around the container-level ops.
+    """
+    op = instruction.op
+    data = instruction.data
+    result = []
+    if op == "liquid_handle":
+        modes = {}
+        for location in data["locations"]:
+            key = ("well",) + well_key(location["location"])
+            for volume in liquid_volumes(location):
+                mode = READ if volume < 0 else ADD
+                modes[key] = mode if modes.get(key, mode) == mode else WRITE
+        result.extend(modes.items())
+    elif op == "provision":
+        result.extend((("well",) + well_key(entry["well"]), ADD) for entry in data["to"])
+    names = containers_of(instruction)
+    if op in _WELL_OPS:
+        result.extend((("container", name), READ) for name in names)
+        result.append((_GLOBAL, READ))
+    elif names:
+        result.extend((("container", name), WRITE) for name in names)
+        result.append((_GLOBAL, READ))
+    else:
+        result.append((_GLOBAL, WRITE))
+    return result
+
+
+def dependencies(instructions) -> List[set]:
+    """
+    Returns, for each instruction, the indices of earlier instructions it must follow.
+    """
+    groups = {}     # key -> [mode, members of the current group, members of the group before]
+    predecessors = []
+    for i, instruction in enumerate(instructions):
+        preds = set()
+        for key, mode in accesses(instruction):
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [mode, [i], []]
+            elif group[0] == mode and mode != WRITE:
+                preds.update(group[2])
+                group[1].append(i)
+            else:
+                preds.update(group[1])
+                groups[key] = [mode, [i], group[1]]
+        preds.discard(i)
+        predecessors.append(preds)
+    return predecessors
+
+
+def merge_key(instruction):
+    """
+    Returns (source well, shape, mode) for a liquid_handle that only moves liquid from one source
+    to destinations it never aspirates from, or None.
+    """
+    if instruction.op != "liquid_handle":
+        return None
+    locations = instruction.data["locations"]
+    if len(locations) < 2 or len(locations) % 2:
+        return None
+    source = well_key(locations[0]["location"])
+    for i in range(0, len(locations), 2):
+        if well_key(locations[i]["location"]) != source:
+            return None
+        if any(volume < 0 for volume in liquid_volumes(locations[i + 1])):
+            return None
+    data = instruction.data
+    return (source, json.dumps(data.get("shape"), sort_keys=True), data.get("mode"),
+            json.dumps(data.get("mode_params"), sort_keys=True, default=str))
+
+
+def schedule(instructions, predecessors) -> List[int]:
+    """
+    Returns an order of the instructions that respects predecessors, chosen greedily to keep
+    same-source transfers adjacent and to stay on the containers already in use.
+    """
+    count = len(instructions)
+    successors = [[] for _ in range(count)]
+    waiting = [len(preds) for preds in predecessors]
+    for i, preds in enumerate(predecessors):
+        for j in preds:
+            successors[j].append(i)
+    keys = [merge_key(instruction) for instruction in instructions]
+    names = [containers_of(instruction) for instruction in instructions]
+
+    ready = []
+    bySource = {}
+    byContainer = {}
+    done = [False] * count
+
+    def push(i):
+        heapq.heappush(ready, i)
+        if keys[i] is not None:
+            heapq.heappush(bySource.setdefault(keys[i], []), i)
+        for name in names[i]:
+            heapq.heappush(byContainer.setdefault(name, []), i)
+
+    def pop(heap):
+        while heap and done[heap[0]]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    for i in range(count):
+        if not waiting[i]:
+            push(i)
+
+    order = []
+    last = None
+    while len(order) < count:
+        pick = None
+        if last is not None and keys[last] is not None:
+            pick = pop(bySource.get(keys[last], []))
+        if pick is None and last is not None:
+            candidates = [pop(byContainer.get(name, [])) for name in names[last]]
+            candidates = [i for i in candidates if i is not None]
+            pick = min(candidates) if candidates else None
+        if pick is None:
+            pick = pop(ready)
+        done[pick] = True
+        order.append(pick)
+        last = pick
+        for j in successors[pick]:
+            waiting[j] -= 1
+            if not waiting[j]:
+                push(j)
+    return order
+
+
+def merge_transfers(instructions) -> list:
+    """
+    Folds runs of back-to-back transfers with the same merge_key into single instructions.
+    """
+    runs = []
+    lastKey = None
+    for instruction in instructions:
+        key = merge_key(instruction)
+        if key is not None and key == lastKey:
+            runs[-1].append(instruction)
+        else:
+            runs.append([instruction])
+        lastKey = key
+    result = []
+    for run in runs:
+        if len(run) == 1:
+            result.append(run[0])
+            continue
+        data = run[0].data
+        locations = [location for instruction in run for location in instruction.data["locations"]]
+        result.append(LiquidHandle(locations, shape=data.get("shape"), mode=data.get("mode"),
+                                   mode_params=data.get("mode_params")))
+    return result
+
+
+def fold_thermocycles(instructions) -> list:
+    """
+    Folds identical adjacent groups within each thermocycle's program, in place.
+    """
+    for instruction in instructions:
+        if instruction.op == "thermocycle":
+            instruction.data["groups"] = normalize_groups(instruction.data["groups"])
+    return instructions
+
+
+def protocol_stats(instructions) -> Dict[str, int]:
+    """
+    Counts instructions, tips (one per liquid_handle instruction) and deck loads (each container an
+    instruction uses that the instruction before did not), with the simulator's runtime estimate.
+    """
+    tips = 0
+    loads = 0
+    previous = set()
+    for instruction in instructions:
+        if instruction.op == "liquid_handle":
+            tips += 1
+        names = set(containers_of(instruction))
+        loads += len(names - previous)
+        previous = names
+    return {"instructions": len(instructions), "tips": tips, "deck_loads": loads,
+            "runtime_s": round(estimate_runtime(instructions)["total_s"])}
+
+
+def optimize_instructions(instructions) -> list:
+    """
+    Returns the optimized instruction list; the instructions given are not reordered in place.
+    """
+    instructions = list(instructions)
+    order = schedule(instructions, dependencies(instructions))
+    return fold_thermocycles(merge_transfers([instructions[i] for i in order]))
+
+
+def optimize_protocol(protocol, verify: bool = True) -> OptimizationReport:
+    """
+    Optimizes a Protocol's instructions in place.
+
+    Parameters:
+        protocol: an autoprotocol Protocol, e.g. AutoprotocolFactory.protocol
+        verify: replay the protocol before and after in the simulator and compare the end states
+
+    Returns:
+        OptimizationReport: the counts before and after, and whether the end states match.
+    """
+    before = protocol_stats(protocol.instructions)
+    expected = simulate(protocol.instructions) if verify else None
+    protocol.instructions[:] = optimize_instructions(protocol.instructions)
+    equivalent = same_state(expected, simulate(protocol.instructions)) if verify else None
+    return OptimizationReport(before, protocol_stats(protocol.instructions), equivalent)
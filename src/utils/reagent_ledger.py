@@ -0,0 +1,226 @@
+"""
+A ledger of the reagent stocks lab packets consume.
+
+Every reaction sheet carries a Recipe: per-reaction volumes of its stocks, alongside abstract
+reagents (template, primers, DNA) that stand for each reaction's own samples and are not counted.
+A sheet uses each stock added to its reactions one by one for all of them, scaled up by the
+overage, plus a dead volume left behind in the aliquot it is dispensed from:
+
+    used = volume per reaction * reactions * (1 + overage) + deadVolume
+
+Stocks premixed in the recipe's mastermix are counted as the totals the mastermix is made up with
+(see utils/mastermix.py), which already include its overage, plus the dead volume.
+
+The ledger records one row per sheet: the experiment, a date, the sheet's recipe and its reaction
+count. Recipes repeat across sheets and experiments, so each distinct recipe is stored once as two
+vectors indexed by reagent code (REAGENT_CODES), the per-reaction volumes and the mastermix
+totals, and a query adds up the reactions and sheets per recipe over the rows it selects, then
+takes reactions x per-reaction vectors + sheets x mastermix vectors. Its cost grows with the
+rows selected plus the few distinct recipes, not with rows x reagents.
+"""
+import datetime
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, Optional
+from src.models.labplanner import *
+from src.models.experiment import *
+from src.utils.mastermix import sheet_reactions
+
+# Column of each Reagent in a recipe vector
+REAGENT_CODES = {reagent: code for code, reagent in enumerate(Reagent)}
+_REAGENTS = list(Reagent)
+
+# Microliters left in the aliquot of each stock a sheet is dispensed from
+DEFAULT_DEAD_VOLUME = 5.0
+
+# Extra fraction of every stock made up for a sheet's reactions, to cover pipetting loss
+DEFAULT_OVERAGE = 0.1
+
+
+def _zeros() -> array:
+    return array("d", bytes(8 * len(_REAGENTS)))
+
+
+def _by_reagent(totals: array, reagent: Optional[Reagent]) -> Dict[Reagent, float]:
+    if reagent is not None:
+        return {reagent: totals[REAGENT_CODES[reagent]]}
+    return {_REAGENTS[code]: volume for code, volume in enumerate(totals) if volume}
+
+
+def _stocks(components) -> Dict[Reagent, float]:
+    stocks = defaultdict(float)
+    for reagent, volume in components or ():
+        if reagent not in ABSTRACT_REAGENTS:
+            stocks[reagent] += volume
+    return dict(stocks)
+
+
+def recipe_stocks(recipe: Recipe) -> Dict[Reagent, float]:
+    """
+    Returns the volume of each stock added to every reaction of a recipe, leaving out abstract
+    reagents and the mastermix.
+    """
+    return _stocks(recipe.reaction)
+
+
+class ReagentLedger:
+    """
+    Totals the stock volumes used by lab packets, queryable by reagent, experiment and date.
+    """
+
+    def __init__(self, deadVolume: float = DEFAULT_DEAD_VOLUME, overage: float = DEFAULT_OVERAGE):
+        '''
+        Parameters:
+            deadVolume: microliters lost per stock per sheet
+            overage: extra fraction of each stock made up per sheet
+        '''
+        self.deadVolume = deadVolume
+        self.overage = overage
+        self.recipes = []           # recipe id -> array of per-reaction volumes, by reagent code
+        self.mastermixes = []       # recipe id -> array of mastermix totals, by reagent code
+        self.recipeIds = {}         # recipe key -> recipe id
+        # one entry per sheet, column by column
+        self.experiments = []
+        self.dates = array("l")     # date ordinals
+        self.sheetRecipes = array("l")
+        self.reactions = array("l")
+
+    def __len__(self):
+        return len(self.reactions)
+
+    def _recipe_id(self, recipe: Recipe) -> int:
+        key = (tuple(recipe.mastermix or ()), tuple(recipe.reaction))
+        recipeId = self.recipeIds.get(key)
+        if recipeId is None:
+            vector = _zeros()
+            for reagent, volume in recipe_stocks(recipe).items():
+                vector[REAGENT_CODES[reagent]] = volume
+            mastermix = _zeros()
+            for reagent, volume in _stocks(recipe.mastermix).items():
+                mastermix[REAGENT_CODES[reagent]] = volume
+            recipeId = self.recipeIds[key] = len(self.recipes)
+            self.recipes.append(vector)
+            self.mastermixes.append(mastermix)
+        return recipeId
+
+    def add_packet(self, lab_packet: LabPacket, experiment: str = None, date: datetime.date = None):
+        """
+        Records the sheets of a lab packet.
+
+        Parameters:
+            lab_packet: the LabPacket
+            experiment: the name to file its usage under
+            date: the day the packet is run (today by default)
+        """
+        ordinal = (date or datetime.date.today()).toordinal()
+        for sheet in lab_packet.labsheets:
+            count = sheet_reactions(sheet)
+            if not count:
+                continue
+            self.experiments.append(experiment)
+            self.dates.append(ordinal)
+            self.sheetRecipes.append(self._recipe_id(sheet.reaction))
+            self.reactions.append(count)
+
+    def add_experiment(self, experiment: Experiment, date: datetime.date = None):
+        """
+        Records an Experiment's lab packet under the experiment's name.
+        """
+        self.add_packet(experiment.labPacket, experiment.name, date)
+
+    def add_experiments(self, experiments: Iterable[Experiment], date: datetime.date = None):
+        """
+        Records a batch of Experiments, e.g. BatchResult.experiments; failed jobs (None) are skipped.
+        """
+        for experiment in experiments:
+            if experiment is not None:
+                self.add_experiment(experiment, date)
+
+    def _rows(self, experiment, since, until) -> Iterable[int]:
+        rows = range(len(self.reactions))
+        if experiment is not None:
+            names = {experiment} if isinstance(experiment, str) else set(experiment)
+            rows = [row for row in rows if self.experiments[row] in names]
+        if since is not None or until is not None:
+            low = since.toordinal() if since is not None else float("-inf")
+            high = until.toordinal() if until is not None else float("inf")
+            rows = [row for row in rows if low <= self.dates[row] <= high]
+        return rows
+
+    def _sum(self, rows) -> array:
+        """
+        Adds up (reactions, sheets) per recipe over rows, then multiplies out the recipe vectors.
+        A stock both premixed and added per reaction is dead volume twice: two aliquots.
+        """
+        reactions = defaultdict(int)
+        sheets = defaultdict(int)
+        for row in rows:
+            recipeId = self.sheetRecipes[row]
+            reactions[recipeId] += self.reactions[row]
+            sheets[recipeId] += 1
+        scale = 1.0 + self.overage
+        totals = _zeros()
+        for recipeId, count in reactions.items():
+            perReaction = count * scale
+            dead = sheets[recipeId] * self.deadVolume
+            for code, volume in enumerate(self.recipes[recipeId]):
+                if volume:
+                    totals[code] += volume * perReaction + dead
+            for code, volume in enumerate(self.mastermixes[recipeId]):
+                if volume:
+                    totals[code] += volume * sheets[recipeId] + dead
+        return totals
+
+    def _grouped(self, rows, key) -> Dict[object, array]:
+        groups = defaultdict(list)
+        for row in rows:
+            groups[key(row)].append(row)
+        return {group: self._sum(groupRows) for group, groupRows in groups.items()}
+
+    def totals(self, reagent: Reagent = None, experiment=None, since: datetime.date = None,
+               until: datetime.date = None) -> Dict[Reagent, float]:
+        """
+        Returns the microliters of each stock used, over the sheets selected.
+
+        Parameters:
+            reagent: only report this Reagent
+            experiment: an experiment name, or several, to select
+            since: the first date to select
+            until: the last date to select (inclusive)
+
+        Returns:
+            {Reagent: microliters} for every stock used.
+        """
+        return _by_reagent(self._sum(self._rows(experiment, since, until)), reagent)
+
+    def by_experiment(self, reagent: Reagent = None, since: datetime.date = None,
+                      until: datetime.date = None) -> Dict[str, Dict[Reagent, float]]:
+        """
+        Returns totals for each experiment recorded (see totals).
+        """
+        groups = self._grouped(self._rows(None, since, until), self.experiments.__getitem__)
+        return {name: _by_reagent(totals, reagent) for name, totals in groups.items()}
+
+    def by_date(self, reagent: Reagent = None, experiment=None) -> Dict[datetime.date, Dict[Reagent, float]]:
+        """
+        Returns totals for each date recorded, in date order (see totals).
+        """
+        groups = self._grouped(self._rows(experiment, None, None), self.dates.__getitem__)
+        return {datetime.date.fromordinal(ordinal): _by_reagent(groups[ordinal], reagent)
+                for ordinal in sorted(groups)}
+
+    def shortfalls(self, stocks: Dict[Reagent, float], experiment=None, since: datetime.date = None,
+                   until: datetime.date = None) -> Dict[Reagent, float]:
+        """
+        Compares the stock on hand with what the selected sheets use.
+
+        Parameters:
+            stocks: {Reagent: microliters on hand}; a stock not listed counts as none
+            experiment, since, until: select sheets as for totals
+
+        Returns:
+            {Reagent: microliters missing} for every stock that would run out.
+        """
+        return {reagent: volume - stocks.get(reagent, 0.0)
+                for reagent, volume in self.totals(None, experiment, since, until).items()
+                if volume > stocks.get(reagent, 0.0)}
@@ -5,133 +5,219 @@ from src.models.inventory import *
 from src.models.labplanner import *
 from src.models.experiment import *
 from string import ascii_uppercase as alcU
+from .profiling import profiled
+from .json_stream import JSONStreamWriter
+from .locations import box_to_dict, extra_lookups_to_dict
+from .atomic_writer import AtomicBatchWriter, WriteStats, atomic_write, streaming, read_manifest
+from .archive import ExperimentArchiveWriter
+from .lab_sheets import render_lab_sheet
+from .metadata import metadata_lines
+from .dirty_tracking import dirty_boxes, extra_lookups, mark_clean, saved_hashes, remember_saved
+
+INVENTORY_INDEX_VERSION = 2
 
 class Saver:
     """
     assembles and saves Experiment objects, including LabPacket, LabSheets, Inventory, and metadata.
+
+    Every file is rendered to text by a render_* method and written atomically; a whole experiment,
+    labpacket or inventory directory is committed as one unit by an AtomicBatchWriter, with a
+    manifest.json listing the files it wrote.
     """
 
-    def save_experiment(self, experiment: Experiment, outdir: str = "data/outputs"):
+    def __init__(self, maxWorkers: int = None, fsync: bool = False):
+        """
+        Parameters:
+            maxWorkers: threads used to render and write files (defaults to the executor's default)
+            fsync: flush every file to disk before it replaces the previous version
+        """
+        self.maxWorkers = maxWorkers
+        self.fsync = fsync
+        self.lastStats: Optional[WriteStats] = None
+
+    def writer(self, outdir: str) -> AtomicBatchWriter:
+        return AtomicBatchWriter(outdir, self.maxWorkers, self.fsync)
+
+    def commit(self, writer: AtomicBatchWriter) -> WriteStats:
+        self.lastStats = writer.commit()
+        return self.lastStats
+
+    @profiled("saver.save_experiment")
+    def save_experiment(self, experiment: Experiment, outdir: str = "data/outputs") -> WriteStats:
 
         """Saves an Experiment object into LabSheets, Inventory, and metadata."""
 
-        os.makedirs(outdir, exist_ok=True)
         experiment_dir = os.path.join(outdir, experiment.name)
-        os.makedirs(experiment_dir, exist_ok=True)
+        writer = self.writer(experiment_dir)
+        saved = self.add_experiment(writer, experiment, read_manifest(experiment_dir))
+        stats = self.commit(writer)
+        self.mark_inventory_saved(experiment.inventory, writer, saved)
+        return stats
+
+    @profiled("saver.save_experiment_archive")
+    def save_experiment_archive(self, experiment: Experiment, path: str):
+        """
+        Saves an Experiment into a single archive file with the same members as the directory
+        written by save_experiment (see archive.ExperimentArchiveWriter).
+        """
+        with ExperimentArchiveWriter(path) as archive:
+            self.add_experiment(archive, experiment)
 
-        # LabPacket, Inventory, and metadata 
-        self.save_metadata(experiment, experiment_dir)
-        self.save_lab_packet(experiment.labPacket, os.path.join(experiment_dir, "labpacket"))
-        self.save_inventory(experiment.inventory, os.path.join(experiment_dir, "inventory"))
+    def add_experiment(self, writer, experiment: Experiment, previous: Optional[dict] = None) -> tuple:
+        """
+        Queues every file of an experiment on writer, an AtomicBatchWriter or ExperimentArchiveWriter.
+
+        Returns:
+            the inventory entries to pass to mark_inventory_saved
+        """
+        # Experiment as JSON, queued first since it is by far the largest file
+        writer.add("experiment.json", streaming(lambda f: JSONStreamWriter(f).write(experiment)))
 
-        # Experiment as JSON
-        self.save_experiment_to_json(experiment, os.path.join(experiment_dir, "experiment.json"))
+        # LabPacket, Inventory, and metadata 
+        writer.add("metadata.txt", lambda: self.render_metadata(experiment))
+        self.add_lab_packet(writer, experiment.labPacket, "labpacket")
+        return self.add_inventory(writer, experiment.inventory, "inventory", previous)
 
+    @profiled("saver.save_metadata")
     def save_metadata(self, experiment: Experiment, outdir: str):
         """
         saves metadata to a text file.
         """
-        metadata_file = os.path.join(outdir, "metadata.txt")
-        with open(metadata_file, "w") as f:
-            f.write(f"Experiment Name: {experiment.name}\n")
-            f.write(f"Oligos: {', '.join(experiment.oligos)}\n")
-            f.write("Polynucleotides:\n")
-            for name, poly in experiment.nameToPoly.items():
-                f.write(f"{name}: {poly.sequence}\n")
+        atomic_write(os.path.join(outdir, "metadata.txt"), self.render_metadata(experiment), self.fsync)
+
+    def render_metadata(self, experiment: Experiment) -> str:
+        """
+        renders metadata in the format of metadata.py, which Deserializer reads back.
+        """
+        return "\n".join(metadata_lines(experiment)) + "\n"
 
-    def save_lab_packet(self, lab_packet: LabPacket, outdir: str):
+    @profiled("saver.save_lab_packet")
+    def save_lab_packet(self, lab_packet: LabPacket, outdir: str) -> WriteStats:
         """
         saves LabSheets in a LabPacket to individual files.
         """
-        os.makedirs(outdir, exist_ok=True)
+        writer = self.writer(outdir)
+        self.add_lab_packet(writer, lab_packet)
+        return self.commit(writer)
+
+    def add_lab_packet(self, writer: AtomicBatchWriter, lab_packet: LabPacket, subdir: str = ""):
         for i, lab_sheet in enumerate(lab_packet.labsheets):
-            outpath = os.path.join(outdir, f"{i}_{lab_sheet.title}.txt")
-            self.save_lab_sheet(lab_sheet, outpath)
+            relpath = self.relpath(subdir, f"{i}_{lab_sheet.title}.txt")
+            writer.add(relpath, lambda lab_sheet=lab_sheet: self.render_lab_sheet(lab_sheet))
 
+    @profiled("saver.save_lab_sheet")
     def save_lab_sheet(self, lab_sheet: LabSheet, outpath: str):
         """
         saves a single LabSheet into a text file
         """
-        with open(outpath, "w") as f:
-            f.write(f"{lab_sheet.title}: {lab_sheet.sheetType}\n")
-            if lab_sheet.program:
-                f.write(f"Program: {lab_sheet.program}\n")
-            if lab_sheet.sources:
-                f.write("Sources:\n")
-                for source in lab_sheet.sources:
-                    f.write("\t".join(source) + "\n")
-            if lab_sheet.destinations:
-                f.write("Destinations:\n")
-                for destination in lab_sheet.destinations:
-                    f.write("\t".join(destination) + "\n")
-            if lab_sheet.notes:
-                f.write("Notes:\n")
-                f.write("\n".join(lab_sheet.notes) + "\n")
-
-    def save_inventory(self, inventory: Inventory, outdir: str):
-        """
-        Saves Inventory to JSON and row-formatted files.
-        """
-        os.makedirs(outdir, exist_ok=True)
-        inventory_json = {"boxes": []}
+        atomic_write(outpath, self.render_lab_sheet(lab_sheet), self.fsync)
 
+    def render_lab_sheet(self, lab_sheet: LabSheet) -> str:
+        """
+        renders a LabSheet in the format of lab_sheets.py, which Deserializer reads back.
+        """
+        return render_lab_sheet(lab_sheet)
+
+    @profiled("saver.save_inventory")
+    def save_inventory(self, inventory: Inventory, outdir: str) -> WriteStats:
+        """
+        Saves Inventory to JSON and row-formatted files. For a tracked inventory (see dirty_tracking)
+        only the boxes changed since the last save are written; the rest are kept as they are.
+        """
+        writer = self.writer(outdir)
+        saved = self.add_inventory(writer, inventory, "", read_manifest(outdir))
+        stats = self.commit(writer)
+        self.mark_inventory_saved(inventory, writer, saved)
+        return stats
+
+    def add_inventory(self, writer: AtomicBatchWriter, inventory: Inventory, subdir: str = "",
+                      previous: Optional[dict] = None) -> tuple:
+        """
+        Queues the inventory files: per box, {i}_Box.txt in row form and {i}_Box.json with the box
+        and the lookup entries of its samples (locations.box_to_dict), plus an inventory.json index
+        naming the box files and holding any lookup entries outside the boxes.
+
+        A box is kept rather than rewritten when the inventory is tracked, the box is not dirty, and
+        the hashes recorded when it was last written match the previous manifest of this directory.
+
+        Parameters:
+            writer: the AtomicBatchWriter for the output directory
+            inventory: the Inventory to save
+            subdir: the inventory directory within the writer's directory
+            previous: the writer directory's manifest from the last commit, or None
+        Returns:
+            (the (box, rows path, data path) entries queued for writing, the extra lookup entries),
+            to pass to mark_inventory_saved after the commit
+        """
+        previousFiles = previous["files"] if previous else {}
+        dirty = dirty_boxes(inventory)
+        shards = []
+        written = []
         for i, box in enumerate(inventory.boxes):
-            box_file = os.path.join(outdir, f"{i}_Box.txt")
-            self.save_box_row_form(box, box_file)
-            inventory_json["boxes"].append(box.to_dict())
-
-        # Save additional Inventory mappings to JSON
-        inventory_json.update({
-            "construct_to_locations": {
-                k: [str(loc) for loc in v] for k, v in inventory.construct_to_locations.items()
-            },
-            "loc_to_conc": {
-                str(k): v.value for k, v in inventory.loc_to_conc.items()
-            },
-            "loc_to_clone": inventory.loc_to_clone,
-            "loc_to_culture": {
-                str(k): v.value for k, v in inventory.loc_to_culture.items()
-            }
-        })
-
-        # Write inventory JSON
-        inventory_json_file = os.path.join(outdir, "inventory.json")
-        with open(inventory_json_file, "w") as f:
-            json.dump(inventory_json, f, indent=4)
+            rows = self.relpath(subdir, f"{i}_Box.txt")
+            data = self.relpath(subdir, f"{i}_Box.json")
+            shards.append(f"{i}_Box.json")
+            hashes = saved_hashes(box)
+            if (dirty is not None and i not in dirty and hashes is not None
+                    and previousFiles.get(rows, {}).get("sha256") == hashes[0]
+                    and previousFiles.get(data, {}).get("sha256") == hashes[1]):
+                writer.keep(rows)
+                writer.keep(data)
+                continue
+            writer.add(rows, lambda box=box: self.render_box_row_form(box))
+            writer.add(data, lambda box=box: json.dumps(box_to_dict(box, inventory), indent=4))
+            written.append((box, rows, data))
+
+        # Only an untracked inventory needs the full scan for entries outside the boxes
+        extra = extra_lookups(inventory) if dirty is not None else extra_lookups_to_dict(inventory)
+        index = {"version": INVENTORY_INDEX_VERSION, "boxes": shards, "extra": extra}
+        writer.add(self.relpath(subdir, "inventory.json"), json.dumps(index, indent=4))
+        return written, extra
+
+    def mark_inventory_saved(self, inventory: Inventory, writer: AtomicBatchWriter, saved: tuple):
+        """
+        Records the hashes of the box files just committed and marks the inventory clean.
+        """
+        written, extra = saved
+        files = writer.manifest["files"]
+        for box, rows, data in written:
+            remember_saved(box, (files[rows]["sha256"], files[data]["sha256"]))
+        mark_clean(inventory, extra)
 
+    def relpath(self, subdir: str, name: str) -> str:
+        return f"{subdir}/{name}" if subdir else name
 
+    @profiled("saver.save_box_row_form")
     def save_box_row_form(self, box: Box, outpath: str):
         """
         saves a Box to a TSV format.
         """
-        with open(outpath, "w") as f:
-            f.write(f">name {box.name}\n")
-            f.write(f">description {box.description}\n")
-            f.write(f">location {box.location}\n")
-            f.write(">samples\n")
-            f.write("Label\tSideLabel\tConcentration\tConstruct\tCulture\tClone\n")
-            for row in box.samples:
-                for sample in row:
-                    if sample:
-                        f.write(f"{sample.label}\t{sample.sidelabel}\t{sample.concentration.value}\t"
-                                f"{sample.construct}\t{sample.culture.value}\t{sample.clone}\n")
+        atomic_write(outpath, self.render_box_row_form(box), self.fsync)
 
- 
-    def save_experiment_to_json(self, experiment: Experiment, filepath: str):
+    def render_box_row_form(self, box: Box) -> str:
         """
-        Saves the entire Experiment object into a single JSON file.
+        Renders a Box in the row form read by Parser.parse_box_row_form: one line per sample,
+        starting with its well (e.g. A0), with None for a missing concentration or culture.
         """
-        experiment_dict = {
-            "name": experiment.name,
-            "oligos": experiment.oligos,
-            "nameToPoly": {k: v.sequence for k, v in experiment.nameToPoly.items()},
-            "labPacket": {"labsheets": [ls.to_dict() for ls in experiment.labPacket.labsheets]},
-            "inventory": {"boxes": [box.to_dict() for box in experiment.inventory.boxes]}
-        }
-
-        with open(filepath, "w") as f:
-            json.dump(experiment_dict, f, indent=4)
-
-
-
-
+        lines = [f">name {box.name}",
+                 f">description {box.description}",
+                 f">location {box.location}",
+                 ">samples",
+                 "Position\tLabel\tSideLabel\tConcentration\tConstruct\tCulture\tClone"]
+        for i, row in enumerate(box.samples):
+            for j, sample in enumerate(row):
+                if sample:
+                    concentration = sample.concentration.value if sample.concentration else None
+                    culture = sample.culture.value if sample.culture else None
+                    lines.append(f"{alcU[i]}{j}\t{sample.label}\t{sample.sidelabel}\t{concentration}\t"
+                                 f"{sample.construct}\t{culture}\t{sample.clone}")
+        return "\n".join(lines) + "\n"
+
+    @profiled("saver.save_experiment_to_json")
+    def save_experiment_to_json(self, experiment: Experiment, filepath: str, compact: bool = False):
+        """
+        Saves the entire Experiment object into a single JSON file, written incrementally so the
+        serialized form is never held in memory. Read it back with deserialize(json.load(f), Experiment).
+        """
+        atomic_write(filepath, streaming(lambda f: JSONStreamWriter(f, compact=compact).write(experiment)),
+                     self.fsync)
@@ -1,15 +1,20 @@
 from dataclasses import asdict, fields, is_dataclass
+from functools import lru_cache
+import typing
 from src.models.inventory import Location
+from src.models.labplanner import *
 from enum import Enum
 
-def serialize(obj):
+def serialize_reflective(obj):
     """
-    Recursively converts a Python object into a JSON-compatible format.
+    Recursively converts a Python object into a JSON-compatible format by inspecting it on every call.
+    `serialize` produces the same output from precompiled per-type encoders; this version is kept as
+    the reference it is tested and benchmarked against.
 
     Handles:
     - Enums: Serialized as their `name`.
     - Dataclasses: Serialized into dictionaries by recursively serializing their fields.
-    - Lists and Sets: Serialized into lists, with each element serialized recursively.
+    - Lists, Tuples and Sets: Serialized into lists, with each element serialized recursively.
     - Dictionaries: Keys and values are serialized recursively. If the keys are `Location` objects,
       they are converted to strings using `location_to_string`.
     - Class objects: Serialized as their `__name__`.
@@ -23,25 +28,26 @@ def serialize(obj):
     """
     if isinstance(obj, Enum):  # Handle Enums
         return obj.name
+    elif isinstance(obj, type):  # Handle class objects, e.g. LabSheet.sheetType (checked before dataclasses,
+        return obj.__name__      # since is_dataclass is also true for a dataclass type itself)
     elif is_dataclass(obj):  # Handle dataclasses
-        return {field.name: serialize(getattr(obj, field.name)) for field in fields(obj)}
-    elif isinstance(obj, list):  # Handle lists
-        return [serialize(item) for item in obj]
+        return {field.name: serialize_reflective(getattr(obj, field.name)) for field in fields(obj)}
+    elif isinstance(obj, (list, tuple)):  # Handle lists and tuples
+        return [serialize_reflective(item) for item in obj]
     elif isinstance(obj, set):  # Handle sets
-        return [serialize(item) for item in obj]
+        return [serialize_reflective(item) for item in obj]
     elif isinstance(obj, dict):  # Handle dictionaries
         if all(isinstance(k, Location) for k in obj.keys()):  # Convert Location keys
-            return {location_to_string(k): serialize(v) for k, v in obj.items()}
-        return {serialize(key): serialize(value) for key, value in obj.items()}
-    elif isinstance(obj, type):  # Handle class objects
-        return obj.__name__
+            return {location_to_string(k): serialize_reflective(v) for k, v in obj.items()}
+        return {serialize_reflective(key): serialize_reflective(value) for key, value in obj.items()}
     else:  # Handle primitives
         return obj
 
 
-def deserialize(data, cls):
+def deserialize_reflective(data, cls):
     """
-    Recursively converts a dictionary to a dataclass instance.
+    Recursively converts a dictionary to a dataclass instance by inspecting the field types on every call.
+    Kept as the reference implementation; `deserialize` uses precompiled per-type decoders instead.
 
     Parameters:
         data: The dictionary to deserialize.
@@ -56,33 +62,36 @@ def deserialize(data, cls):
             field_type = field.type
             field_value = data.get(field.name)
 
+            # Handle missing values
+            if field_value is None:
+                kwargs[field.name] = None
             # Handle nested dataclasses
-            if is_dataclass(field_type):
-                kwargs[field.name] = deserialize(field_value, field_type)
+            elif is_dataclass(field_type):
+                kwargs[field.name] = deserialize_reflective(field_value, field_type)
             # Handle lists of nested dataclasses
             elif hasattr(field_type, "__origin__") and field_type.__origin__ is list:
                 subtype = field_type.__args__[0]
-                kwargs[field.name] = [deserialize(item, subtype) for item in field_value]
+                kwargs[field.name] = [deserialize_reflective(item, subtype) for item in field_value]
             # Handle dictionaries with Location keys
             elif hasattr(field_type, "__origin__") and field_type.__origin__ is dict:
                 key_type, value_type = field_type.__args__
                 if key_type == Location:
                     kwargs[field.name] = {
-                        string_to_location(k): deserialize(v, value_type)
+                        string_to_location(k): deserialize_reflective(v, value_type)
                         for k, v in field_value.items()
                     }
                 else:
                     kwargs[field.name] = {
-                        deserialize(k, key_type): deserialize(v, value_type)
+                        deserialize_reflective(k, key_type): deserialize_reflective(v, value_type)
                         for k, v in field_value.items()
                     }
             # Handle sets
             elif hasattr(field_type, "__origin__") and field_type.__origin__ is set:
                 subtype = field_type.__args__[0]
-                kwargs[field.name] = {deserialize(item, subtype) for item in field_value}
+                kwargs[field.name] = {deserialize_reflective(item, subtype) for item in field_value}
             # Handle Enums
-            elif issubclass(field_type, Enum):
-                kwargs[field.name] = field_type[field_value]
+            elif isinstance(field_type, type) and issubclass(field_type, Enum):
+                kwargs[field.name] = None if field_value is None else field_type[field_value]
             else:
                 kwargs[field.name] = field_value
 
@@ -92,7 +101,13 @@ def deserialize(data, cls):
     
 
 # Helper functions for Location fidelity
+#
+# Both directions are cached: an inventory repeats the same Location across its lookup dicts, and
+# the same keys come back on every save and load.
+
+LOCATION_CACHE_SIZE = 1 << 16
 
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
 def location_to_string(location):
     """
     Converts a Location object to a string for use as a JSON key.
@@ -100,6 +115,7 @@ def location_to_string(location):
     return f"{location.boxname}({location.row},{location.col}):{location.label}:{location.sidelabel}"
 
 
+@lru_cache(maxsize=LOCATION_CACHE_SIZE)
 def string_to_location(location_str):
     """
     Converts a string representation of a Location back into a Location object.
@@ -113,18 +129,18 @@ def string_to_location(location_str):
     Raises:
         ValueError: If the string cannot be parsed into a Location.
     """
-    # Ensure the string contains the expected number of parts
-    parts = location_str.split(":")
-    if len(parts) != 4:
+    # Ensure the string contains the expected number of parts: "box(row,col):label:sidelabel"
+    parts = location_str.split(":", 2)
+    if len(parts) != 3:
         raise ValueError(f"Invalid Location string format: {location_str}")
 
     # Parse the boxname and coordinates
-    box_info, row_col, label, sidelabel = parts
-    if "(" not in box_info or ")" not in box_info:
+    box_info, label, sidelabel = parts
+    if "(" not in box_info or not box_info.endswith(")"):
         raise ValueError(f"Invalid boxname or coordinates in Location string: {location_str}")
 
-    boxname = box_info.split("(")[0]
-    coordinates = box_info.split("(")[1].strip(")").split(",")
+    boxname, _, row_col = box_info[:-1].rpartition("(")
+    coordinates = row_col.split(",")
 
     if len(coordinates) != 2:
         raise ValueError(f"Invalid row,col format in Location string: {location_str}")
@@ -136,5 +152,275 @@ def string_to_location(location_str):
     except ValueError:
         raise ValueError(f"Row and column must be integers in Location string: {location_str}")
 
+    # location_to_string writes missing labels as "None"
+    label = None if label == "None" else label
+    sidelabel = None if sidelabel == "None" else sidelabel
+
     # Construct and return the Location object
     return Location(boxname=boxname, row=row, col=col, label=label, sidelabel=sidelabel)
+
+
+# Precompiled codecs
+#
+# serialize/deserialize generate one encoder and one decoder function per dataclass type the first
+# time they meet it, and cache them. The encoders produce exactly what serialize_reflective does;
+# the decoders follow the declared field types, with a few fixes for fields whose declared type
+# doesn't match what the factories store (see _FIELD_DECODERS and _decode_sheet_entry).
+
+_PRIMITIVES = frozenset({str, int, float, bool, type(None)})
+_ENCODERS = {}
+_DECODERS = {}
+
+# Step.operation -> Step subclass, and Step subclass name -> class, for decoding steps and LabSheet.sheetType
+STEP_TYPES = {cls.__name__: cls for cls in (PCR, Digest, Ligate, GoldenGate, Gibson, Transform, Pick, Miniprep, Gel, Zymo)}
+_STEP_OPERATIONS = dict(STEP_TYPES, **{"Golden Gate": GoldenGate})
+
+
+def serialize(obj):
+    """
+    Converts a Python object into a JSON-compatible format, with the same rules and output as
+    serialize_reflective, using a cached encoder per type.
+
+    Parameters:
+        obj: The object to serialize.
+
+    Returns:
+        A JSON-compatible representation of the object.
+    """
+    cls = obj.__class__
+    if cls in _PRIMITIVES:
+        return obj
+    encoder = _ENCODERS.get(cls)
+    if encoder is None:
+        encoder = _encoder_for(cls)
+    return encoder(obj)
+
+
+def deserialize(data, cls):
+    """
+    Converts serialized data back into an instance of cls using a cached decoder per type.
+
+    Parameters:
+        data: The data to deserialize, as produced by serialize.
+        cls: The dataclass type (or other field type) to convert into.
+
+    Returns:
+        An instance of the specified type; data that does not match the type is returned unchanged.
+    """
+    decoder = _DECODERS.get(cls)
+    if decoder is None:
+        decoder = _decoder_for(cls)
+    return decoder(data)
+
+
+def _identity(value):
+    return value
+
+def _encode_class(cls):
+    return cls.__name__
+
+def _encode_sequence(items):
+    return [item if item.__class__ in _PRIMITIVES else serialize(item) for item in items]
+
+def _encode_dict(mapping):
+    out = {}
+    for key, value in mapping.items():
+        if key.__class__ is not Location:
+            return _encode_plain_dict(mapping)
+        out[location_to_string(key)] = value if value.__class__ in _PRIMITIVES else serialize(value)
+    return out
+
+def _encode_plain_dict(mapping):
+    return {serialize(key): serialize(value) for key, value in mapping.items()}
+
+def _encoder_for(cls):
+    """
+    Builds and caches the encoder for a type, following the order of checks in serialize_reflective.
+    """
+    if issubclass(cls, Enum):
+        encoder = _make_enum_encoder(cls)
+    elif issubclass(cls, type):
+        encoder = _encode_class
+    elif is_dataclass(cls):
+        encoder = _compile_dataclass_encoder(cls)
+    elif issubclass(cls, (list, tuple, set)):
+        encoder = _encode_sequence
+    elif issubclass(cls, dict):
+        encoder = _encode_dict
+    else:
+        encoder = _identity
+    _ENCODERS[cls] = encoder
+    return encoder
+
+def _make_enum_encoder(cls):
+    names = {member: member.name for member in cls}
+    return names.__getitem__
+
+def _compile_dataclass_encoder(cls):
+    """
+    Generates an encoder that reads each field directly and only dispatches for non-primitive values.
+    """
+    names = [field.name for field in fields(cls)]
+    lines = [f"def encode(obj):"]
+    for i, name in enumerate(names):
+        lines.append(f"    v{i} = obj.{name}")
+    items = ", ".join(f"{name!r}: v{i} if v{i}.__class__ in P else S(v{i})" for i, name in enumerate(names))
+    lines.append(f"    return {{{items}}}")
+    namespace = {"P": _PRIMITIVES, "S": serialize}
+    exec("\n".join(lines), namespace)
+    encoder = namespace["encode"]
+    encoder.__qualname__ = f"encode_{cls.__name__}"
+    return encoder
+
+
+def _decoder_for(cls):
+    """
+    Builds and caches the decoder for a field type.
+    """
+    cached = _DECODERS.get(cls)
+    if cached is not None:
+        return cached
+    origin = typing.get_origin(cls)
+    args = typing.get_args(cls)
+
+    if cls is Step:
+        decoder = _decode_step
+    elif origin is typing.Union:
+        options = [arg for arg in args if arg is not type(None)]
+        inner = _decoder_for(options[0]) if len(options) == 1 else _identity
+        decoder = _identity if inner is _identity else (lambda data: None if data is None else inner(data))
+    elif origin in (list, typing.List):
+        inner = _decoder_for(args[0]) if args else _identity
+        if inner is _identity:
+            decoder = _identity
+        else:
+            decoder = lambda data: [inner(item) for item in data] if isinstance(data, list) else data
+    elif origin in (set, typing.Set):
+        inner = _decoder_for(args[0]) if args else _identity
+        decoder = lambda data: {inner(item) for item in data} if isinstance(data, list) else data
+    elif origin in (tuple, typing.Tuple):
+        inners = [_decoder_for(arg) for arg in args]
+        decoder = lambda data: tuple(inner(item) for inner, item in zip(inners, data)) if isinstance(data, list) else data
+    elif origin in (dict, typing.Dict):
+        decoder = _make_dict_decoder(*args)
+    elif isinstance(cls, type) and issubclass(cls, Enum):
+        members = cls.__members__
+        decoder = lambda data: members[data] if data.__class__ is str else data
+    elif isinstance(cls, type) and is_dataclass(cls):
+        decoder = _compile_dataclass_decoder(cls)
+    else:
+        decoder = _identity
+    _DECODERS[cls] = decoder
+    return decoder
+
+def _make_dict_decoder(keyType, valueType):
+    decodeValue = _decoder_for(valueType)
+    if keyType is Location:
+        def decoder(data):
+            if not isinstance(data, dict):
+                return data
+            return {string_to_location(key): decodeValue(value) for key, value in data.items()}
+    else:
+        decodeKey = _decoder_for(keyType)
+        if decodeKey is _identity and decodeValue is _identity:
+            return _identity
+        def decoder(data):
+            if not isinstance(data, dict):
+                return data
+            return {decodeKey(key): decodeValue(value) for key, value in data.items()}
+    return decoder
+
+def _compile_dataclass_decoder(cls):
+    """
+    Generates a decoder that calls the dataclass constructor with each field decoded by its own
+    decoder; fields that need no decoding are passed straight through.
+    """
+    names = [field.name for field in fields(cls)]
+    decoders = []
+    for field in fields(cls):
+        override = _FIELD_DECODERS.get((cls, field.name))
+        decoders.append(override if override else _decoder_for(field.type))
+
+    lines = ["def decode(data):",
+             "    if data.__class__ is not dict:",
+             "        return data",
+             "    get = data.get"]
+    args = ", ".join(
+        f"{name}=get({name!r})" if decoder is _identity else f"{name}=D{i}(get({name!r}))"
+        for i, (name, decoder) in enumerate(zip(names, decoders)))
+    lines.append(f"    return C({args})")
+    namespace = {"C": cls}
+    namespace.update({f"D{i}": decoder for i, decoder in enumerate(decoders)})
+    exec("\n".join(lines), namespace)
+    decoder = namespace["decode"]
+    decoder.__qualname__ = f"decode_{cls.__name__}"
+    return decoder
+
+
+def _decode_step(data):
+    """
+    Decodes a Step: a class name (as stored in LabSheet.sheetType) becomes the Step subclass, and a
+    serialized step becomes an instance of the subclass named by its operation.
+    """
+    if data.__class__ is str:
+        return STEP_TYPES.get(data, data)
+    if data.__class__ is dict:
+        cls = _STEP_OPERATIONS.get(data.get("operation"), Step)
+        return deserialize(data, cls)
+    return data
+
+def _decode_reagent(data):
+    if data.__class__ is str and data in Reagent.__members__:
+        return Reagent[data]
+    return data
+
+def _decode_reagent_list(data):
+    return [_decode_reagent(item) for item in data] if isinstance(data, list) else data
+
+_LOCATION_KEYS = frozenset(field.name for field in fields(Location))
+_decode_location = None  # set below once the decoder cache exists
+
+def _decode_sheet_value(value):
+    if value.__class__ is dict and value.keys() == _LOCATION_KEYS:
+        return _decode_location(value)
+    return value
+
+def _decode_sheet_entry(entry):
+    """
+    Decodes one LabSheet source or destination. LabPacketFactory stores these as tuples that start
+    with a Location, e.g. (Location, construct) or (Location, construct, Concentration); Ligate
+    sources are lists of such tuples, and Gel/Zymo sources are plain strings.
+    """
+    if entry.__class__ is not list:
+        return entry
+    if entry and all(item.__class__ is list for item in entry):
+        return [_decode_sheet_entry(item) for item in entry]
+    return tuple(_decode_sheet_value(item) for item in entry)
+
+def _decode_sheet_entries(data):
+    return [_decode_sheet_entry(entry) for entry in data] if isinstance(data, list) else data
+
+def _decode_lab_sheet(data):
+    sheet = _decode_lab_sheet_fields(data)
+    if not isinstance(sheet, LabSheet) or sheet.sheetType is not PCR:
+        return sheet
+    # PCR sources are (Location, construct, Concentration)
+    sources = [
+        (entry[0], entry[1], Concentration[entry[2]]) + entry[3:]
+        if isinstance(entry, tuple) and len(entry) > 2 and entry[2] in Concentration.__members__ else entry
+        for entry in sheet.sources
+    ]
+    return LabSheet(sheet.title, sheet.sheetType, sheet.steps, sources, sheet.destinations, sheet.program,
+                    sheet.protocol, sheet.instrument, sheet.notes, sheet.reaction)
+
+# Fields whose declared type doesn't describe what the factories store
+_FIELD_DECODERS = {
+    (Digest, "enzymes"): _decode_reagent_list,
+    (GoldenGate, "enzyme"): _decode_reagent,
+    (LabSheet, "sources"): _decode_sheet_entries,
+    (LabSheet, "destinations"): _decode_sheet_entries,
+}
+
+_decode_location = _decoder_for(Location)
+_decode_lab_sheet_fields = _compile_dataclass_decoder(LabSheet)
+_DECODERS[LabSheet] = _decode_lab_sheet
@@ -0,0 +1,407 @@
+"""
+An offline model of what an Autoprotocol instruction list does to its containers, and how long it
+takes.
+
+The simulator replays provisions and liquid handling transport by transport, with the tip as a
+small container of its own, so every well ends up with a volume and a composition: microliters per
+origin, where an origin is a provisioned resource ("resource", id) or the starting contents of a
+well ("well", container, index). Liquid drawn from a well beyond what the protocol put in it comes
+from that well's own starting contents, as for stock tubes taken from the inventory.
+
+Volumes are checked as they change. A well that rises past its container type's capacity is an
+overflow; a well drawn below empty is an underflow, if its volume is known: given in
+initialVolumes, or built up by the protocol from nothing. Wells the protocol only draws from are
+stocks of unknown volume unless unknownStocks is False.
+
+Container-level instructions (thermocycle, incubate, spin, agitate, ...) are recorded in each
+container's history, every one of them: running a program twice is not the same as running it once,
+so an instruction list that drops a repeat does not reach the same end state.
+
+Runtime is estimated from per-instruction costs (DEFAULT_COSTS, in seconds): a fixed cost per op,
+per-location and per-well costs for liquid handling and provisioning, the programmed durations of
+thermocycles, incubations, spins and agitation, and a cost for each container loaded onto the deck.
+
+Each instruction is compiled to plain tuples the first time it is seen and the compiled form is
+cached, so replaying many orderings of the same instructions (as when scoring candidate protocols)
+costs little more than the arithmetic. composition=False tracks volumes only, which is faster still.
+"""
+import json
+import weakref
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+# Volumes closer than this (in microliters) are treated as equal
+TOLERANCE = 1e-6
+
+_TO_MICROLITERS = {"microliter": 1.0, "nanoliter": 1e-3, "milliliter": 1e3, "liter": 1e6}
+_TO_SECONDS = {"second": 1.0, "millisecond": 1e-3, "minute": 60.0, "hour": 3600.0}
+
+# Ops that change a whole container; seal and cover state is not part of the end state
+_CONTAINER_OPS = {"thermocycle", "incubate", "spin", "agitate"}
+
+# Seconds per instruction, used by estimate_runtime; ops not listed cost "default"
+DEFAULT_COSTS = {
+    "default": 10.0,
+    "liquid_handle": 6.0,            # picking up and discarding the tip
+    "liquid_handle_location": 4.0,   # each aspirate or dispense location
+    "provision": 10.0,
+    "provision_well": 1.5,
+    "seal": 20.0,
+    "unseal": 20.0,
+    "cover": 10.0,
+    "uncover": 10.0,
+    "thermocycle": 60.0,             # loading and lid heating, on top of the program
+    "thermocycle_step": 2.0,         # ramping to each step's temperature
+    "incubate": 30.0,
+    "spin": 60.0,
+    "agitate": 15.0,
+    "deck_load": 15.0,               # moving a container onto the deck
+}
+
+
+@dataclass(frozen=True)
+class SimulationIssue:
+    kind: str                   # "overflow" or "underflow"
+    well: Tuple[str, int]       # (container name, well index)
+    instruction: int            # index of the instruction in the list run
+    volume: float               # the well's volume after the instruction, in microliters
+    limit: float                # the capacity for an overflow, 0 for an underflow
+
+
+def microliters(unit) -> float:
+    """
+    Returns an Autoprotocol volume Unit (or "5:microliter" string) in microliters.
+    """
+    if isinstance(unit, str):
+        value, name = unit.split(":")
+        return float(value) * _TO_MICROLITERS[name]
+    return float(unit.magnitude) * _TO_MICROLITERS[unit.unit]
+
+
+def seconds(unit) -> float:
+    """
+    Returns an Autoprotocol duration Unit (or "5:minute" string) in seconds; None is 0.
+    """
+    if unit is None:
+        return 0.0
+    if isinstance(unit, str):
+        value, name = unit.split(":")
+        return float(value) * _TO_SECONDS[name]
+    return float(unit.magnitude) * _TO_SECONDS[unit.unit]
+
+
+def well_key(well) -> Tuple[str, int]:
+    return (well.container.name, well.index)
+
+
+def liquid_volumes(location: dict) -> Iterable[float]:
+    """
+    Yields the liquid (non-air) transport volumes at one liquid_handle location, negative for
+    aspirating into the tip and positive for dispensing from it.
+    """
+    for transport in location["transports"]:
+        volume = transport.get("volume")
+        if volume is None:
+            continue
+        if transport.get("mode_params", {}).get("liquid_class") == "air":
+            continue
+        yield microliters(volume)
+
+
+def normalize_groups(groups: list) -> list:
+    """
+    Returns thermocycle groups with adjacent groups of identical steps folded into one, their
+    cycles added up; the program they describe is the same.
+    """
+    result = []
+    for group in groups:
+        # compared as text: pint cannot compare offset units such as celsius
+        if (result and result[-1].keys() == group.keys()
+                and _canonical(result[-1]["steps"]) == _canonical(group["steps"])):
+            result[-1] = dict(result[-1], cycles=result[-1]["cycles"] + group["cycles"])
+        else:
+            result.append(dict(group))
+    return result
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+@dataclass(frozen=True)
+class CompiledInstruction:
+    op: str
+    action: tuple           # ("add", origin, ((well, uL), ...)) for a provision,
+                            # ("handle", ((well, (uL, ...)), ...)) for liquid handling,
+                            # ("container", name, history entry) for container ops, else ("other",)
+    containers: frozenset   # names of the containers touched
+    capacities: tuple       # (name, max uL) for the containers liquid goes into
+    count: int              # liquid_handle locations or provision wells
+    duration: float         # programmed seconds
+    steps: int              # thermocycle steps run, each with a temperature ramp
+
+
+_compiled = weakref.WeakKeyDictionary()
+
+
+def compile_instruction(instruction) -> CompiledInstruction:
+    """
+    Returns the compiled form of an instruction, cached for as long as the instruction lives.
+    """
+    compiled = _compiled.get(instruction)
+    if compiled is not None:
+        return compiled
+    op = instruction.op
+    data = instruction.data
+    count = 0
+    duration = 0.0
+    steps = 0
+    targets = []
+    if op == "provision":
+        entries = [entry for entry in data["to"] if entry.get("volume") is not None]
+        wells = tuple((well_key(entry["well"]), microliters(entry["volume"])) for entry in entries)
+        action = ("add", ("resource", data["resource_id"]), wells)
+        targets = [entry["well"].container for entry in entries]
+        count = len(wells)
+    elif op == "liquid_handle":
+        locations = tuple((well_key(location["location"]), tuple(liquid_volumes(location)))
+                          for location in data["locations"])
+        action = ("handle", locations)
+        targets = [location["location"].container for location in data["locations"]]
+        count = len(locations)
+    elif op in _CONTAINER_OPS:
+        params = {k: v for k, v in data.items() if k != "object"}
+        if op == "thermocycle":
+            params["groups"] = normalize_groups(params["groups"])
+            for group in params["groups"]:
+                duration += group["cycles"] * sum(seconds(step.get("duration")) for step in group["steps"])
+                steps += group["cycles"] * len(group["steps"])
+        else:
+            duration = seconds(data.get("duration"))
+        action = ("container", data["object"].name, (op, _canonical(params)))
+    else:
+        action = ("other",)
+    if targets:
+        containers = frozenset(container.name for container in targets)
+    else:
+        target = data.get("object") if isinstance(data, dict) else None
+        containers = frozenset([target.name]) if hasattr(target, "name") else frozenset()
+    capacities = tuple({container.name: microliters(container.container_type.true_max_vol_ul)
+                        for container in targets}.items())
+    compiled = _compiled[instruction] = CompiledInstruction(op, action, containers, capacities, count, duration, steps)
+    return compiled
+
+
+def instruction_cost(compiled: CompiledInstruction, costs: dict) -> float:
+    """
+    Returns the seconds one compiled instruction takes, not counting deck loads.
+    """
+    base = costs.get(compiled.op, costs["default"])
+    if compiled.op == "liquid_handle":
+        return base + compiled.count * costs["liquid_handle_location"]
+    if compiled.op == "provision":
+        return base + compiled.count * costs["provision_well"]
+    if compiled.op == "thermocycle":
+        return base + compiled.duration + compiled.steps * costs["thermocycle_step"]
+    return base + compiled.duration
+
+
+def estimate_runtime(instructions, costs: dict = None) -> Dict[str, float]:
+    """
+    Estimates how long a protocol takes to run.
+
+    Parameters:
+        instructions: the Autoprotocol instructions, e.g. protocol.instructions
+        costs: overrides for DEFAULT_COSTS, in seconds
+
+    Returns:
+        {"total_s": seconds, "deck_load": seconds spent loading containers, <op>: seconds per op}
+    """
+    costs = dict(DEFAULT_COSTS, **(costs or {}))
+    byOp = defaultdict(float)
+    previous = frozenset()
+    for instruction in instructions:
+        compiled = compile_instruction(instruction)
+        byOp[compiled.op] += instruction_cost(compiled, costs)
+        byOp["deck_load"] += len(compiled.containers - previous) * costs["deck_load"]
+        previous = compiled.containers
+    result = {"total_s": sum(byOp.values())}
+    result.update(byOp)
+    return result
+
+
+class Simulator:
+    """
+    Replays instructions against a model of the protocol's wells.
+    """
+
+    def __init__(self, initialVolumes: Dict[Tuple[str, int], float] = None, unknownStocks: bool = True,
+                 composition: bool = True, capacities: Dict[str, float] = None):
+        '''
+        Parameters:
+            initialVolumes: starting microliters of wells, by (container name, well index)
+            unknownStocks: treat wells that are drawn from before anything is added to them as
+                stocks of unknown volume, rather than as empty wells that underflow
+            composition: track what each well is made of, not only its volume
+            capacities: maximum microliters per container name, overriding the container types
+        '''
+        self.composition = composition
+        self.unknownStocks = unknownStocks
+        self.capacities = dict(capacities or {})
+        self.wells: Dict[Tuple[str, int], Dict[tuple, float]] = defaultdict(dict)
+        self.volumes: Dict[Tuple[str, int], float] = {}     # wells of known volume
+        self.stocks = set()                                  # wells of unknown volume
+        for key, volume in (initialVolumes or {}).items():
+            self.volumes[key] = volume
+            if composition:
+                self.wells[key][("well",) + key] = volume
+        self.history: Dict[str, list] = defaultdict(list)
+        self.issues: List[SimulationIssue] = []
+        self._index = 0
+
+    def run(self, instructions) -> "Simulator":
+        for instruction in instructions:
+            self.execute(instruction)
+        return self
+
+    def execute(self, instruction):
+        compiled = compile_instruction(instruction)
+        action = compiled.action
+        kind = action[0]
+        if kind == "add":
+            capacities = dict(compiled.capacities)
+            origin = action[1]
+            for key, volume in action[2]:
+                self._add(key, {origin: volume} if self.composition else None, volume, capacities)
+        elif kind == "handle":
+            capacities = dict(compiled.capacities)
+            tip = {}
+            tipVolume = 0.0
+            for key, volumes in action[1]:
+                for volume in volumes:
+                    if volume < 0:
+                        drawn = self._draw(key, -volume)
+                        tipVolume -= volume
+                        if drawn:
+                            self._merge(tip, drawn)
+                    elif volume > 0:
+                        taken = self._take(tip, volume, tipVolume) if self.composition else None
+                        tipVolume = max(tipVolume - volume, 0.0)
+                        self._add(key, taken, volume, capacities)
+        elif kind == "container":
+            self.history[action[1]].append(action[2])
+        self._index += 1
+
+    def _add(self, key, mixture, volume: float, capacities: dict):
+        if mixture:
+            self._merge(self.wells[key], mixture)
+        if key in self.stocks:
+            return
+        total = self.volumes.get(key, 0.0) + volume
+        self.volumes[key] = total
+        capacity = self.capacities.get(key[0]) or capacities.get(key[0])
+        if capacity is not None and total > capacity + TOLERANCE:
+            self.issues.append(SimulationIssue("overflow", key, self._index, total, capacity))
+
+    def _draw(self, key, volume: float):
+        if key not in self.stocks:
+            known = self.volumes.get(key)
+            if known is None and self.unknownStocks:
+                self.stocks.add(key)
+            else:
+                total = (known or 0.0) - volume
+                self.volumes[key] = total
+                if total < -TOLERANCE:
+                    self.issues.append(SimulationIssue("underflow", key, self._index, total, 0.0))
+        if not self.composition:
+            return None
+        contents = self.wells[key]
+        total = sum(contents.values())
+        drawn = {}
+        if total > TOLERANCE:
+            fraction = min(volume / total, 1.0)
+            for origin, amount in contents.items():
+                drawn[origin] = amount * fraction
+                contents[origin] = amount - amount * fraction
+        shortfall = volume - min(volume, total)
+        if shortfall > TOLERANCE:
+            origin = ("well",) + key
+            drawn[origin] = drawn.get(origin, 0.0) + shortfall
+        return drawn
+
+    @staticmethod
+    def _take(tip: dict, volume: float, tipVolume: float) -> dict:
+        if tipVolume <= TOLERANCE:
+            return {}
+        fraction = min(volume / tipVolume, 1.0)
+        taken = {}
+        for origin, amount in tip.items():
+            taken[origin] = amount * fraction
+            tip[origin] = amount - amount * fraction
+        return taken
+
+    @staticmethod
+    def _merge(target: dict, mixture: dict):
+        for origin, amount in mixture.items():
+            target[origin] = target.get(origin, 0.0) + amount
+
+    def state(self, digits: int = 6) -> dict:
+        """
+        Returns the end state: {"wells": {(container, index): {origin: uL}}, "history": {container: [...]}},
+        rounded and without empty entries, so two runs can be compared with ==. Without composition,
+        each well of known volume maps to {"volume": uL}.
+        """
+        wells = {}
+        if self.composition:
+            for key, contents in self.wells.items():
+                rounded = {origin: round(amount, digits) for origin, amount in contents.items()
+                           if abs(amount) > TOLERANCE}
+                if rounded:
+                    wells[key] = rounded
+        else:
+            wells = {key: {"volume": round(volume, digits)} for key, volume in self.volumes.items()
+                     if abs(volume) > TOLERANCE}
+        return {"wells": wells, "history": {name: list(entries) for name, entries in self.history.items() if entries}}
+
+
+def simulate(instructions) -> dict:
+    """
+    Returns the end state of running instructions from empty containers (see Simulator.state).
+    """
+    return Simulator().run(instructions).state()
+
+
+def same_state(a: dict, b: dict, tolerance: float = 1e-4) -> bool:
+    """
+    Whether two end states match, with volumes compared to within tolerance microliters.
+    """
+    if a["history"] != b["history"]:
+        return False
+    for key in a["wells"].keys() | b["wells"].keys():
+        contents = a["wells"].get(key, {})
+        other = b["wells"].get(key, {})
+        for origin in contents.keys() | other.keys():
+            if abs(contents.get(origin, 0.0) - other.get(origin, 0.0)) > tolerance:
+                return False
+    return True
+
+
+def score_protocol(instructions, costs: dict = None, **options) -> dict:
+    """
+    Simulates volumes only and estimates runtime, for ranking candidate protocols.
+
+    Parameters:
+        instructions: the Autoprotocol instructions
+        costs: overrides for DEFAULT_COSTS
+        options: passed to Simulator (initialVolumes, unknownStocks, capacities)
+
+    Returns:
+        {"runtime_s": seconds, "issues": [SimulationIssue], "feasible": whether there are no issues}
+    """
+    simulator = Simulator(composition=False, **options).run(instructions)
+    return {
+        "runtime_s": estimate_runtime(instructions, costs)["total_s"],
+        "issues": simulator.issues,
+        "feasible": not simulator.issues,
+    }
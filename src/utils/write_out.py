@@ -1,7 +1,15 @@
 import json
 import os
+from enum import Enum
+from src.models.inventory import Location
 from src.utils.serialization import serialize
+from src.utils.json_stream import stream_json
+from src.utils.metadata import metadata_lines
+from src.utils.locations import inventory_to_dict
+from src.utils.lab_sheets import LOCATION
+from src.utils.profiling import profiled
 
+@profiled("write_out.write_experiment_output")
 def write_experiment_output(experiment, base_dir):
     """
     Writes the full output of an Experiment to the specified base directory.
@@ -27,6 +35,7 @@ def write_experiment_output(experiment, base_dir):
     inventory_dir = os.path.join(experiment_dir, "Inventory")
     write_inventory_to_json(experiment.inventory, inventory_dir)
 
+@profiled("write_out.write_metadata")
 def write_metadata(experiment, filepath):
     """
     Writes the metadata of an Experiment to a text file.
@@ -36,29 +45,22 @@ def write_metadata(experiment, filepath):
         filepath: The path to save the metadata.txt file.
     """
     with open(filepath, "w") as f:
-        f.write(f"Experiment Name: {experiment.name}\n")
-        
-        # Ensure oligos is iterable and safely handle None
-        oligos = experiment.oligos if isinstance(experiment.oligos, (list, tuple)) else []
-        f.write(f"Oligos: {', '.join(oligos)}\n")
-        
-        f.write("Polynucleotides:\n")
-        for name, poly in experiment.nameToPoly.items():
-            f.write(f"{name}: {poly.sequence}\n")
-
-
-def write_experiment_to_json(experiment, filepath):
+        f.writelines(line + "\n" for line in metadata_lines(experiment))
+
+
+@profiled("write_out.write_experiment_to_json")
+def write_experiment_to_json(experiment, filepath, compact=False):
     """
-    Serializes an Experiment object into a JSON file.
+    Serializes an Experiment object into a JSON file, streaming it to disk piece by piece.
 
     Parameters:
         experiment: The Experiment object to serialize.
         filepath: The path to save the JSON file.
+        compact: Write without indentation or spaces between tokens.
     """
-    experiment_dict = serialize(experiment)
-    with open(filepath, "w") as f:
-        json.dump(experiment_dict, f, indent=4)
+    stream_json(experiment, filepath, compact=compact)
 
+@profiled("write_out.write_labsheets_to_txt")
 def write_labsheets_to_txt(experiment, outdir):
     """
     Saves all LabSheets in the Experiment's LabPacket as human-readable .txt files.
@@ -90,26 +92,39 @@ def format_lab_sheet(lab_sheet):
     if lab_sheet.sources:
         content.append("Sources:\n")
         for source in lab_sheet.sources:
-            content.append("\t" + ", ".join(source) + "\n")
+            content.append("\t" + ", ".join(_format_cell(cell) for cell in source) + "\n")
     if lab_sheet.destinations:
         content.append("Destinations:\n")
         for dest in lab_sheet.destinations:
-            content.append("\t" + ", ".join(dest) + "\n")
+            content.append("\t" + ", ".join(_format_cell(cell) for cell in dest) + "\n")
     if lab_sheet.notes:
         content.append("Notes:\n")
         for note in lab_sheet.notes:
             content.append("\t" + note + "\n")
     return "".join(content)
 
+def _format_cell(value):
+    """
+    Formats one field of a LabSheet source or destination entry: a Location as its box and well,
+    an enum member as its value.
+    """
+    if isinstance(value, Location):
+        return LOCATION.render(value)[1]
+    if isinstance(value, Enum):
+        return str(value.value)
+    return str(value)
+
+@profiled("write_out.write_inventory_to_json")
 def write_inventory_to_json(inventory, outdir):
     """
-    Serializes the Inventory object into JSON files within the specified directory.
+    Serializes the Inventory object into JSON files within the specified directory. Locations are
+    written once, in a location table, and referenced by ID (see locations.inventory_to_dict).
 
     Parameters:
         inventory: The Inventory object to serialize.
         outdir: The directory to save the Inventory JSON files.
     """
     os.makedirs(outdir, exist_ok=True)
-    inventory_dict = serialize(inventory)
+    inventory_dict = inventory_to_dict(inventory)
     with open(os.path.join(outdir, "Inventory.json"), "w") as f:
         json.dump(inventory_dict, f, indent=4)
@@ -1,4 +1,8 @@
+from dataclasses import replace
 import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import Digest, Reagent
 from .cleanup_test_output import cleanup_output_folder
 
 # housekeeping function to keep tests/output from overflowing with LabPackets etc.
@@ -9,3 +13,20 @@ from .cleanup_test_output import cleanup_output_folder
 def run_cleanup_before_tests():
     cleanup_output_folder()
 
+
+
+@pytest.fixture(scope="session")
+def overlapping_digests():
+    """
+    An experiment whose Digest steps use overlapping enzyme sets: the first restriction construction
+    file digests with EcoRI alone, the other three with EcoRI and SpeI, so LabPacketFactory makes an
+    [EcoRI] sheet and an [EcoRI, SpeI] sheet listing the same eight steps.
+    """
+    generator = WorkloadGenerator(seed=46)
+    cfs = [cf for cf in generator.construction_files(40) if any(isinstance(step, Digest) for step in cf.steps)][:4]
+    rewritten = []
+    for i, cf in enumerate(cfs):
+        enzymes = [Reagent.EcoRI] if i == 0 else [Reagent.EcoRI, Reagent.SpeI]
+        steps = [replace(step, enzymes=enzymes) if isinstance(step, Digest) else step for step in cf.steps]
+        rewritten.append(replace(cf, steps=steps))
+    return ExperimentFactory().run("overlap", "V", rewritten, generator.inventory(3))
@@ -37,6 +37,6 @@ def test_deserialize_pcr_labsheet():
 
     # Initialize AutoprotocolFactory and test processing
     factory = AutoprotocolFactory()
-    factory._process_pcr(lab_sheet, None)  # Pass None for inventory for now
+    factory._process_reactions(lab_sheet, None)  # Pass None for inventory for now
     print("Successfully processed PCR LabSheet into Autoprotocol.")
 
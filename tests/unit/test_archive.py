@@ -0,0 +1,76 @@
+import os
+import zipfile
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils import Saver
+from src.utils.archive import *
+from src.utils.write_out import write_experiment_output
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=36)
+    return ExperimentFactory().run("archived", "A", generator.construction_files(30), generator.inventory(10))
+
+def test_archive_round_trip(experiment, tmp_path):
+    path = str(tmp_path / "experiment.zip")
+    Saver().save_experiment_archive(experiment, path)
+
+    with ExperimentArchive(path) as archive:
+        assert archive.experiment() == experiment
+        assert archive.inventory() == experiment.inventory
+        assert archive.lab_sheet_titles() == [sheet.title for sheet in experiment.labPacket.labsheets]
+        assert archive.box(1) == experiment.inventory.boxes[1]
+        assert archive.lab_sheet(2) == experiment.labPacket.labsheets[2]
+    assert zipfile.is_zipfile(path)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+def test_archive_matches_directory(experiment, tmp_path):
+    saver = Saver()
+    saver.save_experiment(experiment, str(tmp_path / "dir"))
+    path = str(tmp_path / "experiment.zip")
+    saver.save_experiment_archive(experiment, path)
+
+    directory = tmp_path / "dir" / experiment.name
+    with ExperimentArchive(path) as archive:
+        assert archive.lab_sheet_text(0) == (directory / archive.toc["labsheets"][0]["member"]).read_text()
+        assert archive.box_rows(0) == (directory / "inventory" / "0_Box.txt").read_text()
+
+def test_directory_conversion(experiment, tmp_path):
+    Saver().save_experiment(experiment, str(tmp_path / "dir"))
+    directory = str(tmp_path / "dir" / experiment.name)
+    path = str(tmp_path / "converted.zip")
+    count = directory_to_archive(directory, path)
+
+    assert archive_to_directory(path, str(tmp_path / "out")) == count
+    with ExperimentArchive(path) as archive:
+        assert archive.inventory() == experiment.inventory
+        for name in archive.names():
+            with open(os.path.join(directory, name), "r", newline="") as f:
+                assert archive.read_text(name) == f.read()
+
+def test_failed_write_keeps_existing_archive(tmp_path):
+    path = str(tmp_path / "a.zip")
+    with ExperimentArchiveWriter(path) as archive:
+        archive.add("a.txt", "old")
+    with pytest.raises(RuntimeError):
+        with ExperimentArchiveWriter(path) as archive:
+            archive.add("a.txt", "new")
+            raise RuntimeError("interrupted")
+
+    with ExperimentArchive(path) as archive:
+        assert archive.read_text("a.txt") == "old"
+    assert os.listdir(tmp_path) == ["a.zip"]
+
+def test_write_out_directory_conversion(experiment, tmp_path):
+    write_experiment_output(experiment, str(tmp_path / "dir"))
+    path = str(tmp_path / "converted.zip")
+    directory_to_archive(str(tmp_path / "dir" / experiment.name), path)
+
+    with ExperimentArchive(path) as archive:
+        assert len(archive.lab_sheet_titles()) == len(experiment.labPacket.labsheets)
+        assert archive.lab_sheet_text(0).startswith(f"LabSheet: {experiment.labPacket.labsheets[0].title}")
+        assert archive.experiment() == experiment
+        assert archive.inventory() == experiment.inventory
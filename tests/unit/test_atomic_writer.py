@@ -0,0 +1,78 @@
+import json
+import os
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils import Parser, Saver
+from src.utils.atomic_writer import *
+from src.utils.serialization import deserialize
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=34)
+    return ExperimentFactory().run("atomic", "A", generator.construction_files(30), generator.inventory(10))
+
+def listing(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory)
+                  for root, _, names in os.walk(directory) for name in names)
+
+def test_commit_writes_files_and_manifest(tmp_path):
+    writer = AtomicBatchWriter(str(tmp_path), maxWorkers=4)
+    writer.add("a.txt", "alpha\n")
+    writer.add("sub/b.txt", lambda: "beta\n")
+    writer.add("c.txt", streaming(lambda f: f.write("gamma\n")))
+    stats = writer.commit()
+
+    assert stats.files == 3 and stats.bytes == 17
+    assert (tmp_path / "sub" / "b.txt").read_text() == "beta\n"
+    assert sorted(read_manifest(str(tmp_path))["files"]) == ["a.txt", "c.txt", "sub/b.txt"]
+    assert verify_directory(str(tmp_path)) == []
+
+def test_failed_render_leaves_directory_untouched(tmp_path):
+    writer = AtomicBatchWriter(str(tmp_path))
+    writer.add("a.txt", "old\n")
+    writer.commit()
+    before = listing(str(tmp_path))
+
+    def fail():
+        raise RuntimeError("render failed")
+    writer.add("a.txt", "new\n")
+    writer.add("b.txt", fail)
+    with pytest.raises(RuntimeError):
+        writer.commit()
+
+    assert listing(str(tmp_path)) == before
+    assert (tmp_path / "a.txt").read_text() == "old\n"
+    assert verify_directory(str(tmp_path)) == []
+
+def test_recommit_removes_stale_files(tmp_path):
+    writer = AtomicBatchWriter(str(tmp_path))
+    writer.add("a.txt", "a")
+    writer.add("b.txt", "b")
+    writer.commit()
+    writer.add("a.txt", "a2")
+    writer.commit()
+    assert listing(str(tmp_path)) == ["a.txt", MANIFEST_NAME]
+
+def test_verify_reports_changes(tmp_path):
+    writer = AtomicBatchWriter(str(tmp_path))
+    writer.add("a.txt", "a")
+    writer.commit()
+    (tmp_path / "a.txt").write_text("changed")
+    assert verify_directory(str(tmp_path)) == ["a.txt: does not match the manifest"]
+    os.unlink(tmp_path / MANIFEST_NAME)
+    assert len(verify_directory(str(tmp_path))) == 1
+
+def test_saver_commits_experiment(experiment, tmp_path):
+    saver = Saver(maxWorkers=4)
+    stats = saver.save_experiment(experiment, str(tmp_path))
+    experiment_dir = tmp_path / experiment.name
+
+    assert verify_directory(str(experiment_dir)) == []
+    assert stats.files == 3 + len(experiment.labPacket.labsheets) + 2 * len(experiment.inventory.boxes)
+    with open(experiment_dir / "experiment.json") as f:
+        assert deserialize(json.load(f), Experiment) == experiment
+    box = Parser().parse_box_row_form(str(experiment_dir / "inventory" / "0_Box.txt"))
+    assert box.samples == experiment.inventory.boxes[0].samples
@@ -0,0 +1,63 @@
+import json
+from collections import Counter
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.autoprotocol_factory import AutoprotocolFactory, SAMPLE_REAGENTS
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.mastermix import expand_recipe
+
+
+def experiment(numCfs, seed=40):
+    generator = WorkloadGenerator(seed=seed)
+    return ExperimentFactory().run("ap", "A", generator.construction_files(numCfs), generator.inventory(5))
+
+@pytest.fixture(scope="module")
+def small():
+    return experiment(12)
+
+def pcr_sheet(exp):
+    return next(sheet for sheet in exp.labPacket.labsheets if sheet.sheetType == PCR)
+
+def test_pcr_provisions_each_stock_once(small):
+    sheet = pcr_sheet(small)
+    factory = AutoprotocolFactory()
+    factory._process_reactions(sheet, None)
+    ops = Counter(instruction.op for instruction in factory.protocol.instructions)
+
+    stocks = [reagent for reagent, volume in expand_recipe(sheet.reaction) if reagent not in SAMPLE_REAGENTS]
+    assert ops["provision"] == len(stocks)
+    assert ops["liquid_handle"] == 3 * len(sheet.steps)
+    assert ops["thermocycle"] == 1
+    provision = factory.protocol.instructions[0]
+    assert len(provision.to) == len(sheet.steps)
+
+def test_instructions_grow_with_samples_not_stocks():
+    counts = []
+    for numCfs in (6, 24):
+        sheet = pcr_sheet(experiment(numCfs))
+        factory = AutoprotocolFactory()
+        factory._process_reactions(sheet, None)
+        ops = Counter(instruction.op for instruction in factory.protocol.instructions)
+        counts.append((len(sheet.steps), ops["provision"]))
+    assert counts[0][0] < counts[1][0]
+    assert counts[0][1] == counts[1][1]
+
+def test_run_whole_packet(small):
+    factory = AutoprotocolFactory({Reagent.ddH2O: "rs-water"})
+    protocol = factory.run(small.labPacket, small.inventory)
+    ops = Counter(instruction.op for instruction in protocol.instructions)
+    assert ops["thermocycle"] >= 3
+    assert ops["incubate"] >= 2
+    assert "rs-water" in {instruction.resource_id for instruction in protocol.instructions if instruction.op == "provision"}
+    # every digest and assembly product is made exactly once, though their sheets share steps
+    digests = {step.output for sheet in small.labPacket.labsheets if sheet.sheetType == Digest for step in sheet.steps}
+    assert digests <= set(factory.products)
+    json.dumps(protocol.as_dict())
+
+def test_tubes_are_shared(small):
+    factory = AutoprotocolFactory()
+    factory.run(small.labPacket, small.inventory)
+    names = [ref.name for ref in factory.protocol.refs.values()]
+    assert len(names) == len(set(names))
+    assert len(factory.refs.wells) + len(factory.refs.plates) == len(names)
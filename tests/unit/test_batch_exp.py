@@ -0,0 +1,65 @@
+import threading
+import pytest
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import ConstructionFile, PCR, Ligate, Inventory
+
+
+@pytest.fixture
+def batch_jobs():
+    pcr1 = PCR('PCR', 'pcrpdt', 'ca1067F', 'ca1067R', 'pSB1AK3-b0015', 1000)
+    pcr2 = PCR('PCR', 'pcrOutput', 'ca1067F', 'oligoR', 'template', 500)
+    # the ligation source is never made, so lab packet planning fails for this job
+    badLig = Ligate('Ligate', 'ligpdt', ['missing-fragment'])
+
+    return [
+        ("batch_a", "A", [ConstructionFile(steps=[pcr1], sequences={})]),
+        ("batch_bad", "X", [ConstructionFile(steps=[badLig], sequences={})]),
+        ("batch_b", "B", [ConstructionFile(steps=[pcr2], sequences={})]),
+    ]
+
+def test_batch_shares_inventory(batch_jobs):
+    inventory = Inventory(boxes=[], construct_to_locations={}, loc_to_conc={}, loc_to_clone={}, loc_to_culture={})
+    result = ExperimentFactory().runBatch(batch_jobs, inventory, maxWorkers=2)
+
+    assert result.experiments[0] is not None
+    assert result.experiments[2] is not None
+    assert result.experiments[1] is None
+    assert list(result.errors) == [1], "Only the bad job should fail."
+
+    # the old inventory is left as it was
+    assert inventory.boxes == []
+
+    # batch_b reuses the 100uM/10uM ca1067F tubes made for batch_a
+    boxNames = [box.name for box in result.experiments[2].inventory.boxes]
+    assert "batch_aBox0" in boxNames and "batch_bBox0" in boxNames
+    labelsB = [s.label for row in result.experiments[2].inventory.boxes[-1].samples for s in row if s]
+    assert "10uM-ca1067F" not in labelsB
+
+    for experiment in (result.experiments[0], result.experiments[2]):
+        assert experiment.labPacket.labsheets, "Lab packet should not be empty."
+
+def test_batch_matches_single_run(batch_jobs):
+    name, expID, cfList = batch_jobs[0]
+    single = ExperimentFactory().run(name, expID, cfList, None)
+    result = ExperimentFactory().runBatch([batch_jobs[0]], None, maxWorkers=1)
+
+    assert result.experiments[0].labPacket == single.labPacket
+    assert result.inventory.loc_to_conc == single.inventory.loc_to_conc
+
+def test_batch_thread_safe(batch_jobs):
+    factory = ExperimentFactory()
+    results = []
+
+    def worker():
+        results.append(factory.runBatch(batch_jobs, None, maxWorkers=1))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 4
+    for result in results:
+        assert list(result.errors) == [1]
+        assert result.inventory.loc_to_conc == results[0].inventory.loc_to_conc
@@ -0,0 +1,77 @@
+import json
+import pickle
+import struct
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.binary_format import *
+from src.utils.serialization import serialize, deserialize
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=32)
+    return ExperimentFactory().run("binary", "B", generator.construction_files(40), generator.inventory(10))
+
+def test_round_trip_experiment(experiment):
+    restored = decode_binary(encode_binary(experiment), Experiment)
+    assert restored == experiment
+    # cross-check against the pickle and JSON round trips
+    assert restored == pickle.loads(pickle.dumps(experiment))
+    assert restored == deserialize(json.loads(json.dumps(serialize(experiment))), Experiment)
+    assert restored.labPacket.labsheets[0].sheetType is PCR
+
+@pytest.mark.parametrize("part", ["labPacket", "inventory"])
+def test_round_trip_parts(experiment, part):
+    obj = getattr(experiment, part)
+    assert decode_binary(encode_binary(obj), type(obj)) == obj
+
+def test_round_trip_values():
+    values = [None, True, False, 0, -1, 300, -(1 << 70), 2.5, "", "µl", (1, "a"), {1, 2}, frozenset({3}),
+              {"k": [Reagent.EcoRI, Concentration.uM10, Culture.primary]},
+              Location("box", 300, 2, None, None), Location("box", 1, 2, "l", "l"), Zymo("x", "y", 10.0)]
+    assert decode_binary(encode_binary(values)) == values
+
+def test_locations_are_shared(experiment):
+    restored = decode_binary(encode_binary(experiment.inventory))
+    first = next(iter(restored.loc_to_conc))
+    assert next(l for l in restored.loc_to_clone if l == first) is first
+
+def test_smaller_than_pickle(experiment):
+    assert len(encode_binary(experiment)) < len(pickle.dumps(experiment))
+
+def test_file_round_trip(experiment, tmp_path):
+    path = str(tmp_path / "experiment.lpb")
+    assert write_binary(experiment, path) == (tmp_path / "experiment.lpb").stat().st_size
+    assert read_binary(path, Experiment) == experiment
+
+def test_rejects_other_versions(experiment):
+    data = bytearray(encode_binary(experiment))
+    struct.pack_into("<H", data, 4, SCHEMA_VERSION + 1)
+    with pytest.raises(BinaryFormatError, match="schema version"):
+        decode_binary(bytes(data))
+
+@pytest.mark.parametrize("data", [b"", b"XXXX\x01\x00\x00\x00\x00\x00"])
+def test_rejects_bad_header(data):
+    with pytest.raises(BinaryFormatError):
+        decode_binary(data)
+
+def test_rejects_corrupt_data(experiment):
+    data = encode_binary(experiment)
+    with pytest.raises(BinaryFormatError):
+        decode_binary(data[:len(data) // 2])
+    with pytest.raises(BinaryFormatError):
+        decode_binary(data + b"\x00")
+    with pytest.raises(BinaryFormatError, match="Expected Inventory"):
+        decode_binary(data, Inventory)
+
+def test_rejects_deep_nesting():
+    header = encode_binary(None)[:-1]
+    data = header + bytes([T_LIST, 1]) * 5000 + bytes([T_NONE])
+    with pytest.raises(BinaryFormatError, match="nested too deeply"):
+        decode_binary(data)
+
+def test_rejects_unknown_types():
+    with pytest.raises(BinaryFormatError):
+        encode_binary(object())
@@ -0,0 +1,70 @@
+import os
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.models import PCR, Digest, Ligate, Transform, Reagent
+from src.utils.cf_parser import ConstructionFileParser, CFParseError
+
+
+def test_parse_cf_with_sequences():
+    parser = ConstructionFileParser(chunkSize=64)  # small chunks so lines span several reads
+    cfs = parser.parse_file("data/input/cf_with_seq.txt")
+
+    assert len(cfs) == 1
+    cf = cfs[0]
+    assert [type(step) for step in cf.steps] == [PCR, Digest, Digest, Ligate, Transform]
+    assert cf.steps[1].enzymes == [Reagent.EcoRI, Reagent.SpeI]
+    assert cf.steps[3].dnas == ['pcrdig', 'vectdig']
+    assert cf.steps[4].temperature == 37
+    assert cf.sequences['ca1067F'].sequence == 'ccagtGAATTCgtccTCTAGAgagctgatccttcaactc'
+    assert cf.sequences['pSB1AK3-b0015'].is_circular
+    assert not cf.sequences['ca1067R'].is_double_stranded
+
+def test_parse_bare_cf():
+    cfs = ConstructionFileParser().parse_file("data/input/cf_bare.txt")
+    assert len(cfs) == 1 and len(cfs[0].steps) == 5 and cfs[0].sequences == {}
+
+def test_round_trip_many_cfs(tmpdir):
+    parser = ConstructionFileParser(chunkSize=500)
+    cfs = WorkloadGenerator(seed=11).construction_files(25)
+    path = os.path.join(str(tmpdir), "many.txt")
+    with open(path, "w") as f:
+        for cf in cfs:
+            f.write(parser.format_construction_file(cf))
+
+    parsed = list(parser.iter_construction_files(path))
+    assert parsed == cfs
+
+def test_wrapped_sequence(tmpdir):
+    path = os.path.join(str(tmpdir), "wrapped.txt")
+    with open(path, "w") as f:
+        f.write("PCR\tf\tr\tt\tp\n\nplasmid\tt\tacgt\ngggg\ncccc\n")
+    cf = ConstructionFileParser().parse_file(path)[0]
+    assert cf.sequences['t'].sequence == 'acgtggggcccc'
+
+@pytest.mark.parametrize("text, lineno, message", [
+    ("PCR\tf\tr\tt\tp\nFoo\ta\tb\n", 2, "Unknown operation"),
+    ("PCR\tf\tr\tt\n", 1, "PCR takes 4 or 5 fields"),
+    ("Digest\td\tEcoRI,NotAnEnzyme\t1\tp\n", 1, "Unknown enzyme"),
+    ("PCR\tf\tr\tt\tp\n\noligo\tf\tacgtXX\n", 3, "Invalid sequence characters"),
+])
+def test_errors_report_line_numbers(tmpdir, text, lineno, message):
+    path = os.path.join(str(tmpdir), "bad.txt")
+    with open(path, "w") as f:
+        f.write(text)
+    with pytest.raises(CFParseError, match=message) as info:
+        ConstructionFileParser().parse_file(path)
+    assert info.value.lineno == lineno
+    assert info.value.path == path
+
+def test_parse_directory(tmpdir):
+    parser = ConstructionFileParser()
+    generator = WorkloadGenerator(seed=5)
+    expected = {}
+    for i in range(4):
+        cfs = generator.construction_files(3, start=i * 3)
+        path = os.path.join(str(tmpdir), f"{i}.txt")
+        with open(path, "w") as f:
+            f.write("".join(parser.format_construction_file(cf) for cf in cfs))
+        expected[path] = cfs
+
+    assert parser.parse_directory(str(tmpdir), maxWorkers=2) == expected
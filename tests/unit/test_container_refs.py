@@ -0,0 +1,44 @@
+import pytest
+from autoprotocol.protocol import Protocol
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.autoprotocol_factory import AutoprotocolFactory
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.container_refs import ContainerRefManager, sheet_locations, tube_name
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=42)
+    return ExperimentFactory().run("refs", "R", generator.construction_files(15), generator.inventory(5))
+
+def test_each_location_gets_one_ref(experiment):
+    protocol = Protocol()
+    refs = ContainerRefManager(inventory=experiment.inventory).bind(protocol)
+    wells = refs.resolve(experiment.labPacket)
+    locations = {tube_name(location) for sheet in experiment.labPacket.labsheets for location in sheet_locations(sheet)}
+    assert set(wells) == locations
+    assert len(protocol.refs) == len(locations)
+
+    location = next(sheet_locations(experiment.labPacket.labsheets[0]))
+    assert refs.tube(location) is wells[tube_name(location)]
+    assert refs.tube(location).name == location.label
+    assert len(protocol.refs) == len(locations)
+
+def test_stocks_and_boxes(experiment):
+    refs = ContainerRefManager().bind(Protocol())
+    assert refs.stock(Reagent.BsaI) is refs.stock(Reagent.BsaI)
+    box = experiment.inventory.boxes[0]
+    wells = refs.box(box)
+    assert len(wells) == sum(sample is not None for samples in box.samples for sample in samples)
+
+def test_reused_across_protocols(experiment):
+    name = tube_name(next(sheet_locations(experiment.labPacket.labsheets[0])))
+    refs = ContainerRefManager({name: "ct1abc"})
+    factories = [AutoprotocolFactory(refs=refs) for _ in range(2)]
+    names = []
+    for factory in factories:
+        factory.run(experiment.labPacket, experiment.inventory)
+        names.append(sorted(factory.protocol.refs))
+    assert names[0] == names[1]
+    assert factories[1].protocol.refs[name].container.id == "ct1abc"
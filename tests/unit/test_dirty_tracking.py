@@ -0,0 +1,75 @@
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories import ExperimentFactory, InventoryFactory
+from src.models import *
+from src.utils import Parser, Saver
+from src.utils.atomic_writer import verify_directory
+from src.utils.dirty_tracking import *
+
+
+@pytest.fixture
+def generator():
+    return WorkloadGenerator(seed=35)
+
+def test_factory_marks_new_boxes(generator):
+    first = InventoryFactory().run("a", "A", generator.construction_files(10), None)
+    assert dirty_boxes(first) == set(range(len(first.boxes)))
+    mark_clean(first)
+    count = len(first.boxes)
+    second = InventoryFactory().run("b", "B", generator.construction_files(10, start=10), first)
+    assert dirty_boxes(second) == set(range(count, len(second.boxes)))
+
+def test_untracked_inventory_stays_untracked(generator):
+    old = generator.inventory(5)
+    object.__delattr__(old, "_dirty_boxes")
+    new = InventoryFactory().run("b", "B", generator.construction_files(5), old)
+    assert dirty_boxes(new) is None
+    mark_dirty(new, [0])
+    assert dirty_boxes(new) is None
+
+def test_incremental_save_writes_only_new_boxes(generator, tmp_path):
+    saver = Saver()
+    first = InventoryFactory().run("a", "A", generator.construction_files(20), None)
+    stats = saver.save_inventory(first, str(tmp_path))
+    assert stats.kept == 0 and dirty_boxes(first) == set()
+    oldBoxes = len(first.boxes)
+    mtime = (tmp_path / "0_Box.txt").stat().st_mtime_ns
+
+    second = InventoryFactory().run("b", "B", generator.construction_files(5, start=20), first)
+    stats = saver.save_inventory(second, str(tmp_path))
+
+    # two files per new box plus the index; the old boxes are left alone
+    assert stats.files == 2 * (len(second.boxes) - oldBoxes) + 1
+    assert stats.kept == 2 * oldBoxes
+    assert (tmp_path / "0_Box.txt").stat().st_mtime_ns == mtime
+    assert verify_directory(str(tmp_path)) == []
+    assert Parser().parse_inventory(str(tmp_path)) == second
+
+def test_loaded_inventory_saves_incrementally(generator, tmp_path):
+    saver = Saver()
+    saver.save_inventory(InventoryFactory().run("a", "A", generator.construction_files(20), None), str(tmp_path))
+    loaded = Parser().parse_inventory(str(tmp_path))
+    assert dirty_boxes(loaded) == set()
+
+    oldBoxes = len(loaded.boxes)
+    extended = InventoryFactory().run("b", "B", generator.construction_files(5, start=20), loaded)
+    stats = saver.save_inventory(extended, str(tmp_path))
+    assert stats.kept == 2 * oldBoxes
+    assert Parser().parse_inventory(str(tmp_path)) == extended
+
+def test_dirty_box_is_rewritten(generator, tmp_path):
+    saver = Saver()
+    inventory = InventoryFactory().run("a", "A", generator.construction_files(20), None)
+    saver.save_inventory(inventory, str(tmp_path))
+    mark_dirty(inventory, [0])
+    stats = saver.save_inventory(inventory, str(tmp_path))
+    assert stats.files == 3
+    assert stats.kept == 2 * (len(inventory.boxes) - 1)
+
+def test_other_directory_gets_every_box(generator, tmp_path):
+    saver = Saver()
+    inventory = InventoryFactory().run("a", "A", generator.construction_files(20), None)
+    saver.save_inventory(inventory, str(tmp_path / "one"))
+    stats = saver.save_inventory(inventory, str(tmp_path / "two"))
+    assert stats.kept == 0
+    assert Parser().parse_inventory(str(tmp_path / "two")) == inventory
@@ -0,0 +1,79 @@
+import os
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.models import *
+from src.utils import job_queue
+from src.utils.binary_format import decode_binary, write_binary
+from src.utils.cf_parser import ConstructionFileParser
+from src.utils.job_queue import STAGES, JobQueue, LeaseLost, drain, run_job, work
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    generator = WorkloadGenerator(seed=50)
+    parser = ConstructionFileParser()
+    paths = []
+    for i in range(3):
+        path = tmp_path / f"cfs{i}.txt"
+        path.write_text("\n\n".join(parser.format_construction_file(cf)
+                                    for cf in generator.construction_files(8, start=8 * i)))
+        paths.append(str(path))
+    inventoryPath = str(tmp_path / "old.bin")
+    write_binary(generator.inventory(4), inventoryPath)
+    return str(tmp_path / "queue.db"), paths, inventoryPath, str(tmp_path / "out")
+
+def test_job_runs_every_stage(jobs):
+    db, paths, inventoryPath, outdir = jobs
+    with JobQueue(db) as queue:
+        jobId = queue.submit("jq", "J", paths[:1], outdir, inventoryPath)
+    assert work(db) == 1
+    with JobQueue(db) as queue:
+        assert queue.status(jobId)["state"] == "done"
+        checkpoints = queue.checkpoints(jobId)
+    assert set(checkpoints) == set(STAGES)
+    assert decode_binary(checkpoints["save"])["files"] > 0
+    assert os.path.exists(os.path.join(outdir, "jq", "metadata.txt"))
+    assert len(decode_binary(checkpoints["packet"], LabPacket).labsheets) > 0
+
+def test_failed_job_resumes_after_last_checkpoint(jobs, monkeypatch):
+    db, paths, inventoryPath, outdir = jobs
+    with JobQueue(db) as queue:
+        jobId = queue.submit("jq", "J", paths[:1], outdir, inventoryPath)
+
+    def crash(*args):
+        raise RuntimeError("packet crashed")
+    monkeypatch.setattr(job_queue._labPacketFactory, "run", crash)
+    assert work(db) == 0
+    with JobQueue(db) as queue:
+        status = queue.status(jobId)
+        assert (status["state"], status["stage"]) == ("failed", "inventory")
+        assert "packet crashed" in status["error"]
+        assert queue.retry(jobId)
+    monkeypatch.undo()
+
+    def no_inventory(*args):
+        raise AssertionError("the inventory stage was checkpointed")
+    monkeypatch.setattr(job_queue._inventoryFactory, "run", no_inventory)
+    assert work(db) == 1
+    with JobQueue(db) as queue:
+        assert queue.status(jobId)["state"] == "done"
+
+def test_expired_lease_passes_the_job_on(jobs):
+    db, paths, inventoryPath, outdir = jobs
+    with JobQueue(db, lease=-1) as queue:
+        jobId = queue.submit("jq", "J", paths[:1], outdir)
+        first = queue.claim("a")
+        second = queue.claim("b")
+        assert first.jobId == second.jobId == jobId
+        assert second.attempts == 2
+        with pytest.raises(LeaseLost):
+            run_job(queue, first)
+
+def test_workers_drain_the_queue_concurrently(jobs):
+    db, paths, inventoryPath, outdir = jobs
+    with JobQueue(db) as queue:
+        jobIds = [queue.submit(f"jq{i}", f"J{i}", [path], outdir, inventoryPath) for i, path in enumerate(paths)]
+    assert drain(db, workers=2) == len(paths)
+    with JobQueue(db) as queue:
+        assert queue.counts() == {"done": len(paths)}
+        assert all(queue.status(jobId)["attempts"] == 1 for jobId in jobIds)
@@ -0,0 +1,49 @@
+import io
+import json
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.json_stream import JSONStreamWriter, stream_json
+from src.utils.serialization import serialize, deserialize
+from src.utils.saver import Saver
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=31)
+    return ExperimentFactory().run("stream", "J", generator.construction_files(40), generator.inventory(10))
+
+def stream(obj, **kwargs):
+    buf = io.StringIO()
+    JSONStreamWriter(buf, **kwargs).write(obj)
+    return buf.getvalue()
+
+@pytest.mark.parametrize("kwargs, dumpArgs", [
+    ({}, {"indent": 4}),
+    ({"indent": 2}, {"indent": 2}),
+    ({"indent": None}, {}),
+    ({"compact": True}, {"separators": (",", ":")}),
+])
+def test_matches_json_dump(experiment, kwargs, dumpArgs):
+    assert stream(experiment, **kwargs) == json.dumps(serialize(experiment), **dumpArgs)
+
+def test_small_chunks_flush(experiment):
+    buf = io.StringIO()
+    writer = JSONStreamWriter(buf, chunkSize=128)
+    writer.write(experiment.inventory)
+    assert writer.written == len(buf.getvalue())
+    assert buf.getvalue() == json.dumps(serialize(experiment.inventory), indent=4)
+
+def test_round_trip_file(experiment, tmp_path):
+    path = tmp_path / "experiment.json"
+    written = stream_json(experiment, str(path), compact=True)
+    assert written == path.stat().st_size
+    with open(path) as f:
+        assert deserialize(json.load(f), Experiment) == experiment
+
+def test_saver_writes_experiment_json(experiment, tmp_path):
+    path = tmp_path / "experiment.json"
+    Saver().save_experiment_to_json(experiment, str(path))
+    with open(path) as f:
+        assert deserialize(json.load(f), Experiment) == experiment
@@ -0,0 +1,50 @@
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils import Saver
+from src.utils.deserializer import Deserializer
+from src.utils import lab_sheets
+from src.utils.lab_sheets import *
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=37)
+    return ExperimentFactory().run("sheets", "S", generator.construction_files(40), generator.inventory(10))
+
+def test_every_sheet_round_trips(experiment):
+    sheetTypes = set()
+    for sheet in experiment.labPacket.labsheets:
+        assert parse_lab_sheet(render_lab_sheet(sheet).splitlines(True)) == sheet
+        sheetTypes.add(sheet.sheetType)
+    assert {PCR, Digest, Ligate, GoldenGate, Transform, Pick, Miniprep, Gel, Zymo} <= sheetTypes
+
+def test_deserializer_reads_saved_packet_in_order(experiment, tmp_path):
+    Saver().save_lab_packet(experiment.labPacket, str(tmp_path))
+    assert Deserializer().deserialize_lab_packet(str(tmp_path)) == experiment.labPacket
+
+def test_parallel_read_matches_serial(experiment, tmp_path, monkeypatch):
+    Saver().save_lab_packet(experiment.labPacket, str(tmp_path))
+    monkeypatch.setattr(lab_sheets, "PARALLEL_THRESHOLD", 0)
+    assert read_lab_packet(str(tmp_path), maxWorkers=2) == experiment.labPacket
+
+def test_bad_row_reports_line(experiment):
+    lines = render_lab_sheet(experiment.labPacket.labsheets[0]).splitlines(True)
+    sources = lines.index("Sources:\n")
+    lines[sources + 1] = "only\ttwo\n"
+    with pytest.raises(LabSheetFormatError) as error:
+        parse_lab_sheet(lines, "pcr.txt")
+    assert error.value.lineno == sources + 2
+    assert str(error.value).startswith(f"pcr.txt:{sources + 2}:")
+
+def test_bad_group_reports_line(experiment):
+    sheet = next(sheet for sheet in experiment.labPacket.labsheets if sheet.sheetType is Ligate)
+    lines = render_lab_sheet(sheet).splitlines(True)
+    sources = lines.index("Sources:\n")
+    for group in ("x", "", "-1", "99999999"):
+        bad = list(lines)
+        bad[sources + 1] = group + "\t" + lines[sources + 1].partition("\t")[2]
+        with pytest.raises(LabSheetFormatError) as error:
+            parse_lab_sheet(bad, "ligate.txt")
+        assert error.value.lineno == sources + 2
@@ -0,0 +1,44 @@
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils import Saver
+from src.utils.deserializer import Deserializer
+from src.utils.dirty_tracking import dirty_boxes
+
+
+@pytest.fixture(scope="module")
+def saved(tmp_path_factory):
+    generator = WorkloadGenerator(seed=38)
+    experiment = ExperimentFactory().run("lazy", "L", generator.construction_files(30), generator.inventory(10))
+    outdir = tmp_path_factory.mktemp("saved")
+    Saver().save_experiment(experiment, str(outdir))
+    return experiment, str(outdir / experiment.name)
+
+def test_one_sheet_loads_one_file(saved):
+    experiment, indir = saved
+    lazy = Deserializer().deserialize_experiment_lazy(indir)
+    labsheets = lazy.labPacket.labsheets
+    assert len(labsheets) == len(experiment.labPacket.labsheets)
+    assert labsheets.loaded == 0
+
+    assert labsheets[3] == experiment.labPacket.labsheets[3]
+    assert labsheets[3] is labsheets[3]
+    assert labsheets.loaded == 1
+    assert lazy.labPacket.sheets_of_type(PCR) == [sheet for sheet in experiment.labPacket.labsheets if sheet.sheetType == PCR]
+
+def test_one_box_loads_one_shard(saved):
+    experiment, indir = saved
+    inventory = Deserializer().deserialize_experiment_lazy(indir).inventory
+    assert inventory.boxes[1] == experiment.inventory.boxes[1]
+    assert inventory.boxes.loaded == 1
+    assert inventory.construct_to_locations == experiment.inventory.construct_to_locations
+
+def test_materialize(saved):
+    experiment, indir = saved
+    loaded = Deserializer().deserialize_experiment_lazy(indir).materialize()
+    assert loaded.name == experiment.name
+    assert loaded.cfs == experiment.cfs
+    assert loaded.labPacket == experiment.labPacket
+    assert loaded.inventory == experiment.inventory
+    assert dirty_boxes(loaded.inventory) == set()
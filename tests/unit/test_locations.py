@@ -0,0 +1,50 @@
+import json
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.models.inventory import Location
+from src.utils import Parser
+from src.utils.locations import LocationRegistry, inventory_to_dict, inventory_from_dict
+from src.utils.serialization import location_to_string, string_to_location
+
+
+@pytest.fixture(scope="module")
+def inventory():
+    generator = WorkloadGenerator(seed=33)
+    return ExperimentFactory().run("loc", "L", generator.construction_files(30), generator.inventory(10)).inventory
+
+def test_registry_ids_are_stable():
+    a = Location("box", 0, 1, "a", "a")
+    b = Location("box", 2, 3, "b", None)
+    registry = LocationRegistry([a, b])
+    assert registry.register(Location("box", 0, 1, "a", "a")) == 0
+    assert registry.register(b) == 1
+    assert len(registry) == 2 and a in registry
+    restored = LocationRegistry.from_table(json.loads(json.dumps(registry.to_table())))
+    assert list(restored) == [a, b]
+    assert restored.register(b) == 1
+    assert restored.location(0) == a
+
+def test_inventory_round_trip(inventory):
+    data = json.loads(json.dumps(inventory_to_dict(inventory)))
+    assert inventory_from_dict(data) == inventory
+    # each location is written once and every reference is an ID
+    assert len(data["locations"]) == len({tuple(row) for row in data["locations"]})
+    assert all(isinstance(i, int) for ids in data["construct_to_locations"].values() for i in ids)
+
+def test_restored_locations_are_shared(inventory):
+    restored = inventory_from_dict(inventory_to_dict(inventory))
+    first = next(iter(restored.loc_to_conc))
+    assert next(loc for loc in restored.loc_to_clone if loc == first) is first
+
+def test_parser_reads_inventory_json(inventory, tmp_path):
+    with open(tmp_path / "inventory.json", "w") as f:
+        json.dump(inventory_to_dict(inventory), f)
+    assert Parser().parse_inventory(str(tmp_path)) == inventory
+
+def test_location_strings_are_cached():
+    location = Location("box", 4, 5, "l", "s")
+    text = location_to_string(location)
+    assert string_to_location(text) == location
+    assert string_to_location(text) is string_to_location(text)
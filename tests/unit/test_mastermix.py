@@ -0,0 +1,66 @@
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.factories.lab_packet_factory import LabPacketFactory
+from src.models import *
+from src.utils.lab_sheets import parse_lab_sheet, render_lab_sheet
+from src.utils.mastermix import (apply_mastermix, expand_recipe, mastermix_recipe, mix_reactions,
+                                 plan_mastermix, sheet_enzymes, sheet_reactions)
+
+DIGEST = [(Reagent.ddH2O, 33.5), (Reagent.NEB_Buffer_2_10x, 5), (Reagent.dna, 10), (Reagent.BsaI, 1)]
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=46)
+    return ExperimentFactory().run("mm", "M", generator.construction_files(30), generator.inventory(5))
+
+def test_mix_reactions():
+    assert [mix_reactions(n) for n in (2, 9, 10, 11, 100)] == [3, 10, 11, 13, 110]
+
+def test_recipe_shrinks_to_unique_components():
+    recipe, plan = mastermix_recipe(Recipe(None, DIGEST), 20)
+    assert plan.mixReactions == 22
+    assert recipe.mastermix == [(Reagent.ddH2O, 737.0), (Reagent.NEB_Buffer_2_10x, 110), (Reagent.BsaI, 22)]
+    assert recipe.reaction == [(Reagent.mastermix, 39.5), (Reagent.dna, 10)]
+    assert sorted(expand_recipe(recipe), key=str) == sorted(DIGEST, key=str)
+    assert mastermix_recipe(Recipe(None, DIGEST), 1) == (Recipe(None, DIGEST), None)
+
+def test_common_part_of_different_reactions():
+    other = [(Reagent.ddH2O, 32.5), (Reagent.NEB_Buffer_2_10x, 5), (Reagent.dna, 10), (Reagent.EcoRI, 1)]
+    plan = plan_mastermix([DIGEST, other], overage=0)
+    assert plan.mastermix == [(Reagent.ddH2O, 97.5), (Reagent.NEB_Buffer_2_10x, 15)]
+    assert plan.reactions == [[(Reagent.ddH2O, 1.0), (Reagent.dna, 10), (Reagent.BsaI, 1)],
+                              [(Reagent.dna, 10), (Reagent.EcoRI, 1)]]
+
+def test_packet_sheets_use_mastermix(experiment):
+    plain = LabPacketFactory(mastermix=False).run("mm", experiment.cfs, experiment.inventory)
+    for before, after in zip(plain.labsheets, experiment.labPacket.labsheets):
+        if before.reaction is None:
+            assert after.reaction is None
+            continue
+        assert sheet_reactions(after) == sheet_reactions(before)
+        if sheet_reactions(before) >= 2:
+            assert after.reaction.mastermix
+            assert sorted(expand_recipe(after.reaction), key=str) == sorted(before.reaction.reaction, key=str)
+            assert all(reagent in ABSTRACT_REAGENTS for reagent, volume in after.reaction.reaction)
+            assert parse_lab_sheet(render_lab_sheet(after).splitlines()).reaction == after.reaction
+
+def test_large_mix_is_split_across_tubes(experiment):
+    sheet = next(sheet for sheet in LabPacketFactory(mastermix=False).run("mm", experiment.cfs, experiment.inventory).labsheets
+                 if sheet.sheetType == PCR)
+    split = apply_mastermix(sheet, maxTubeVolume=100.0)
+    assert len(split.notes) == len(sheet.notes) + 1
+    assert "tubes" in split.notes[-1]
+
+def test_overlapping_enzyme_sets_count_each_step_once(overlapping_digests):
+    digests = [sheet for sheet in overlapping_digests.labPacket.labsheets if sheet.sheetType == Digest]
+    assert sorted(sheet_enzymes(sheet) for sheet in digests) == [(Reagent.EcoRI,), (Reagent.EcoRI, Reagent.SpeI)]
+    steps = digests[0].steps
+    for sheet in digests:
+        count = len([step for step in steps if tuple(step.enzymes) == sheet_enzymes(sheet)])
+        assert sheet_reactions(sheet) == count
+        perReaction = dict(sheet.reaction.reaction)[Reagent.mastermix]
+        assert sum(volume for reagent, volume in sheet.reaction.mastermix) == pytest.approx(perReaction * mix_reactions(count))
+        assert (Reagent.SpeI in dict(sheet.reaction.mastermix)) == (Reagent.SpeI in sheet_enzymes(sheet))
+    assert sum(sheet_reactions(sheet) for sheet in digests) == len(steps) == 8
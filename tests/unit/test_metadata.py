@@ -0,0 +1,46 @@
+import io
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils import Saver
+from src.utils.deserializer import Deserializer
+from src.utils.metadata import *
+from src.utils.write_out import write_metadata
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=39)
+    experiment = ExperimentFactory().run("meta", "M", generator.construction_files(10), generator.inventory(5))
+    nameToPoly = dict(experiment.nameToPoly)
+    nameToPoly["odd: name"] = Polynucleotide("ACGT: TTGA\t", ext5="GG", is_circular=True)
+    return Experiment(experiment.name, experiment.cfs, ["oligo1", "oligo, 2"], nameToPoly,
+                      experiment.labPacket, experiment.inventory)
+
+def test_saver_round_trip(experiment, tmp_path):
+    Saver().save_metadata(experiment, str(tmp_path))
+    metadata = Deserializer().deserialize_metadata(str(tmp_path))
+    assert metadata == {"name": experiment.name, "oligos": experiment.oligos, "nameToPoly": experiment.nameToPoly}
+
+def test_write_out_matches_saver(experiment, tmp_path):
+    path = tmp_path / "metadata.txt"
+    write_metadata(experiment, str(path))
+    assert path.read_text() == Saver().render_metadata(experiment)
+
+def test_reads_original_format():
+    text = "Experiment Name: old\nOligos: a, b\nPolynucleotides:\np1: ACGT\np2: AC: GT\n"
+    metadata = parse_metadata(io.StringIO(text))
+    assert metadata["oligos"] == ["a", "b"]
+    assert metadata["nameToPoly"] == {"p1": Polynucleotide("ACGT"), "p2": Polynucleotide("AC: GT")}
+
+def test_never_evaluates_code():
+    text = "Experiment Name: old\nOligos: [__import__('os').getcwd()]\nPolynucleotides:\n"
+    with pytest.raises(MetadataFormatError):
+        parse_metadata(io.StringIO(text))
+
+def test_bad_line_reports_line():
+    text = "Experiment Name: x\nFormat: 2\nOligos: null\nPolynucleotides:\n[\"p1\", \"A\"]\n{\"p2\": 1}\n"
+    with pytest.raises(MetadataFormatError) as error:
+        parse_metadata(io.StringIO(text), "metadata.txt")
+    assert error.value.lineno == 6
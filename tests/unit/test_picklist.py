@@ -0,0 +1,92 @@
+import csv
+import os
+from collections import defaultdict
+from dataclasses import replace
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.autoprotocol_factory import AutoprotocolFactory
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.mastermix import mix_reactions
+from src.utils.picklist import MANIFEST, export_picklists, packet_transfers, read_picklist
+from src.utils.plate_layout import lab_sheet_reactions, layout_packet, reaction_volumes
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=48)
+    return ExperimentFactory().run("pk", "K", generator.construction_files(40), generator.inventory(5))
+
+def test_picklists_split_by_stage_and_source(experiment, tmp_path):
+    written = export_picklists(experiment.labPacket, str(tmp_path), experiment.inventory)
+    assert len({(stage, source) for stage, source, path, rows in written}) == len(written)
+    assert [stage for stage, *_ in written] == sorted(stage for stage, *_ in written)
+    for stage, source, path, rows in written:
+        picklist = read_picklist(path)
+        assert len(picklist) == rows
+        assert {row[0] for row in picklist} == {source}
+        # destination plates change at most once each
+        plates = [row[2] for row in picklist]
+        assert len([i for i in range(len(plates)) if i == 0 or plates[i] != plates[i - 1]]) == len(set(plates))
+    with open(os.path.join(str(tmp_path), MANIFEST), newline="") as f:
+        assert len(list(csv.reader(f))) == len(written) + 1
+
+def test_wells_get_their_reaction_volume(experiment):
+    layout = layout_packet(experiment.labPacket)
+    filled = defaultdict(float)
+    for stage, source, sourceWell, plate, well, volume in packet_transfers(experiment.labPacket, layout=layout):
+        if stage % 3 == 1:
+            filled[(plate, well)] += volume
+    expected = sorted(volume for sheet in experiment.labPacket.labsheets if sheet.reaction
+                      for volume in reaction_volumes(sheet.reaction, lab_sheet_reactions(sheet)))
+    assert sorted(filled.values()) == pytest.approx(expected)
+    factory = AutoprotocolFactory()
+    factory.run(experiment.labPacket, experiment.inventory, layout)
+    assert {plate for plate, well in filled} == {plate.name for plate in factory.layoutPlates.values()}
+
+def test_mastermix_tubes_are_filled_before_use(experiment):
+    sheets = experiment.labPacket.labsheets
+    filled, drawn = defaultdict(float), defaultdict(float)
+    filledAt, drawnAt = {}, {}
+    for stage, source, sourceWell, plate, well, volume in packet_transfers(experiment.labPacket):
+        if plate.startswith("mastermix_"):
+            filled[plate] += volume
+            filledAt[plate] = stage
+        if source.startswith("mastermix_"):
+            drawn[source] += volume
+            drawnAt.setdefault(source, stage)
+    assert set(filled) == set(drawn)
+    assert all(filledAt[tube] < drawnAt[tube] for tube in filled)
+    assert any(tube.count("_") == 2 for tube in filled)
+    bySheet = defaultdict(list)
+    for tube in filled:
+        bySheet[int(tube.split("_")[1])].append(tube)
+    for index, tubes in bySheet.items():
+        total = sum(volume for reagent, volume in sheets[index].reaction.mastermix)
+        assert sum(filled[tube] for tube in tubes) == pytest.approx(total)
+        for tube in tubes:
+            # every tube gets the sheet's total in proportion to what is drawn from it
+            assert filled[tube] == pytest.approx(total * drawn[tube] / sum(drawn[t] for t in tubes))
+            assert filled[tube] > drawn[tube]
+
+def test_empty_source_tube_is_rejected(experiment):
+    inventory = experiment.inventory
+    box = inventory.boxes[0]
+    emptied = replace(inventory, boxes=[replace(box, samples=[[None] * len(row) for row in box.samples])]
+                      + list(inventory.boxes[1:]))
+    with pytest.raises(ValueError):
+        list(packet_transfers(experiment.labPacket, emptied))
+
+def test_overlapping_digest_mixes_hold_their_own_reactions(overlapping_digests):
+    sheets = overlapping_digests.labPacket.labsheets
+    filled, reactions = defaultdict(float), defaultdict(int)
+    for stage, source, sourceWell, plate, well, volume in packet_transfers(overlapping_digests.labPacket):
+        if plate.startswith("mastermix_"):
+            filled[int(plate.split("_")[1])] += volume
+        if source.startswith("mastermix_"):
+            reactions[int(source.split("_")[1])] += 1
+    digests = [index for index, sheet in enumerate(sheets) if sheet.sheetType == Digest]
+    assert sorted(reactions[index] for index in digests) == [2, 6]
+    for index in digests:
+        perReaction = dict(sheets[index].reaction.reaction)[Reagent.mastermix]
+        assert filled[index] == pytest.approx(mix_reactions(reactions[index]) * perReaction)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import urllib.error
+import urllib.request
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.utils.cf_parser import ConstructionFileParser
+from src.utils.planning_service import CANCELLED, HTTPError, PlanningService
+
+
+@pytest.fixture(scope="module")
+def workload():
+    generator = WorkloadGenerator(seed=49)
+    parser = ConstructionFileParser()
+    text = "\n\n".join(parser.format_construction_file(cf) for cf in generator.construction_files(10))
+    return text, generator.inventory(3)
+
+def request(url, document=None, method="GET"):
+    data = json.dumps(document).encode() if document is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, method=method)) as response:
+            return response.status, [json.loads(line) for line in response.read().splitlines()]
+    except urllib.error.HTTPError as e:
+        return e.code, [json.loads(e.read())]
+
+def serve(test, **options):
+    async def run():
+        service = PlanningService(maxWorkers=1, **options)
+        server = await service.start(port=0)
+        url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+        call = lambda *args: asyncio.get_running_loop().run_in_executor(None, request, *args)
+        try:
+            return await test(service, url, call)
+        finally:
+            await service.close()
+    return asyncio.run(run())
+
+def test_plan_streams_sheets_and_inventory_delta(workload):
+    text, inventory = workload
+
+    async def test(service, url, call):
+        status, events = await call(f"{url}/plan", {"name": "svc", "id": "S", "text": text}, "POST")
+        assert status == 200
+        assert [event["event"] for event in events[:3]] == ["queued", "started", "inventory"]
+        assert events[-1]["event"] == "done"
+        sheets = [event for event in events if event["event"] == "labsheet"]
+        assert [event["index"] for event in sheets] == list(range(len(sheets)))
+        assert all(box["index"] >= len(inventory.boxes) for box in events[2]["boxes"])
+        status, (health,) = await call(f"{url}/health")
+        assert health["jobs"]["completed"] == 1 and health["queued"] == 0
+        assert health["plan_seconds"]["count"] == 1
+        assert health["plan_seconds"]["max"] == health["plan_seconds"]["total"] > 0
+    serve(test, inventory=inventory)
+
+def test_job_endpoints(workload):
+    text, inventory = workload
+
+    async def test(service, url, call):
+        status, (queued,) = await call(f"{url}/jobs", {"name": "svc", "id": "S", "text": text}, "POST")
+        assert status == 202
+        status, events = await call(f"{url}/jobs/{queued['job']}/events")
+        assert events[-1]["event"] == "done"
+        status, (job,) = await call(f"{url}/jobs/{queued['job']}")
+        assert job["state"] == "done"
+        assert (await call(f"{url}/jobs/nope"))[0] == 404
+        assert (await call(f"{url}/jobs", {"name": "svc"}, "POST"))[0] == 400
+        status, events = await call(f"{url}/plan", {"name": "bad", "id": "B", "text": "PCR only"}, "POST")
+        assert events[-1]["event"] == "error"
+    serve(test)
+
+def test_queue_limit_and_cancelling_queued_jobs(workload):
+    text, inventory = workload
+
+    async def run():
+        service = PlanningService(maxWorkers=1, maxQueued=2)
+        first = service.submit({"name": "a", "id": "A", "text": text})
+        second = service.submit({"name": "b", "id": "B", "text": text})
+        with pytest.raises(HTTPError) as refused:
+            service.submit({"name": "c", "id": "C", "text": text})
+        assert refused.value.status == 503
+        assert service.cancel(first.jobId).state == CANCELLED
+        await service.start(port=0)
+        try:
+            while not second.finished:
+                await second.wait()
+        finally:
+            await service.close()
+        assert [event["event"] for event in first.events] == ["queued", "cancelled"]
+        assert second.events[-1]["event"] == "done"
+        assert service.metrics()["jobs"]["rejected"] == 1
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+from collections import Counter, defaultdict
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.autoprotocol_factory import AutoprotocolFactory
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.mastermix import sheet_reactions
+from src.utils.plate_layout import PLATE_TYPES, choose_plate_type, lab_sheet_reactions, layout_packet
+from src.utils.protocol_optimizer import optimize_protocol
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=47)
+    return ExperimentFactory().run("pl", "P", generator.construction_files(60), generator.inventory(5))
+
+def test_every_reaction_gets_its_own_well(experiment):
+    layout = layout_packet(experiment.labPacket)
+    sheets = experiment.labPacket.labsheets
+    expected = {(index, reaction.product) for index, sheet in enumerate(sheets) for reaction in lab_sheet_reactions(sheet)}
+    assert set(layout.wells) == expected
+    assert all(len(lab_sheet_reactions(sheet)) == sheet_reactions(sheet) for sheet in sheets
+               if sheet.sheetType in (PCR, Digest, Ligate, GoldenGate))
+    assert len(set(layout.wells.values())) == len(expected)
+    for assignment in layout.assignments:
+        plate = layout.plates[assignment.plate]
+        assert assignment.sheet in plate.sheets
+        assert plate.program == sheets[assignment.sheet].program
+
+def test_no_product_is_laid_out_twice(experiment, overlapping_digests):
+    for planned in (experiment, overlapping_digests):
+        layout = layout_packet(planned.labPacket)
+        products = [product for sheet, product in layout.wells]
+        assert len(products) == len(set(products))
+    digests = [index for index, sheet in enumerate(overlapping_digests.labPacket.labsheets) if sheet.sheetType == Digest]
+    assert len({product for sheet, product in layout.wells if sheet in digests}) == 8
+
+def test_sheets_fill_whole_columns(experiment):
+    layout = layout_packet(experiment.labPacket)
+    columns = defaultdict(set)
+    for assignment in layout.assignments:
+        cols = PLATE_TYPES[layout.plates[assignment.plate].plateType][1]
+        columns[(assignment.plate, assignment.well % cols)].add(assignment.sheet)
+    assert all(len(sheets) == 1 for sheets in columns.values())
+
+def test_runs_share_plates(experiment):
+    layout = layout_packet(experiment.labPacket)
+    shared = [plate for plate in layout.plates if len(plate.sheets) > 1]
+    assert shared
+    assert all(any(set(plate.sheets) <= set(run) for run in layout.runs) for plate in shared)
+
+def test_plate_type_choice():
+    assert choose_plate_type(25.0, ("96-pcr", "384-pcr")) == "384-pcr"
+    assert choose_plate_type(50.0, ("96-pcr", "384-pcr")) == "96-pcr"
+    with pytest.raises(ValueError):
+        choose_plate_type(50.0, ("384-pcr",))
+
+def test_local_search_shortens_travel(experiment):
+    greedy = layout_packet(experiment.labPacket, passes=0)
+    improved = layout_packet(experiment.labPacket)
+    assert improved.travel <= greedy.travel
+    assert set(improved.wells) == set(greedy.wells)
+
+def test_factory_thermocycles_once_per_plate(experiment):
+    factory = AutoprotocolFactory(plateTypes=("384-pcr", "96-pcr"))
+    protocol = factory.run(experiment.labPacket, experiment.inventory)
+    ops = Counter(instruction.op for instruction in protocol.instructions)
+    assert ops["thermocycle"] == len(factory.layout.plates) == len(factory.layoutPlates)
+    for index, plate in factory.layoutPlates.items():
+        assert plate.container_type.shortname == factory.layout.plates[index].plateType
+    assert optimize_protocol(protocol).equivalent
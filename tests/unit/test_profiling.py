@@ -0,0 +1,36 @@
+import json
+import pytest
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import ConstructionFile, PCR, Digest, Ligate, Transform, Reagent
+from src.utils import profiling
+
+
+@pytest.fixture
+def cf_list():
+    pcr1 = PCR('PCR', 'pcrpdt', 'ca1067F', 'ca1067R', 'pSB1AK3-b0015', 1000)
+    dig1 = Digest('Digest', 'pcrdig', 'pcrpdt', [Reagent.EcoRI, Reagent.SpeI], 'A', 1000)
+    lig = Ligate('Ligate', 'pSB1A2-Bca9128', ['pcrdig'])
+    trans = Transform('Transform', 'finalpdt', 'pSB1A2-Bca9128', 'Mach1', ['Amp'], 37)
+    return [ConstructionFile(steps=[pcr1, dig1, lig, trans], sequences={})]
+
+def test_profiling_off_by_default(cf_list):
+    assert profiling.active() is None
+    ExperimentFactory().run("prof_off", "P", cf_list, None)
+    assert profiling.disable() is None
+
+def test_profiling_records_stages(cf_list):
+    profiler = profiling.enable(trackMemory=True, cprofile=True)
+    try:
+        ExperimentFactory().run("prof_on", "P", cf_list, None)
+    finally:
+        profiling.disable()
+
+    report = json.loads(profiler.to_json())
+    stages = report["stages"]
+    for name in ("experiment.merge_cfs", "experiment.inventory", "experiment.lab_packet",
+                 "sheet.PCR", "sheet.Digest", "sheet.Ligate", "sheet.Transform"):
+        assert name in stages, f"Missing stage {name}."
+    assert stages["sheet.Zymo"]["calls"] == 2
+    assert stages["experiment.lab_packet"]["total_s"] >= stages["sheet.PCR"]["total_s"]
+    assert stages["experiment.inventory"]["peak_bytes"] is not None
+    assert "cprofile" in report
@@ -0,0 +1,58 @@
+import io
+import json
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.autoprotocol_factory import AutoprotocolFactory
+from src.factories.experiment_factory import ExperimentFactory
+from src.utils.protocol_export import ProtocolWriter, export_protocol, read_protocol, read_protocol_index
+
+
+@pytest.fixture(scope="module")
+def experiments():
+    generator = WorkloadGenerator(seed=44)
+    return [ExperimentFactory().run(f"exp{i}", "X", generator.construction_files(10), generator.inventory(5))
+            for i in range(3)]
+
+@pytest.fixture(scope="module")
+def protocol(experiments):
+    return AutoprotocolFactory().run(experiments[0].labPacket, experiments[0].inventory)
+
+@pytest.mark.parametrize("compact, separators", [(True, (",", ":")), (False, (", ", ": "))])
+def test_matches_as_dict(protocol, compact, separators):
+    buf = io.StringIO()
+    writer = ProtocolWriter(buf, compact=compact)
+    writer.write(protocol)
+    assert buf.getvalue() == json.dumps(protocol.as_dict(), separators=separators)
+    assert writer.written == len(buf.getvalue())
+
+def test_ndjson_chunks(protocol, tmp_path):
+    path = str(tmp_path / "protocol.ndjson")
+    export_protocol(protocol, path, ndjson=True, chunkSize=50)
+    with open(path) as f:
+        lines = f.readlines()
+    assert len(lines) == -(-len(protocol.instructions) // 50) + 1
+    assert all(len(json.loads(line).get("instructions", ())) <= 50 for line in lines)
+    assert read_protocol(path) == json.loads(json.dumps(protocol.as_dict()))
+
+def test_factory_streams_while_generating(experiments, protocol, tmp_path):
+    path = str(tmp_path / "protocol.json")
+    factory = AutoprotocolFactory()
+    written = factory.export_protocol(path, experiments[0].labPacket, experiments[0].inventory)
+    assert written == (tmp_path / "protocol.json").stat().st_size
+    assert not factory.protocol.instructions
+    document = read_protocol(path)
+    expected = json.loads(json.dumps(protocol.as_dict()))
+    assert document["refs"] == expected["refs"]
+    assert len(document["instructions"]) == len(expected["instructions"])
+
+@pytest.mark.parametrize("ndjson", [False, True])
+def test_batch_index(experiments, tmp_path, ndjson):
+    path = str(tmp_path / "batch.ndjson")
+    index = AutoprotocolFactory.export_batch(experiments, path, ndjson=ndjson)
+    assert list(index) == [experiment.name for experiment in experiments]
+    assert read_protocol_index(path) == index
+    last = experiments[-1]
+    expected = AutoprotocolFactory().run(last.labPacket, last.inventory).as_dict()
+    assert read_protocol(path, last.name) == json.loads(json.dumps(expected))
+    with pytest.raises(KeyError):
+        read_protocol(path, "missing")
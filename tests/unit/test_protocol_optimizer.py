@@ -0,0 +1,76 @@
+from autoprotocol.protocol import Protocol
+from autoprotocol.liquid_handle import Transfer
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.autoprotocol_factory import AutoprotocolFactory
+from src.factories.experiment_factory import ExperimentFactory
+from src.utils.protocol_optimizer import optimize_protocol, optimize_instructions, protocol_stats
+from src.utils.simulator import simulate, same_state
+
+NO_MIX = Transfer(mix_after=False)
+GROUP = {"cycles": 1, "steps": [{"temperature": "37:celsius", "duration": "1:minute"}]}
+
+
+def plate_and_tubes(protocol, tubes=2):
+    plate = protocol.ref("plate", cont_type="96-pcr", discard=True)
+    return plate, [protocol.ref(f"tube{i}", cont_type="micro-1.5", discard=True).well(0) for i in range(tubes)]
+
+def test_factory_protocol_keeps_end_state():
+    generator = WorkloadGenerator(seed=41)
+    experiment = ExperimentFactory().run("opt", "O", generator.construction_files(20), generator.inventory(5))
+    factory = AutoprotocolFactory()
+    factory.run(experiment.labPacket, experiment.inventory)
+    report = factory.optimize()
+    assert report.equivalent
+    assert report.after["tips"] < report.before["tips"]
+    assert report.after["instructions"] < report.before["instructions"]
+    assert report.after == protocol_stats(factory.protocol.instructions)
+
+def test_same_source_transfers_share_a_tip():
+    protocol = Protocol()
+    plate, (a, b) = plate_and_tubes(protocol)
+    for i in range(4):
+        protocol.transfer(a, plate.well(i), "2:microliter", method=NO_MIX)
+        protocol.transfer(b, plate.well(i), "1:microliter", method=NO_MIX)
+    report = optimize_protocol(protocol)
+    assert report.equivalent
+    assert (report.before["tips"], report.after["tips"]) == (8, 2)
+
+def test_mixing_transfers_are_not_merged():
+    protocol = Protocol()
+    plate, (a,) = plate_and_tubes(protocol, 1)
+    protocol.transfer(a, plate.wells_from(0, 3).wells, "2:microliter")
+    assert optimize_protocol(protocol).after["tips"] == 3
+
+def test_thermocycle_groups_folded():
+    protocol = Protocol()
+    plate, (a,) = plate_and_tubes(protocol, 1)
+    protocol.transfer(a, plate.well(0), "2:microliter")
+    protocol.thermocycle(plate, [GROUP, GROUP], volume="10:microliter")
+    report = optimize_protocol(protocol)
+    assert report.equivalent
+    thermocycles = [i for i in protocol.instructions if i.op == "thermocycle"]
+    assert [group["cycles"] for group in thermocycles[0].data["groups"]] == [2]
+
+def test_repeated_thermocycle_kept():
+    protocol = Protocol()
+    plate, (a,) = plate_and_tubes(protocol, 1)
+    protocol.transfer(a, plate.well(0), "2:microliter")
+    protocol.thermocycle(plate, [GROUP], volume="10:microliter")
+    protocol.thermocycle(plate, [GROUP], volume="10:microliter")
+    expected = simulate(protocol.instructions)
+    assert len(expected["history"]["plate"]) == 2
+    assert not same_state(expected, simulate(protocol.instructions[:-1]))
+    report = optimize_protocol(protocol)
+    assert report.equivalent
+    assert len([i for i in protocol.instructions if i.op == "thermocycle"]) == 2
+
+def test_reads_stay_after_adds():
+    protocol = Protocol()
+    plate, (a, b) = plate_and_tubes(protocol)
+    protocol.transfer(a, plate.well(0), "5:microliter", method=NO_MIX)
+    protocol.transfer(plate.well(0), b, "5:microliter", method=NO_MIX)
+    protocol.transfer(a, plate.well(1), "5:microliter", method=NO_MIX)
+    expected = simulate(protocol.instructions)
+    optimized = optimize_instructions(protocol.instructions)
+    assert same_state(expected, simulate(optimized))
+    assert not same_state(expected, simulate(list(reversed(protocol.instructions))))
@@ -0,0 +1,66 @@
+import datetime
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.mastermix import mix_reactions
+from src.utils.reagent_ledger import ReagentLedger, sheet_reactions
+
+DAY = datetime.date(2026, 3, 2)
+
+
+@pytest.fixture(scope="module")
+def experiments():
+    generator = WorkloadGenerator(seed=45)
+    return [ExperimentFactory().run(f"led{i}", "L", generator.construction_files(12), generator.inventory(5))
+            for i in range(2)]
+
+def recipe_sheets(experiment):
+    return [sheet for sheet in experiment.labPacket.labsheets if sheet.reaction is not None]
+
+def test_totals_match_recipes(experiments):
+    experiment = experiments[0]
+    ledger = ReagentLedger(deadVolume=2.0, overage=0.5)
+    ledger.add_experiment(experiment, DAY)
+    expected = {}
+    for sheet in recipe_sheets(experiment):
+        count = sheet_reactions(sheet)
+        for reagent, volume in sheet.reaction.reaction:
+            if reagent not in ABSTRACT_REAGENTS and count:
+                expected[reagent] = expected.get(reagent, 0.0) + volume * count * 1.5 + 2.0
+        # a premixed stock is used as made up, with the mastermix's own overage
+        for reagent, volume in sheet.reaction.mastermix or ():
+            expected[reagent] = expected.get(reagent, 0.0) + volume + 2.0
+    assert ledger.totals() == pytest.approx(expected)
+    assert ledger.totals(Reagent.ddH2O) == {Reagent.ddH2O: pytest.approx(expected[Reagent.ddH2O])}
+
+def test_split_sheets_count_each_step_once(experiments):
+    for experiment in experiments:
+        digests = [sheet for sheet in experiment.labPacket.labsheets if sheet.sheetType == Digest]
+        steps = {step.output for sheet in digests for step in sheet.steps}
+        assert sum(sheet_reactions(sheet) for sheet in digests) == len(steps)
+
+def test_queries(experiments):
+    ledger = ReagentLedger()
+    ledger.add_experiment(experiments[0], DAY)
+    ledger.add_experiments([experiments[1], None], DAY + datetime.timedelta(days=1))
+    first = ledger.totals(experiment=experiments[0].name)
+    second = ledger.totals(experiment=experiments[1].name)
+    assert ledger.by_experiment() == {experiments[0].name: first, experiments[1].name: second}
+    assert list(ledger.by_date()) == [DAY, DAY + datetime.timedelta(days=1)]
+    assert ledger.totals(since=DAY + datetime.timedelta(days=1)) == second
+    assert ledger.totals(until=DAY) == first
+    everything = ledger.totals()
+    assert everything == pytest.approx({reagent: first.get(reagent, 0) + second.get(reagent, 0) for reagent in everything})
+
+    stocks = dict(everything)
+    stocks[Reagent.PrimeSTAR_GXL_DNA_Polymerase] -= 3.0
+    assert ledger.shortfalls(stocks) == {Reagent.PrimeSTAR_GXL_DNA_Polymerase: pytest.approx(3.0)}
+
+def test_overlapping_digests_use_each_enzyme_once(overlapping_digests):
+    ledger = ReagentLedger(deadVolume=0.0, overage=0.0)
+    ledger.add_experiment(overlapping_digests, DAY)
+    # 2 EcoRI-only digests and 6 EcoRI + SpeI digests, each premixed with 1uL of each enzyme
+    totals = ledger.totals()
+    assert totals[Reagent.EcoRI] == pytest.approx(mix_reactions(2) + mix_reactions(6))
+    assert totals[Reagent.SpeI] == pytest.approx(mix_reactions(6))
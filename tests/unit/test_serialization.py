@@ -0,0 +1,45 @@
+import json
+import pytest
+from benchmarks.workloads import WorkloadGenerator
+from src.factories.experiment_factory import ExperimentFactory
+from src.models import *
+from src.utils.serialization import *
+
+
+@pytest.fixture(scope="module")
+def experiment():
+    generator = WorkloadGenerator(seed=21)
+    return ExperimentFactory().run("ser", "S", generator.construction_files(30), generator.inventory(5))
+
+def test_compiled_serialize_is_byte_identical(experiment):
+    assert json.dumps(serialize(experiment), indent=4) == json.dumps(serialize_reflective(experiment), indent=4)
+    for sheet in experiment.labPacket.labsheets:
+        assert json.dumps(serialize(sheet)) == json.dumps(serialize_reflective(sheet))
+
+def test_round_trip_experiment(experiment):
+    data = json.loads(json.dumps(serialize(experiment)))
+    restored = deserialize(data, Experiment)
+
+    assert restored == experiment
+    pcrSheet = restored.labPacket.labsheets[0]
+    assert pcrSheet.sheetType is PCR
+    assert isinstance(pcrSheet.sources[0][0], Location)
+    assert isinstance(pcrSheet.sources[0][2], Concentration)
+
+def test_round_trip_steps():
+    steps = [
+        PCR('PCR', 'p', 'f', 'r', 't', 100),
+        Digest('Digest', 'd', 'p', [Reagent.EcoRI, Reagent.SpeI], 'A', None),
+        GoldenGate('Golden Gate', 'gg', ['a', 'b'], Reagent.BsaI),
+        Transform('Transform', 'x', 'gg', 'Mach1', ['Amp'], 37),
+    ]
+    cf = ConstructionFile(steps, {'t': Polynucleotide('acgt', is_circular=True)})
+    assert deserialize(json.loads(json.dumps(serialize(cf))), ConstructionFile) == cf
+
+@pytest.mark.parametrize("location", [
+    Location("expBox0", 3, 7, "10uM-ca1067F", "10uM-ca1067F"),
+    Location("exp(1)Box2", 0, 0, "ca1067F", None),
+    Location("expBox0", 8, 8, "label", "side:label"),
+])
+def test_location_string_round_trip(location):
+    assert string_to_location(location_to_string(location)) == location
@@ -0,0 +1,53 @@
+from autoprotocol.protocol import Protocol
+from autoprotocol.liquid_handle import Transfer
+from src.utils.simulator import Simulator, estimate_runtime, score_protocol, simulate, DEFAULT_COSTS
+
+NO_PRIME = Transfer(prime=False, mix_after=False)
+PROGRAM = [{"cycles": 10, "steps": [{"temperature": "95:celsius", "duration": "10:second"},
+                                    {"temperature": "55:celsius", "duration": "20:second"}]}]
+
+
+def setup():
+    protocol = Protocol()
+    plate = protocol.ref("plate", cont_type="96-pcr", discard=True)
+    tube = protocol.ref("tube", cont_type="micro-1.5", discard=True)
+    return protocol, plate, tube.well(0)
+
+def test_volumes_and_composition():
+    protocol, plate, tube = setup()
+    protocol.provision("water", plate.well(0), "30:microliter")
+    protocol.transfer(tube, plate.well(0), "10:microliter", method=NO_PRIME)
+    protocol.transfer(plate.well(0), plate.well(1), "20:microliter", method=NO_PRIME)
+    state = simulate(protocol.instructions)
+    assert state["wells"][("plate", 1)] == {("resource", "water"): 15.0, ("well", "tube", 0): 5.0}
+    assert state["wells"][("plate", 0)] == {("resource", "water"): 15.0, ("well", "tube", 0): 5.0}
+
+    volumes = Simulator(composition=False).run(protocol.instructions)
+    assert volumes.volumes[("plate", 0)] == 20.0
+    assert not volumes.issues
+    assert ("tube", 0) in volumes.stocks
+
+def test_overflow_and_underflow():
+    protocol, plate, tube = setup()
+    protocol.provision("water", plate.well(0), "150:microliter")
+    protocol.transfer(tube, plate.well(0), "20:microliter", method=NO_PRIME)
+    protocol.transfer(plate.well(1), plate.well(2), "5:microliter", method=NO_PRIME)
+    issues = Simulator(unknownStocks=False).run(protocol.instructions).issues
+    assert [(issue.kind, issue.well, issue.instruction) for issue in issues] == [
+        ("underflow", ("tube", 0), 1), ("overflow", ("plate", 0), 1), ("underflow", ("plate", 1), 2)]
+
+    score = score_protocol(protocol.instructions, initialVolumes={("tube", 0): 100.0, ("plate", 1): 10.0})
+    assert [issue.kind for issue in score["issues"]] == ["overflow"]
+    assert not score["feasible"]
+
+def test_runtime():
+    protocol, plate, tube = setup()
+    protocol.thermocycle(plate, PROGRAM, volume="20:microliter")
+    protocol.incubate(plate, "warm_37", "1:hour")
+    runtime = estimate_runtime(protocol.instructions)
+    costs = DEFAULT_COSTS
+    assert runtime["thermocycle"] == costs["thermocycle"] + 10 * 30 + 20 * costs["thermocycle_step"]
+    assert runtime["incubate"] == costs["incubate"] + 3600
+    assert runtime["deck_load"] == costs["deck_load"]
+    assert runtime["total_s"] == sum(value for key, value in runtime.items() if key != "total_s")
+    assert estimate_runtime(protocol.instructions, {"seal": 0})["seal"] == 0
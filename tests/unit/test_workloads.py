@@ -0,0 +1,29 @@
+from benchmarks.workloads import WorkloadGenerator
+from benchmarks.run_benchmarks import compare
+from src.factories.experiment_factory import ExperimentFactory
+
+
+def test_workload_is_seeded():
+    first = WorkloadGenerator(seed=7).construction_files(20)
+    second = WorkloadGenerator(seed=7).construction_files(20)
+    assert first == second
+    assert WorkloadGenerator(seed=8).construction_files(20) != first
+
+def test_workload_plans_past_one_box():
+    generator = WorkloadGenerator(seed=3)
+    oldInventory = generator.inventory(10)
+    cfs = generator.construction_files(40)
+
+    experiment = ExperimentFactory().run("wl", "W", cfs, oldInventory)
+
+    newBoxes = [box for box in experiment.inventory.boxes if box.name.startswith("wl")]
+    assert len(newBoxes) > 1, "Workload should need more than one box."
+    operations = {step.operation for cf in cfs for step in cf.steps}
+    assert operations == {"PCR", "Digest", "Ligate", "Golden Gate", "Gibson", "Transform"}
+    assert experiment.labPacket.labsheets
+
+def test_compare_flags_regressions():
+    baseline = {"benchmarks": {"a": {"best_s": 1.0}, "b": {"best_s": 1.0}}}
+    results = {"benchmarks": {"a": {"best_s": 1.2}, "b": {"best_s": 2.0}, "c": {"best_s": 1.0}}}
+    rows = {name: bad for name, _, _, _, bad in compare(results, baseline, 1.5)}
+    assert rows == {"a": False, "b": True}